@@ -0,0 +1,428 @@
+"""Offline export benchmark: the real export pipeline against a fake Telegram backend.
+
+Synthetic chats are generated on the fly (nothing is held in memory), and the fake
+client simulates request latency, a shared download link and injected FloodWaitErrors.
+The run reports throughput, peak memory and files written; the export's own
+instrumentation report (.reports/) is kept next to the exported files.
+
+    python benchmark.py                          # preset "small"
+    python benchmark.py --preset large           # 1 chat, 1,000,000 messages, ~10,000 photos
+    python benchmark.py --messages 50000 --latency 0.05 --flood-every 200 --types text,jsonl,photos
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import (
+    InputPeerChannel, MessageMediaPhoto, MessageMediaDocument, Photo, PhotoSize, Document,
+    DocumentAttributeAudio, DocumentAttributeVideo, DocumentAttributeFilename
+)
+from tg_logic import TelegramExporterClient, CHAT_CONCURRENCY
+from ratelimit import RequestScheduler
+from history import HISTORY_PAGE_SIZE
+from cli import TYPE_OPTIONS, _types, add_download_arguments, download_options
+from progress import format_bytes
+
+# Scenario defaults; command-line options override single values
+PRESETS = {
+    'small': {'chats': 3, 'messages': 20000, 'senders': 50, 'photo_ratio': 0.02, 'voice_ratio': 0.01,
+              'video_ratio': 0.002, 'file_ratio': 0.002},
+    'large': {'chats': 1, 'messages': 1000000, 'senders': 500, 'photo_ratio': 0.01, 'voice_ratio': 0.0,
+              'video_ratio': 0.0, 'file_ratio': 0.0},
+}
+MEDIA_KINDS = ('photo', 'voice', 'video', 'file')
+# Server-side filters (by class name) -> media kinds they return
+FILTER_KINDS = {
+    'InputMessagesFilterPhotos': ('photo',),
+    'InputMessagesFilterVoice': ('voice',),
+    'InputMessagesFilterVideo': ('video',),
+    'InputMessagesFilterGif': (),
+    'InputMessagesFilterRoundVideo': (),
+    'InputMessagesFilterDocument': ('voice', 'video', 'file'),
+    'InputMessagesFilterMusic': (),
+}
+FIRST_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+WRITE_CHUNK = 1024 * 1024
+
+
+def _fraction(*values):
+    """Deterministic pseudo-random number in [0, 1) for the given integers (no RNG state)."""
+    h = 0
+    for value in values:
+        # splitmix64 step
+        h = (h + value * 0x9E3779B97F4A7C15 + 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+    return h / 2 ** 64
+
+
+class Scenario:
+    def __init__(self, chats, messages, senders, photo_ratio, voice_ratio, video_ratio, file_ratio,
+                 photo_size=150 * 1024, voice_size=30 * 1024, video_size=5 * 1024 * 1024,
+                 file_size=1024 * 1024, latency=0.0, bandwidth=0.0, flood_every=0, flood_seconds=1):
+        self.chats = chats
+        self.messages = messages
+        self.senders = max(1, senders)
+        self.ratios = {'photo': photo_ratio, 'voice': voice_ratio, 'video': video_ratio, 'file': file_ratio}
+        self.sizes = {'photo': photo_size, 'voice': voice_size, 'video': video_size, 'file': file_size}
+        self.latency = latency
+        # Shared download link in bytes per second (0 = unlimited)
+        self.bandwidth = bandwidth
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+
+    def kind(self, chat_id, message_id):
+        """Media kind of a message (None = text only)."""
+        x = _fraction(chat_id, message_id)
+        for kind in MEDIA_KINDS:
+            if x < self.ratios[kind]:
+                return kind
+            x -= self.ratios[kind]
+        return None
+
+    def size(self, kind, chat_id, message_id):
+        # Sizes spread between 50% and 150% of the configured mean
+        return max(1, int(self.sizes[kind] * (0.5 + _fraction(message_id, chat_id, 7))))
+
+    def sender_id(self, chat_id, message_id):
+        return 1000 + int(_fraction(chat_id, message_id, 3) * self.senders)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.first_name = f"Nadawca {user_id}"
+
+
+class FakeMessage:
+    """The subset of Telethon's Message read by the export."""
+
+    __slots__ = ('id', 'date', 'sender_id', 'sender', 'text', 'media')
+    edit_date = reply_to_msg_id = fwd_from = via_bot_id = post_author = grouped_id = None
+    pinned = views = forwards = reactions = client = None
+
+    def __init__(self, message_id, date, sender, text, media):
+        self.id = message_id
+        self.date = date
+        self.sender_id = sender.id
+        self.sender = sender
+        self.text = text
+        self.media = media
+
+
+class FakeList(list):
+    """get_messages() result: a list with the server-side `total`."""
+    total = 0
+
+
+class FakeTelegramClient:
+    """Stand-in for TelegramClient: generated history, simulated latency, bandwidth and FloodWait.
+
+    Every chat is a supergroup with message ids 1..scenario.messages. Content is a pure
+    function of (chat, id), so runs are reproducible and resumed exports see the same data.
+    """
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.requests = 0
+        self.floods = 0
+        self.bytes_served = 0
+        self._users = {}
+        self._link_free_at = 0.0
+
+    def dialogs(self):
+        return [{
+            'id': -1000000000000 - chat_id,
+            'title': f"Czat testowy {chat_id}",
+            'is_group': True,
+            'is_channel': True,
+            'peer': InputPeerChannel(channel_id=chat_id, access_hash=0),
+            'last_message_id': self.scenario.messages,
+            'date': 0,
+            'size': self.scenario.senders,
+        } for chat_id in range(1, self.scenario.chats + 1)]
+
+    def is_connected(self):
+        return True
+
+    async def _request(self):
+        """One API round trip: latency, and every `flood_every`-th request a FloodWaitError."""
+        self.requests += 1
+        scenario = self.scenario
+        if scenario.flood_every and self.requests % scenario.flood_every == 0:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=scenario.flood_seconds)
+        await asyncio.sleep(scenario.latency)
+
+    async def _transfer(self, size):
+        """Waits for `size` bytes to pass through the shared link."""
+        self.bytes_served += size
+        if not self.scenario.bandwidth:
+            return
+        loop = asyncio.get_event_loop()
+        start = max(loop.time(), self._link_free_at)
+        self._link_free_at = start + size / self.scenario.bandwidth
+        await asyncio.sleep(self._link_free_at - loop.time())
+
+    def _user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = FakeUser(user_id)
+        return user
+
+    def _media(self, kind, chat_id, message_id):
+        media_id = chat_id * 10 ** 10 + message_id
+        size = self.scenario.size(kind, chat_id, message_id)
+        if kind == 'photo':
+            photo = Photo(id=media_id, access_hash=0, file_reference=b'', date=FIRST_DATE, dc_id=2,
+                          sizes=[PhotoSize(type='y', w=1280, h=960, size=size)])
+            return MessageMediaPhoto(photo=photo)
+        if kind == 'voice':
+            attributes, mime_type = [DocumentAttributeAudio(duration=10, voice=True)], 'audio/ogg'
+        elif kind == 'video':
+            attributes, mime_type = [DocumentAttributeVideo(duration=30, w=1280, h=720, round_message=False)], 'video/mp4'
+        else:
+            attributes = [DocumentAttributeFilename(file_name=f"plik_{chat_id}_{message_id}.bin")]
+            mime_type = 'application/octet-stream'
+        document = Document(id=media_id, access_hash=0, file_reference=b'', date=FIRST_DATE,
+                            mime_type=mime_type, size=size, dc_id=2, attributes=attributes)
+        return MessageMediaDocument(document=document)
+
+    def _message(self, chat_id, message_id):
+        kind = self.scenario.kind(chat_id, message_id)
+        sender = self._user(self.scenario.sender_id(chat_id, message_id))
+        text = '' if kind else f"Wiadomość {message_id} w czacie {chat_id}"
+        media = self._media(kind, chat_id, message_id) if kind else None
+        return FakeMessage(message_id, FIRST_DATE + timedelta(seconds=60 * message_id), sender, text, media)
+
+    def _ids(self, chat_id, from_user, message_filter, min_id=0, max_id=0, reverse=False):
+        kinds = FILTER_KINDS.get(type(message_filter).__name__) if message_filter is not None else None
+        ids = range(min_id + 1, min(max_id or self.scenario.messages + 1, self.scenario.messages + 1))
+        for message_id in ids if reverse else reversed(ids):
+            if kinds is not None and self.scenario.kind(chat_id, message_id) not in kinds:
+                continue
+            if from_user is not None and self.scenario.sender_id(chat_id, message_id) != from_user:
+                continue
+            yield message_id
+
+    async def iter_messages(self, entity, limit=None, reverse=False, min_id=0, max_id=0, from_user=None,
+                            filter=None, **kwargs):
+        chat_id = entity.channel_id
+        returned = 0
+        for message_id in self._ids(chat_id, from_user, filter, min_id=min_id, max_id=max_id, reverse=reverse):
+            if limit is not None and returned >= limit:
+                return
+            if returned % HISTORY_PAGE_SIZE == 0:
+                await self._request()
+            returned += 1
+            yield self._message(chat_id, message_id)
+
+    async def get_messages(self, entity, limit=None, from_user=None, filter=None, ids=None, **kwargs):
+        await self._request()
+        if ids is not None:
+            return [self._message(entity.channel_id, i) if 0 < i <= self.scenario.messages else None
+                    for i in ids]
+        ids = self._ids(entity.channel_id, from_user, filter)
+        if limit:
+            result = FakeList(self._message(entity.channel_id, i) for _, i in zip(range(limit), ids))
+        else:
+            result = FakeList()
+        result.total = sum(1 for _ in self._ids(entity.channel_id, from_user, filter))
+        return result
+
+    async def get_entity(self, ids):
+        await self._request()
+        if isinstance(ids, list):
+            return [self._user(i) for i in ids]
+        return self._user(ids)
+
+    async def download_media(self, message, file=None, progress_callback=None):
+        await self._request()
+        size = self._media_size(message.media)
+        zeros = bytes(min(size, WRITE_CHUNK))
+        # Like Telethon: a path or a writable file-like object
+        f = open(file, 'wb') if isinstance(file, str) else file
+        written = 0
+        try:
+            while written < size:
+                chunk = zeros[:size - written]
+                await self._transfer(len(chunk))
+                f.write(chunk)
+                written += len(chunk)
+                if progress_callback:
+                    result = progress_callback(written, size)
+                    if inspect.isawaitable(result):
+                        await result
+        finally:
+            if f is not file:
+                f.close()
+        return file
+
+    async def iter_download(self, document, offset=0, limit=None, chunk_size=None, request_size=None,
+                            file_size=None, **kwargs):
+        for _ in range(limit or 1):
+            if offset >= document.size:
+                return
+            await self._request()
+            size = min(chunk_size, document.size - offset)
+            await self._transfer(size)
+            offset += size
+            yield bytes(size)
+
+    @staticmethod
+    def _media_size(media):
+        if isinstance(media, MessageMediaPhoto):
+            return media.photo.sizes[-1].size
+        return media.document.size
+
+
+def _files_written(export_dir):
+    files = 0
+    size = 0
+    for root, _dirs, names in os.walk(export_dir):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def _peak_rss():
+    """Peak resident memory of the process in bytes (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark eksportu bez sieci (symulowany serwer Telegrama).")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--chats', type=int)
+    parser.add_argument('--messages', type=int, help="wiadomości w każdym czacie")
+    parser.add_argument('--senders', type=int, help="liczba różnych nadawców w czacie")
+    for kind in MEDIA_KINDS:
+        parser.add_argument(f'--{kind}-ratio', type=float, metavar='UDZIAŁ', help=f"udział wiadomości z mediami typu {kind}")
+        parser.add_argument(f'--{kind}-size', type=int, metavar='BAJTY', help="średni rozmiar pliku")
+    parser.add_argument('--latency', type=float, default=0.0, metavar='S', help="opóźnienie każdego zapytania")
+    parser.add_argument('--bandwidth', type=float, default=0.0, metavar='MB/S', help="przepustowość łącza (0 = bez limitu)")
+    parser.add_argument('--flood-every', type=int, default=0, metavar='N', help="FloodWaitError co N zapytań")
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--types', type=_types, default=['text', 'jsonl', 'photos'],
+                        help=f"typy danych: {', '.join(TYPE_OPTIONS)} (domyślnie text,jsonl,photos)")
+    parser.add_argument('--parallel-chats', type=int, default=CHAT_CONCURRENCY, metavar='N')
+    parser.add_argument('--history-shards', type=int, default=1, metavar='N')
+    parser.add_argument('--media-archive', action='store_true', help="media w archiwach ZIP czatu")
+    add_download_arguments(parser)
+    parser.add_argument('--output', metavar='KATALOG', help="katalog eksportu (domyślnie tymczasowy, usuwany)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="szczytowa pamięć sterty Pythona przez tracemalloc (wolniej)")
+    parser.add_argument('--profile', action='store_true', help="profil cProfile w katalogu raportów")
+    parser.add_argument('--json', metavar='PLIK', help="zapisz wyniki jako JSON")
+    return parser.parse_args(argv)
+
+
+def scenario_from_args(args):
+    values = dict(PRESETS[args.preset])
+    for key in ('chats', 'messages', 'senders'):
+        if getattr(args, key) is not None:
+            values[key] = getattr(args, key)
+    for kind in MEDIA_KINDS:
+        if getattr(args, f'{kind}_ratio') is not None:
+            values[f'{kind}_ratio'] = getattr(args, f'{kind}_ratio')
+        if getattr(args, f'{kind}_size') is not None:
+            values[f'{kind}_size'] = getattr(args, f'{kind}_size')
+    return Scenario(latency=args.latency, bandwidth=args.bandwidth * 1024 * 1024,
+                    flood_every=args.flood_every, flood_seconds=args.flood_seconds, **values)
+
+
+def run_benchmark(scenario, options, export_dir, trace_memory=False):
+    """Runs one export against the fake backend and returns the measurements."""
+    backend = FakeTelegramClient(scenario)
+    exporter = TelegramExporterClient()
+    exporter.client = backend
+    exporter.scheduler = RequestScheduler()
+    exporter.export_dir = export_dir
+    dialogs = backend.dialogs()
+    exporter._set_dialogs(dialogs)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    instrumentation = asyncio.run(exporter._export_process([d['id'] for d in dialogs], options, None))
+    elapsed = time.perf_counter() - start
+    peak_heap = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    stats = instrumentation.counters
+    files, size = _files_written(export_dir)
+    messages = stats.get('messages', 0)
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'messages': messages,
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed else 0,
+        'media_files': stats.get('files_downloaded', 0),
+        'media_bytes': stats.get('bytes_downloaded', 0),
+        'media_bytes_per_sec': round(stats.get('bytes_downloaded', 0) / elapsed) if elapsed else 0,
+        'requests': backend.requests,
+        'flood_waits': backend.floods,
+        'files_written': files,
+        'bytes_written': size,
+        'peak_rss': _peak_rss(),
+        'peak_heap': peak_heap,
+        # The export's own stage timings (the report file is deleted with a temporary directory)
+        'stages': instrumentation.report()['stages'],
+    }
+
+
+def print_results(results):
+    print(f"Czas: {results['elapsed_s']:.1f} s")
+    print(f"Wiadomości: {results['messages']} ({results['messages_per_sec']:.0f}/s)")
+    print(f"Media: {results['media_files']} plików, {format_bytes(results['media_bytes'])} "
+          f"({format_bytes(results['media_bytes_per_sec'])}/s)")
+    print(f"Zapytania: {results['requests']}, FloodWait: {results['flood_waits']}")
+    print(f"Zapisane pliki: {results['files_written']} ({format_bytes(results['bytes_written'])})")
+    if results['peak_rss'] is not None:
+        print(f"Szczytowa pamięć procesu: {format_bytes(results['peak_rss'])}")
+    if results['peak_heap'] is not None:
+        print(f"Szczytowa pamięć sterty Pythona: {format_bytes(results['peak_heap'])}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenario = scenario_from_args(args)
+    options = {key: True for key in args.types}
+    options['parallel_chats'] = args.parallel_chats
+    options['history_shards'] = args.history_shards
+    options['media_archive'] = args.media_archive
+    options.update(download_options(args))
+    options['profile'] = args.profile
+    export_dir = os.path.abspath(args.output) if args.output else tempfile.mkdtemp(prefix='tgexport-bench-')
+    try:
+        results = run_benchmark(scenario, options, export_dir, trace_memory=args.trace_memory)
+    finally:
+        if not args.output:
+            shutil.rmtree(export_dir, ignore_errors=True)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'preset': args.preset, 'options': options, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+import asyncio
+import os
+from collections import Counter
+
+from downloads import MediaDownloader
+from senders import SENDER_BATCH
+from history import sharded_history
+from media_store import media_file_name, media_size, reserve_name
+from media_kinds import classify, export_subdir
+from progress import ChatProgress
+from writers import TextHistoryWriter, JsonLinesWriter, MessageIdIndex, message_record
+from sqlite_archive import SqliteArchiveWriter
+from html_writer import HtmlWriter
+from media_archive import MediaArchive, archive_volume
+from checkpoint import ChatCheckpoint, export_signature, COMMIT_EVERY, CHECKPOINT_FILE
+from download_policy import DOWNLOAD
+
+# Ile wiadomości pobierać jednym zapytaniem w drugim przejściu (odłożone media)
+DEFERRED_BATCH = 100
+
+
+def safe_title(dialog):
+    """Nazwa czatu bezpieczna w nazwach plików (tylko litery, cyfry i spacje)."""
+    return "".join([c for c in dialog['title'] if c.isalpha() or c.isdigit() or c == ' ']).strip()
+
+
+def chat_dir_name(dialog):
+    """Nazwa katalogu czatu: nazwa i id, bo nazwy czatów nie są unikalne (a mogą być puste po oczyszczeniu)."""
+    return f"{safe_title(dialog) or 'czat'} ({dialog['id']})"
+
+
+def migrate_chat_dirs(export_dir, dialogs):
+    """Przemianowuje katalogi z wcześniejszych wersji (sama nazwa czatu) na `chat_dir_name`.
+
+    Przejmowany jest tylko katalog, którego nazwa pasuje do dokładnie
+    jednego czatu - przy powtarzających się nazwach nie da się ustalić,
+    do którego czatu należy, więc zostaje nietknięty.
+    """
+    titles = Counter(safe_title(d) for d in dialogs)
+    for dialog in dialogs:
+        title = safe_title(dialog)
+        legacy = os.path.join(export_dir, title)
+        target = os.path.join(export_dir, chat_dir_name(dialog))
+        if not title or not os.path.isfile(os.path.join(legacy, CHECKPOINT_FILE)) or os.path.exists(target):
+            continue
+        if titles[title] > 1:
+            print(f"Katalog {legacy} pasuje do kilku czatów o tej nazwie - pomijam przeniesienie")
+            continue
+        try:
+            os.rename(legacy, target)
+        except OSError as e:
+            print(f"Nie udało się przenieść katalogu {legacy}: {e}")
+
+
+def _load_checkpoint(ctx, dialog):
+    chat_dir = os.path.join(ctx.export_dir, chat_dir_name(dialog))
+    checkpoint = ChatCheckpoint(chat_dir, export_signature(ctx.options, ctx.filter_user_id), dialog['id'])
+    return checkpoint if checkpoint.load() else None
+
+
+def committed_count(ctx, dialog):
+    """Liczba wiadomości czatu wyeksportowanych do zatwierdzonego punktu kontrolnego."""
+    checkpoint = _load_checkpoint(ctx, dialog)
+    return checkpoint.count if checkpoint else 0
+
+
+def deferred_count(ctx, dialog):
+    """Liczba mediów czatu odłożonych do drugiego przejścia."""
+    checkpoint = _load_checkpoint(ctx, dialog)
+    return len(checkpoint.deferred) if checkpoint else 0
+
+
+class ChatExport:
+    """Eksport jednego czatu: formaty zapisu, punkt kontrolny i pobieranie mediów.
+
+    Ten sam obiekt obsługuje przejście po historii (`history()` + `add()`)
+    i tryb lustra, który dopisuje wiadomości przychodzące na żywo oraz
+    przekazuje do formatów zapisu edycje i usunięcia. Operacje na czacie
+    z różnych źródeł serializuje `lock`.
+    """
+
+    def __init__(self, ctx, dialog, progress=None):
+        self.ctx = ctx
+        self.dialog = dialog
+        self.options = ctx.options
+        self.filter_user_id = ctx.filter_user_id
+        self.title = safe_title(dialog)
+        self.chat_dir = os.path.join(ctx.export_dir, chat_dir_name(dialog))
+        self.lock = asyncio.Lock()
+        self.writers = []
+        self.ids = None
+        self.checkpoint = None
+        self.downloader = None
+        self.archive = None
+        # Nazwy plików mediów zajęte w katalogu czatu (ustalane przy kolejkowaniu)
+        self.media_names = set()
+        # Nieudane pobrania do bieżącego tomu archiwum: (id wiadomości, nazwa w archiwum)
+        self.failed = []
+        self.pending = []
+        self.last_id = 0
+        self.count = 0
+        self.exported = 0
+        self.progress = progress or ChatProgress(-1, self.title)
+
+    def open(self):
+        """Otwiera formaty zapisu od punktu kontrolnego i uruchamia pobieranie mediów."""
+        os.makedirs(self.chat_dir, exist_ok=True)
+
+        # Formaty zapisu wiadomości
+        if self.options.get('text'):
+            self.writers.append(TextHistoryWriter(self.chat_dir))
+        if self.options.get('jsonl'):
+            self.writers.append(JsonLinesWriter(self.chat_dir, self.options.get('jsonl_compression')))
+        if self.options.get('sqlite'):
+            self.writers.append(SqliteArchiveWriter(self.ctx.sqlite_archive, self.dialog))
+        if self.options.get('html'):
+            self.writers.append(HtmlWriter(self.chat_dir, self.dialog['title']))
+        if self.writers:
+            # Które wiadomości są w eksporcie - do rozpoznania usunięć bez id czatu
+            self.ids = MessageIdIndex(self.chat_dir)
+            self.writers.append(self.ids)
+
+        # Punkt kontrolny: wznowienie lub eksport przyrostowy
+        self.checkpoint = ChatCheckpoint(self.chat_dir, export_signature(self.options, self.filter_user_id),
+                                         self.dialog['id'])
+        resumed = self.checkpoint.load()
+        if resumed and not all(w.can_resume(self.checkpoint.positions.get(w.name)) for w in self.writers):
+            self.checkpoint.reset()
+            resumed = False
+
+        # Przy wznowieniu pliki są obcinane do zatwierdzonej pozycji i dopisywane
+        for writer in self.writers:
+            writer.open(self.checkpoint.positions.get(writer.name) if resumed else None)
+
+        self.media_names = {path for path in list(self.checkpoint.media.values()) + list(self.checkpoint.deferred.values())
+                            if not archive_volume(path)}
+
+        # Media w archiwach ZIP czatu zamiast luźnych plików (bez wspólnego magazynu)
+        if self.options.get('media_archive'):
+            self.archive = MediaArchive(self.chat_dir)
+            self.archive.open()
+            # Odłożone media leżą obok tomów pod tymi samymi ścieżkami - nazwy nie mogą się powtórzyć
+            self.archive.names.update(path.replace(os.sep, '/') for path in self.media_names)
+
+        ctx = self.ctx
+        self.downloader = MediaDownloader(workers=ctx.download_workers, policy=ctx.downloads,
+                                          on_downloaded=self._on_downloaded, on_failed=self._on_failed,
+                                          scheduler=ctx.scheduler, client=ctx.client,
+                                          store=ctx.media_store if self.archive is None else None,
+                                          stats=ctx.stats, archive=self.archive)
+        self.downloader.start()
+        self.last_id = self.checkpoint.last_id
+        self.exported = self.checkpoint.count
+        self.progress.baseline = self.checkpoint.count
+        self.progress.started = True
+
+    def _on_downloaded(self, message, path):
+        self.checkpoint.add_media(message.id, path)
+        self.progress.bytes += media_size(message.media)
+
+    def _on_failed(self, message, path):
+        rel_path = os.path.relpath(path, self.chat_dir)
+        if self.archive is not None and message.id not in self.checkpoint.deferred:
+            # Zapis wiadomości wskazuje bieżący tom - ponowienie przed jego zamknięciem (_retry_failed)
+            self.failed.append((message.id, rel_path.replace(os.sep, '/')))
+            return
+        # Nieudane pobranie trafia do odłożonych - ponowi je drugie przejście albo kolejny eksport
+        self.checkpoint.defer_media(message.id, rel_path)
+
+    def history(self):
+        """Wiadomości po punkcie kontrolnym, od najstarszych (dopisywane na końcu plików)."""
+        history = sharded_history(self.ctx.scheduler, self.ctx.client, self.dialog['peer'], self.options,
+                                  from_user=self.filter_user_id, min_id=self.last_id,
+                                  shards=self.options.get('history_shards', 1))
+        # Czas oczekiwania na kolejne wiadomości (strony iter_messages)
+        return self.ctx.stats.timed_iter('history_wait', history)
+
+    async def add(self, message):
+        """Eksportuje wiadomość nowszą niż wszystkie dotychczasowe."""
+        # FILTR UCZESTNIKA (serwer filtruje przez from_user, to tylko zabezpieczenie)
+        if self.filter_user_id is not None and message.sender_id != self.filter_user_id:
+            return
+
+        # 1. Multimedia (ścieżka znana od razu, pobieranie w tle)
+        media_path = None
+        if message.media:
+            if self.checkpoint.has_media(message.id):
+                media_path = self.checkpoint.media[message.id]
+            else:
+                info = classify(message.media)
+                subdir = export_subdir(self.options, info)
+                if subdir:
+                    media_path = await self._queue_media(message, info, os.path.join(subdir, media_file_name(message, info)))
+
+        # 2. Zapis wiadomości (nadawcy rozwiązywani paczkami)
+        if self.writers:
+            self.ctx.senders.seed(message)
+            self.pending.append((message, media_path))
+            if len(self.pending) >= SENDER_BATCH:
+                await self._write_batch()
+
+        self.last_id = message.id
+        self.count += 1
+        self.exported += 1
+        self.progress.processed += 1
+        self.ctx.stats.count('messages')
+        if self.count % COMMIT_EVERY == 0:
+            await self.commit()
+
+    async def _queue_media(self, message, info, media_path, deferred_pass=False):
+        """Kolejkuje pobranie albo odkłada je do drugiego przejścia (zgodnie z DownloadPolicy).
+
+        Zwraca ścieżkę, pod którą plik się znajdzie (do zapisu wiadomości),
+        z nazwą zmienioną przy kolizji. W trybie archiwum pobierane od razu
+        media trafiają do bieżącego tomu (ścieżka z nazwą tomu), a odłożone -
+        jako zwykłe pliki pod ścieżką zapisaną w wiadomości, bo tom z czasu
+        pierwszego przejścia będzie już zamknięty.
+        """
+        media_path = self._reserve_media_path(message, media_path)
+        if self.ctx.downloads.admit(info, deferred_pass) != DOWNLOAD:
+            self.checkpoint.defer_media(message.id, media_path)
+            return media_path
+        self.progress.expected_bytes += info.size
+        media_dir = os.path.join(self.chat_dir, os.path.dirname(media_path))
+        if self.archive is not None and not deferred_pass:
+            await self.downloader.put(message, media_dir, os.path.basename(media_path), info)
+            return self.archive.archive_path(media_path)
+        os.makedirs(media_dir, exist_ok=True)
+        await self.downloader.put(message, media_dir, os.path.basename(media_path), info, loose=True)
+        return media_path
+
+    def _reserve_media_path(self, message, media_path):
+        """Ostateczna ścieżka pliku w katalogu czatu: zapamiętana dla tej wiadomości albo wolna nazwa."""
+        owned = self.checkpoint.media.get(message.id) or self.checkpoint.deferred.get(message.id)
+        if owned and not archive_volume(owned):
+            return owned
+        if self.archive is not None:
+            return self.archive.reserve_name(media_path.replace(os.sep, '/'), message.id)
+        return reserve_name(self.media_names, media_path, message.id)
+
+    async def _retry_failed(self):
+        """Ponawia nieudane pobrania do archiwum (ze świeżymi odnośnikami), zanim tom zostanie zamknięty.
+
+        Zapisy wiadomości wskazują już bieżący tom. Pliki, których nie udało
+        się pobrać także teraz, są odkładane i trafią obok tomów jako zwykłe
+        pliki - pod ścieżką, którą odtworzyłoby rozpakowanie tomu.
+        """
+        failed, self.failed = dict(self.failed), []
+        ids = sorted(failed)
+        for start in range(0, len(ids), DEFERRED_BATCH):
+            batch = ids[start:start + DEFERRED_BATCH]
+            messages = await self.ctx.scheduler.call(
+                lambda: self.ctx.client.get_messages(self.dialog['peer'], ids=batch))
+            for message_id, message in zip(batch, messages):
+                info = classify(message.media) if message is not None else None
+                if info is None:
+                    continue  # Wiadomość lub jej media usunięto
+                arcname = failed[message_id]
+                if self.ctx.downloads.admit(info, deferred_pass=True) != DOWNLOAD:
+                    self.checkpoint.defer_media(message_id, arcname)
+                    continue
+                await self.downloader.put(message, os.path.join(self.chat_dir, os.path.dirname(arcname)),
+                                          os.path.basename(arcname), info)
+        await self.downloader.drain()
+        failed, self.failed = self.failed, []
+        for message_id, arcname in failed:
+            self.checkpoint.defer_media(message_id, arcname)
+
+    async def download_deferred(self):
+        """Drugie przejście: pobiera odłożone media (wiadomości pobierane ponownie, ze świeżymi odnośnikami)."""
+        ids = sorted(self.checkpoint.deferred)
+        for start in range(0, len(ids), DEFERRED_BATCH):
+            batch = ids[start:start + DEFERRED_BATCH]
+            messages = await self.ctx.scheduler.call(
+                lambda: self.ctx.client.get_messages(self.dialog['peer'], ids=batch))
+            for message_id, message in zip(batch, messages):
+                media_path = self.checkpoint.deferred.get(message_id)
+                info = classify(message.media) if message is not None else None
+                if info is None:
+                    # Wiadomość lub jej media usunięto
+                    self.checkpoint.deferred.pop(message_id, None)
+                    continue
+                # Wpis znika z odłożonych dopiero po pobraniu (add_media), więc błąd nie gubi pliku
+                await self._queue_media(message, info, media_path, deferred_pass=True)
+
+    async def edit(self, message):
+        """Przekazuje edycję już wyeksportowanej wiadomości do formatów zapisu."""
+        if message.id > self.last_id or not self.writers:
+            return  # Jeszcze nie wyeksportowana - trafi do eksportu w aktualnej wersji
+        for i, (pending_message, media_path) in enumerate(self.pending):
+            if pending_message.id == message.id:
+                self.pending[i] = (message, media_path)
+                return
+        await self._write_batch()
+        self.ctx.senders.seed(message)
+        await self.ctx.senders.resolve(self.ctx.client, [message.sender_id], self.ctx.scheduler)
+        media_path = self.checkpoint.media.get(message.id)
+        record = message_record(self.dialog['id'], message, self.ctx.senders.name(message.sender_id), media_path)
+        for writer in self.writers:
+            writer.edit(record)
+        # Edycja dotyczy wiadomości sprzed punktu kontrolnego - bez zatwierdzenia wznowienie by ją obcięło
+        await self.commit()
+
+    async def delete(self, message_ids):
+        """Przekazuje usunięcie wiadomości do formatów zapisu; zwraca, czy dotyczyło tego czatu.
+
+        Usuwane są tylko wiadomości z indeksu eksportu - id bez czatu mogą
+        należeć do dowolnej rozmowy prywatnej lub zwykłej grupy.
+        """
+        if not self.writers:
+            return False
+        await self._write_batch()
+        message_ids = [i for i in message_ids if i <= self.last_id and self.ids.contains(i)]
+        if not message_ids:
+            return False
+        for writer in self.writers:
+            writer.delete(self.dialog['id'], message_ids)
+        await self.commit()
+        return True
+
+    async def commit(self):
+        """Zapisuje bufory na dysk i zatwierdza postęp do ostatniej bezpiecznej wiadomości."""
+        await self._write_batch()
+        with self.ctx.stats.stage('flush'):
+            for writer in self.writers:
+                writer.flush()
+        self.checkpoint.mark(self.last_id, {w.name: w.position() for w in self.writers}, self.exported)
+        if self.archive is None:
+            self.checkpoint.commit(self.downloader.pending_min())
+        elif self.archive.should_roll():
+            await self._roll_archive()
+
+    async def _roll_archive(self):
+        """Zamyka bieżący tom archiwum mediów i dopiero wtedy zatwierdza postęp.
+
+        Pliki z otwartego tomu znikną, jeśli eksport zostanie przerwany, więc
+        punkt kontrolny nie może wyprzedzić zamkniętego tomu.
+        """
+        await self.downloader.drain()
+        await self._retry_failed()
+        await self.archive.close_volume()
+        self.checkpoint.commit(self.downloader.pending_min())
+
+    async def close(self, wait_downloads=True):
+        """Zapisuje bufory i zatwierdza postęp.
+
+        Bez `wait_downloads` (wstrzymanie lub anulowanie eksportu) pliki
+        z kolejki nie są pobierane - punkt kontrolny zatrzymuje się przed
+        pierwszą wiadomością z niepobranymi mediami.
+        """
+        closed = False
+        try:
+            await self._write_batch()
+            with self.ctx.stats.stage('flush'):
+                for writer in self.writers:
+                    writer.flush()
+            self.checkpoint.mark(self.last_id, {w.name: w.position() for w in self.writers}, self.exported)
+            if wait_downloads:
+                # Dokończ pobieranie plików z kolejki przed przejściem dalej
+                if self.archive is not None:
+                    await self.downloader.drain()
+                    await self._retry_failed()
+                await self.downloader.close()
+                if self.archive is not None:
+                    await self.archive.close_volume()
+                closed = True
+            else:
+                await self.downloader.abort()
+        finally:
+            if self.archive is None or closed:
+                self.checkpoint.commit(self.downloader.pending_min())
+            else:
+                # Niedokończony tom zostanie usunięty przy następnym eksporcie, a jego media pobrane ponownie
+                self.archive.abort()
+            for writer in self.writers:
+                writer.close()
+
+    async def _write_batch(self):
+        """Zapisuje paczkę wiadomości, rozwiązując nieznanych nadawców jednym zapytaniem."""
+        if not self.pending:
+            return
+        senders = self.ctx.senders
+        stats = self.ctx.stats
+        with stats.stage('sender_resolve'):
+            await senders.resolve(self.ctx.client, [m.sender_id for m, _ in self.pending], self.ctx.scheduler)
+        with stats.stage('write_batch'):
+            for message, media_path in self.pending:
+                record = message_record(self.dialog['id'], message, senders.name(message.sender_id), media_path)
+                for writer in self.writers:
+                    writer.write(record)
+        self.pending.clear()
@@ -0,0 +1,128 @@
+import json
+import os
+
+from media_archive import archive_volume
+
+# Nazwa pliku stanu zapisywanego w katalogu czatu
+CHECKPOINT_FILE = '.checkpoint.json'
+# Co ile wiadomości zatwierdzać postęp eksportu
+COMMIT_EVERY = 200
+# Opcje zawsze zapisywane w podpisie eksportu
+SIGNATURE_OPTIONS = ('text', 'jsonl', 'sqlite', 'photos', 'voice', 'video', 'files')
+# Opcje dodane później - w podpisie tylko, gdy są ustawione (starsze punkty kontrolne pozostają ważne)
+OPTIONAL_SIGNATURE_OPTIONS = ('html', 'round', 'gifs', 'stickers', 'audio', 'max_media_size', 'file_mime_types',
+                              'media_archive')
+
+
+def export_signature(options, filter_user_id):
+    """Opcje wpływające na zawartość eksportu; zmiana wymusza pełny eksport."""
+    signature = {key: bool(options.get(key)) for key in SIGNATURE_OPTIONS}
+    for key in OPTIONAL_SIGNATURE_OPTIONS:
+        if options.get(key):
+            signature[key] = options[key]
+    signature['filter_user_id'] = filter_user_id
+    return signature
+
+
+class ChatCheckpoint:
+    """Punkt kontrolny eksportu pojedynczego czatu.
+
+    Przechowuje id ostatniej zatwierdzonej wiadomości, liczbę wyeksportowanych
+    do niej wiadomości, pozycje formatów eksportu w tym momencie (np. rozmiar
+    pliku tekstowego), manifest pobranych mediów oraz media odłożone na później
+    (duże pliki, przekroczony budżet). Wiadomości po `last_id` są przy wznowieniu
+    eksportowane ponownie, a pliki przycinane do zapisanych pozycji,
+    więc nic nie jest dublowane ani gubione.
+    """
+
+    def __init__(self, chat_dir, signature, chat_id=None):
+        self.chat_dir = chat_dir
+        self.path = os.path.join(chat_dir, CHECKPOINT_FILE)
+        self.signature = signature
+        # Id czatu zapisywane w stanie - stan innego czatu (np. po zmianie nazw folderów) jest odrzucany
+        self.chat_id = chat_id
+        self.last_id = 0
+        self.count = 0
+        self.positions = {}
+        self.media = {}
+        self.deferred = {}
+        self._marks = []
+
+    def load(self):
+        """Wczytuje stan; zwraca False, jeśli go nie ma lub nie pasuje do opcji."""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Uszkodzony punkt kontrolny {self.path}: {e}")
+            return False
+        if data.get('signature') != self.signature:
+            return False
+        # Starsze punkty kontrolne nie mają id czatu
+        if self.chat_id is not None and data.get('chat_id', self.chat_id) != self.chat_id:
+            print(f"Punkt kontrolny {self.path} należy do innego czatu - eksport od początku")
+            return False
+        self.last_id = data.get('last_id', 0)
+        self.count = data.get('count', 0)
+        self.positions = data.get('positions', {})
+        if 'text_offset' in data:
+            self.positions['text'] = data['text_offset']
+        self.media = {int(k): v for k, v in data.get('media', {}).items()}
+        self.deferred = {int(k): v for k, v in data.get('deferred', {}).items()}
+        return True
+
+    def reset(self):
+        self.last_id = 0
+        self.count = 0
+        self.positions = {}
+        self.media = {}
+        self.deferred = {}
+        self._marks = []
+
+    def save(self):
+        data = {
+            'signature': self.signature,
+            'chat_id': self.chat_id,
+            'last_id': self.last_id,
+            'count': self.count,
+            'positions': self.positions,
+            'media': {str(k): v for k, v in self.media.items()},
+            'deferred': {str(k): v for k, v in self.deferred.items()},
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def has_media(self, message_id):
+        """Czy media wiadomości zostały już pobrane (i plik nadal istnieje)."""
+        rel_path = self.media.get(message_id)
+        if rel_path is None:
+            return False
+        # Plik w archiwum mediów: wystarczy, że jest zamknięty tom
+        return os.path.exists(os.path.join(self.chat_dir, archive_volume(rel_path) or rel_path))
+
+    def add_media(self, message_id, path):
+        self.media[message_id] = os.path.relpath(path, self.chat_dir)
+        self.deferred.pop(message_id, None)
+
+    def defer_media(self, message_id, rel_path):
+        """Zapamiętuje media do pobrania w drugim przejściu (ścieżka względem katalogu czatu)."""
+        self.deferred[message_id] = rel_path
+
+    def mark(self, message_id, positions, count):
+        """Zapamiętuje kandydata do zatwierdzenia: wszystko do `message_id` (łącznie `count` wiadomości) jest zapisane."""
+        self._marks.append((message_id, positions, count))
+
+    def commit(self, pending_min=None):
+        """Zatwierdza najnowszy znacznik poprzedzający niepobrane jeszcze media."""
+        committed = None
+        while self._marks and (pending_min is None or self._marks[0][0] < pending_min):
+            committed = self._marks.pop(0)
+        if committed is None:
+            return False
+        self.last_id, self.positions, self.count = committed
+        self.save()
+        return True
@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+# Pliki większe niż próg pobierane są równolegle kawałkami
+LARGE_FILE_THRESHOLD = 20 * 1024 * 1024
+# Rozmiar kawałka: wielokrotność 4 KiB, dzieli 1 MiB (wymóg upload.getFile)
+PART_SIZE = 512 * 1024
+# Liczba kawałków jednego pliku pobieranych jednocześnie
+LARGE_FILE_WORKERS = 4
+# Co ile pobranych kawałków zapisywać mapę postępu
+MAP_SAVE_EVERY = 16
+
+
+def _load_bitmap(map_path, parts):
+    try:
+        with open(map_path, 'rb') as f:
+            bitmap = bytearray(f.read())
+    except OSError:
+        return None
+    return bitmap if len(bitmap) == parts else None
+
+
+def _save_bitmap(map_path, bitmap):
+    tmp_path = map_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(bitmap)
+    os.replace(tmp_path, map_path)
+
+
+async def download_large(client, document, final_path, scheduler=None, workers=LARGE_FILE_WORKERS, throttle=None):
+    """Pobiera duży dokument równoległymi kawałkami, ze wznawianiem.
+
+    Dane trafiają do wstępnie zaalokowanego pliku `.part`, a mapa `.part.map`
+    (bajt na kawałek) zapamiętuje pobrane kawałki, więc przerwane pobieranie
+    kontynuowane jest od miejsca przerwania. Po sprawdzeniu rozmiaru plik
+    jest przenoszony pod docelową nazwę. `throttle` (korutyna przyjmująca
+    liczbę bajtów) pozwala ograniczyć przepustowość.
+    """
+    size = document.size
+    if os.path.exists(final_path) and os.path.getsize(final_path) == size:
+        return final_path
+
+    part_path = final_path + '.part'
+    map_path = part_path + '.map'
+    parts = (size + PART_SIZE - 1) // PART_SIZE
+
+    bitmap = _load_bitmap(map_path, parts) if os.path.exists(part_path) else None
+    if bitmap is None:
+        bitmap = bytearray(parts)
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        _save_bitmap(map_path, bitmap)
+
+    pending = [i for i in range(parts) if not bitmap[i]]
+    pending.reverse()
+    done_since_save = 0
+
+    async def fetch_part(index):
+        offset = index * PART_SIZE
+        expected = min(PART_SIZE, size - offset)
+        data = b''
+        async for chunk in client.iter_download(document, offset=offset, limit=1, chunk_size=PART_SIZE,
+                                                request_size=PART_SIZE, file_size=size):
+            data = chunk
+        if len(data) != expected:
+            raise IOError(f"Niepełny kawałek {index} ({len(data)} z {expected} B)")
+        return data
+
+    with open(part_path, 'r+b') as part_file:
+        async def worker():
+            nonlocal done_since_save
+            while pending:
+                index = pending.pop()
+                try:
+                    if scheduler:
+                        data = await scheduler.call(lambda: fetch_part(index), hold_slot=False)
+                    else:
+                        data = await fetch_part(index)
+                except BaseException:
+                    pending.append(index)
+                    raise
+                if throttle:
+                    await throttle(len(data))
+                part_file.seek(index * PART_SIZE)
+                part_file.write(data)
+                bitmap[index] = 1
+                done_since_save += 1
+                if done_since_save >= MAP_SAVE_EVERY:
+                    part_file.flush()
+                    _save_bitmap(map_path, bitmap)
+                    done_since_save = 0
+
+        tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, workers))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            part_file.flush()
+            _save_bitmap(map_path, bitmap)
+
+    if not all(bitmap) or os.path.getsize(part_path) != size:
+        raise IOError(f"Rozmiar pliku {final_path} nie zgadza się z oczekiwanym ({size} B)")
+    os.replace(part_path, final_path)
+    os.remove(map_path)
+    return final_path
@@ -0,0 +1,239 @@
+"""Export from the command line, without wx - e.g. for scheduled batch exports on a server.
+
+    python cli.py --list-chats
+    python cli.py --chat "Rodzina*" --chat 123456789 --types text,voice --output /srv/export
+"""
+import argparse
+import fnmatch
+import getpass
+import os
+import queue
+import sys
+
+from tg_logic import TelegramExporterClient, CHAT_CONCURRENCY
+from writers import JSONL_COMPRESSIONS
+from download_policy import DOWNLOAD_ORDERS
+from progress import format_bytes, format_eta
+from jobs import ACTIVE_STATES
+
+TYPE_OPTIONS = ('text', 'jsonl', 'photos', 'voice', 'video', 'round', 'gifs', 'stickers', 'audio', 'files', 'sqlite', 'html')
+# How often (seconds) the console prints a progress line
+CONSOLE_REFRESH = 10
+
+
+def _types(value):
+    types = [t.strip() for t in value.split(',') if t.strip()]
+    unknown = [t for t in types if t not in TYPE_OPTIONS]
+    if unknown or not types:
+        raise argparse.ArgumentTypeError(f"nieznane typy: {', '.join(unknown) or value} (dostępne: {', '.join(TYPE_OPTIONS)})")
+    return types
+
+
+def _megabytes(value):
+    return int(value * 1024 * 1024) if value else None
+
+
+def add_download_arguments(parser):
+    """Download order and limits (shared with benchmark.py)."""
+    parser.add_argument('--download-order', choices=DOWNLOAD_ORDERS, default='fifo',
+                        help="kolejność pobierania mediów (domyślnie fifo)")
+    parser.add_argument('--bandwidth-limit', type=float, metavar='MB/S', help="limit przepustowości pobrań")
+    parser.add_argument('--download-budget', type=float, metavar='MB',
+                        help="najwyżej tyle MB mediów na eksport; resztę pobiorą kolejne eksporty")
+    parser.add_argument('--defer-larger-than', type=float, metavar='MB',
+                        help="pliki większe niż MB pobieraj na końcu, po wszystkich czatach")
+
+
+def download_options(args):
+    return {
+        'download_order': args.download_order,
+        'bandwidth_limit': _megabytes(args.bandwidth_limit),
+        'download_budget': _megabytes(args.download_budget),
+        'defer_size': _megabytes(args.defer_larger_than),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Eksport czatów Telegrama bez interfejsu graficznego.")
+    parser.add_argument('--phone', default='', help="numer telefonu (potrzebny tylko przy pierwszym logowaniu)")
+    parser.add_argument('--chat', action='append', default=[], metavar='CZAT',
+                        help="id czatu albo nazwa (wzorce * i ?, bez rozróżniania wielkości liter); można powtarzać")
+    parser.add_argument('--all-chats', action='store_true', help="eksportuj wszystkie czaty")
+    parser.add_argument('--list-chats', action='store_true', help="wypisz czaty (id i nazwa) i zakończ")
+    parser.add_argument('--types', type=_types, default=['text', 'voice'],
+                        help=f"typy danych oddzielone przecinkami: {', '.join(TYPE_OPTIONS)} (domyślnie text,voice)")
+    parser.add_argument('--max-media-size', type=float, metavar='MB', help="pomijaj media większe niż MB")
+    parser.add_argument('--file-mime-types', metavar='TYPY',
+                        help="typy MIME plików oddzielone przecinkami, np. application/pdf,image/* (tylko typ files)")
+    add_download_arguments(parser)
+    parser.add_argument('--from-user', type=int, metavar='ID', help="tylko wiadomości od tego nadawcy")
+    parser.add_argument('--output', metavar='KATALOG', help="katalog eksportu (domyślnie ./export)")
+    parser.add_argument('--takeout', action='store_true', help="eksport w sesji Takeout")
+    parser.add_argument('--mirror', action='store_true',
+                        help="po eksporcie dopisuj nowe wiadomości na bieżąco (do Ctrl+C)")
+    parser.add_argument('--media-archive', action='store_true',
+                        help="zapisuj media czatu do archiwów ZIP (media-0001.zip, ...) zamiast osobnych plików")
+    parser.add_argument('--jsonl-compression', choices=[c for c in JSONL_COMPRESSIONS if c])
+    parser.add_argument('--parallel-chats', type=int, default=CHAT_CONCURRENCY, metavar='N')
+    parser.add_argument('--history-shards', type=int, default=1, metavar='N',
+                        help="pobieraj historię dużych czatów N zakresami id jednocześnie")
+    parser.add_argument('--persist-senders', action='store_true', help="zapamiętuj nazwy nadawców między eksportami")
+    parser.add_argument('--profile', action='store_true',
+                        help="profiluj eksport (cProfile i wolne wywołania pętli asyncio, plik .prof obok raportu)")
+    args = parser.parse_args(argv)
+    if not (args.chat or args.all_chats or args.list_chats):
+        parser.error("podaj --chat, --all-chats albo --list-chats")
+    return args
+
+
+def select_chats(dialogs, selectors):
+    """Ids of chats matching the selectors, in selector order, without duplicates."""
+    selected = []
+    for selector in selectors:
+        pattern = selector.casefold()
+        matches = [d for d in dialogs
+                   if str(d['id']) == selector or fnmatch.fnmatch(d['title'].casefold(), pattern)]
+        if not matches:
+            print(f"Brak czatu pasującego do: {selector}", file=sys.stderr)
+        for d in matches:
+            if d['id'] not in selected:
+                selected.append(d['id'])
+    return selected
+
+
+def export_options(args):
+    options = {key: True for key in args.types}
+    if args.max_media_size:
+        options['max_media_size'] = _megabytes(args.max_media_size)
+    if args.file_mime_types:
+        options['file_mime_types'] = [t.strip() for t in args.file_mime_types.split(',') if t.strip()]
+    options['takeout'] = args.takeout
+    options['mirror'] = args.mirror
+    options['media_archive'] = args.media_archive
+    options['jsonl_compression'] = args.jsonl_compression
+    options['parallel_chats'] = args.parallel_chats
+    options['persist_senders'] = args.persist_senders
+    options['history_shards'] = args.history_shards
+    options.update(download_options(args))
+    options['profile'] = args.profile
+    return options
+
+
+def _ask(prompt, secret=False):
+    if not sys.stdin.isatty():
+        raise SystemExit("Sesja nie jest zalogowana - zaloguj się raz interaktywnie (cli.py --list-chats).")
+    return getpass.getpass(prompt) if secret else input(prompt)
+
+
+class ConsoleProgress:
+    """Progress sink printing a status line every CONSOLE_REFRESH seconds (and notices as they change)."""
+
+    def __init__(self):
+        self._last_print = 0
+        self._last_notice = None
+        self._last = None
+
+    def progress(self, progress):
+        self._last = progress
+        if progress.notice != self._last_notice:
+            self._last_notice = progress.notice
+            if progress.notice:
+                print(progress.notice, flush=True)
+        if progress.elapsed - self._last_print < CONSOLE_REFRESH:
+            return
+        self._last_print = progress.elapsed
+        print(self._status_line(progress), flush=True)
+
+    @staticmethod
+    def _status_line(progress):
+        line = f"[{progress.completed_chats}/{progress.total_chats}]"
+        if progress.percent is not None:
+            line += f" {progress.percent:.1f}%"
+        line += f" {progress.messages} wiad. ({progress.messages_per_sec:.0f}/s)"
+        line += f", media {format_bytes(progress.bytes)} ({format_bytes(progress.bytes_per_sec)}/s)"
+        if progress.total_messages is not None:
+            line += f", pozostało ok. {format_eta(progress.eta)}"
+        return line
+
+    def finished(self):
+        if self._last:
+            print(self._status_line(self._last), flush=True)
+        print("Eksport zakończony.", flush=True)
+
+
+def run(args):
+    from config import API_ID, API_HASH
+
+    exporter = TelegramExporterClient()
+    if args.output:
+        exporter.export_dir = os.path.abspath(args.output)
+    # One-shot run: the job queue stays in memory (rerunning the command resumes from checkpoints)
+    exporter.persist_jobs = False
+
+    # Callbacks are queued and run here, on the main thread (like wx.CallAfter in the GUI)
+    events = queue.Queue()
+    exporter.call_ui = lambda func, *a: events.put((func, a))
+    result = {}
+
+    def on_error(message):
+        print(f"Błąd: {message}", file=sys.stderr)
+        result['code'] = 1
+
+    def on_dialogs_synced(dialogs):
+        if args.list_chats:
+            for d in dialogs:
+                print(f"{d['id']}\t{d['title']}")
+            result['code'] = 0
+            return
+        chat_ids = [d['id'] for d in dialogs] if args.all_chats else select_chats(dialogs, args.chat)
+        if not chat_ids:
+            print("Nie wybrano żadnego czatu.", file=sys.stderr)
+            result['code'] = 2
+            return
+        print(f"Eksport {len(chat_ids)} czatów do {exporter.export_dir}", flush=True)
+        exporter.start_export(chat_ids, export_options(args), filter_user_id=args.from_user)
+
+    exporter.on_code_requested = lambda: exporter.submit_code(_ask("Kod weryfikacyjny: "))
+    exporter.on_password_requested = lambda: exporter.submit_password(_ask("Hasło 2FA: ", secret=True))
+    exporter.on_connection_error = on_error
+    exporter.on_dialogs_synced = on_dialogs_synced
+    exporter.on_export_finished = lambda: result.setdefault('code', 0)
+    jobs = []
+    stopping = []
+
+    def on_jobs_changed(current):
+        jobs[:] = current
+        if stopping and not any(job['state'] in ACTIVE_STATES for job in current):
+            print("Eksport przerwany - pliki zapisane do ostatniego punktu kontrolnego.", flush=True)
+            result.setdefault('code', 130)
+
+    exporter.on_jobs_changed = on_jobs_changed
+    exporter.add_progress_sink(ConsoleProgress())
+
+    exporter.start_login(API_ID, API_HASH, args.phone)
+    while 'code' not in result:
+        try:
+            func, func_args = events.get()
+            func(*func_args)
+        except KeyboardInterrupt:
+            if args.mirror:
+                # Mirror mode ends cleanly: buffers are flushed and checkpoints committed
+                print("Zatrzymywanie trybu lustra...", flush=True)
+                exporter.stop_mirror()
+                continue
+            if stopping or not jobs:
+                raise
+            # First Ctrl+C cancels the export cleanly (flush and checkpoint), a second one exits at once
+            stopping.append(True)
+            print("Przerywanie eksportu (zapisywanie buforów)...", flush=True)
+            for job in jobs:
+                exporter.cancel_job(job['id'])
+    return result['code']
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import json
+import os
+
+from telethon.tl.types import InputPeerUser, InputPeerChat, InputPeerChannel, InputPeerSelf
+
+# Plik z listą czatów zapamiętaną z ostatniej sesji (obok pliku sesji)
+DIALOG_CACHE_FILE = os.path.join(os.getcwd(), 'exporter_dialogs.json')
+
+
+def peer_to_dict(peer):
+    """Zapisuje InputPeer jako słownik możliwy do zserializowania w JSON."""
+    if isinstance(peer, InputPeerUser):
+        return {'type': 'user', 'id': peer.user_id, 'access_hash': peer.access_hash}
+    if isinstance(peer, InputPeerChannel):
+        return {'type': 'channel', 'id': peer.channel_id, 'access_hash': peer.access_hash}
+    if isinstance(peer, InputPeerChat):
+        return {'type': 'chat', 'id': peer.chat_id}
+    if isinstance(peer, InputPeerSelf):
+        return {'type': 'self'}
+    return None
+
+
+def peer_from_dict(data):
+    if data is None:
+        return None
+    if data['type'] == 'user':
+        return InputPeerUser(data['id'], data['access_hash'])
+    if data['type'] == 'channel':
+        return InputPeerChannel(data['id'], data['access_hash'])
+    if data['type'] == 'chat':
+        return InputPeerChat(data['id'])
+    if data['type'] == 'self':
+        return InputPeerSelf()
+    return None
+
+
+def dialog_info(dialog):
+    """Lekki opis dialogu Telethona (bez pełnej encji) używany przez aplikację."""
+    return {
+        'id': dialog.id,
+        'title': dialog.title,
+        'is_group': dialog.is_group,
+        'is_channel': dialog.is_channel,
+        'peer': dialog.input_entity,
+        'last_message_id': dialog.message.id if dialog.message else 0,
+        'date': dialog.date.timestamp() if dialog.date else 0,
+        'size': getattr(dialog.entity, 'participants_count', None) or 0,
+    }
+
+
+def chat_type(dialog):
+    """Rodzaj czatu z opisu dialogu: 'private', 'group' albo 'channel'."""
+    if dialog['is_channel'] and not dialog['is_group']:
+        return 'channel'
+    if dialog['is_group']:
+        return 'group'
+    return 'private'
+
+
+class DialogCache:
+    """Lista czatów zapisana na dysku, żeby GUI mogło ją pokazać od razu po zalogowaniu."""
+
+    def __init__(self, path=DIALOG_CACHE_FILE):
+        self.path = path
+
+    def load(self, user_id):
+        """Zwraca zapamiętane dialogi użytkownika (pustą listę, jeśli brak)."""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Nie udało się wczytać cache czatów: {e}")
+            return []
+        if data.get('user_id') != user_id:
+            return []
+        dialogs = []
+        for item in data.get('dialogs', []):
+            item['peer'] = peer_from_dict(item.get('peer'))
+            if item['peer'] is not None:
+                dialogs.append(item)
+        return dialogs
+
+    def save(self, user_id, dialogs):
+        items = []
+        for dialog in dialogs:
+            item = dict(dialog)
+            item['peer'] = peer_to_dict(dialog['peer'])
+            items.append(item)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'user_id': user_id, 'dialogs': items}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+
+from media_kinds import MediaKind
+
+# Kolejność pobrań (opcja 'download_order')
+DOWNLOAD_ORDERS = ('fifo', 'small_first', 'by_type', 'newest_first')
+# Kolejność rodzajów mediów dla 'by_type': najpierw małe i najczęściej potrzebne
+TYPE_RANK = {kind: rank for rank, kind in enumerate((
+    MediaKind.VOICE, MediaKind.PHOTO, MediaKind.ROUND, MediaKind.AUDIO,
+    MediaKind.STICKER, MediaKind.GIF, MediaKind.FILE, MediaKind.VIDEO,
+))}
+# Decyzje `DownloadPolicy.admit`
+DOWNLOAD = 'download'
+DEFER = 'defer'
+
+
+class ByteBucket:
+    """Kubełek żetonów liczonych w bajtach (limit przepustowości pobrań).
+
+    Pobrany kawałek jest zawsze przyjmowany, a powstały dług odczekiwany,
+    więc kawałki większe niż zapas kubełka nie blokują się na zawsze.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = None
+
+    async def consume(self, amount):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class PrioritySlots:
+    """Semafor, który zwalniane miejsca oddaje oczekującym według priorytetu (najmniejszy pierwszy)."""
+
+    def __init__(self, slots):
+        self._free = slots
+        self._waiters = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority=()):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Miejsce przydzielone tuż przed anulowaniem trzeba oddać następnemu
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class DownloadPolicy:
+    """Zasady pobierania mediów wspólne dla całego eksportu.
+
+    Ustala kolejność pobrań (`download_order`), ogranicza przepustowość
+    (`bandwidth_limit`, bajty na sekundę) i łączną liczbę pobranych bajtów
+    (`download_budget`), a pliki większe niż `defer_size` odkłada do
+    drugiego przejścia po eksporcie wszystkich czatów. Pliki ponad budżet
+    też są odkładane - pobierze je jeden z kolejnych eksportów.
+    """
+
+    def __init__(self, options, workers):
+        self.order = options.get('download_order') or 'fifo'
+        if self.order not in DOWNLOAD_ORDERS:
+            raise ValueError(f"Nieznana kolejność pobierania: {self.order}")
+        rate = options.get('bandwidth_limit')
+        self.bucket = ByteBucket(rate) if rate else None
+        self.budget = options.get('download_budget') or None
+        self.defer_size = options.get('defer_size') or None
+        self.slots = PrioritySlots(workers)
+        self.reserved = 0
+        self.deferred = 0
+
+    def priority(self, message, info):
+        """Klucz kolejności pobrania (mniejszy - wcześniej)."""
+        if self.order == 'small_first':
+            return (info.size,)
+        if self.order == 'by_type':
+            return (TYPE_RANK[info.kind], info.size)
+        if self.order == 'newest_first':
+            return (-message.id,)
+        return ()
+
+    def admit(self, info, deferred_pass=False):
+        """DOWNLOAD (rezerwuje bajty z budżetu) albo DEFER; w drugim przejściu rozmiar nie odkłada."""
+        if not deferred_pass and self.defer_size and info.size > self.defer_size:
+            self.deferred += 1
+            return DEFER
+        if self.budget is not None and self.reserved + info.size > self.budget:
+            self.deferred += 1
+            return DEFER
+        self.reserved += info.size
+        return DOWNLOAD
+
+    def release(self, info):
+        """Zwraca do budżetu bajty pobrania, które się nie udało."""
+        self.reserved -= info.size
+
+    async def throttle(self, amount):
+        if self.bucket and amount > 0:
+            await self.bucket.consume(amount)
+
+    def progress_callback(self):
+        """Callback postępu dla `download_media`, który dławi pobieranie do limitu przepustowości."""
+        if self.bucket is None:
+            return None
+        done = 0
+
+        async def callback(current, total):
+            nonlocal done
+            if current < done:  # Ponowienie pobierania od początku
+                done = 0
+            await self.throttle(current - done)
+            done = current
+        return callback
@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import os
+
+from chunked import download_large, LARGE_FILE_THRESHOLD
+from media_store import media_key, media_file_name
+from instrumentation import Instrumentation
+from download_policy import PrioritySlots
+
+# Domyślna liczba równoległych pobrań mediów
+DOWNLOAD_WORKERS = 4
+# Maksymalna liczba plików czekających w kolejce (ogranicza zużycie pamięci)
+DOWNLOAD_QUEUE_SIZE = 64
+# Kolejka przy kolejności innej niż FIFO - większe okno, w którym pliki są porządkowane
+PRIORITY_QUEUE_SIZE = 512
+
+
+class MediaDownloader:
+    """Pula workerów pobierających media niezależnie od iteracji wiadomości.
+
+    Producent (pętla `iter_messages`) wrzuca zadania do ograniczonej kolejki,
+    a workerzy pobierają pliki równolegle. Zasady pobierania (`policy`,
+    DownloadPolicy) ustalają kolejność plików w kolejce i limit
+    przepustowości; ich miejsca na pobrania są współdzielone przez
+    wszystkie czaty eksportu, więc ograniczają łączną liczbę pobrań.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, queue_size=None, policy=None,
+                 on_downloaded=None, on_failed=None, scheduler=None, client=None, store=None, stats=None,
+                 archive=None):
+        self.workers = max(1, workers)
+        self.policy = policy
+        if queue_size is None:
+            queue_size = PRIORITY_QUEUE_SIZE if policy and policy.order != 'fifo' else DOWNLOAD_QUEUE_SIZE
+        self.queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self._order = itertools.count()
+        self.slots = policy.slots if policy else PrioritySlots(self.workers)
+        self.on_downloaded = on_downloaded
+        # Wywoływane z (message, ścieżka) po nieudanym pobraniu - przed zwolnieniem id z `pending`,
+        # żeby punkt kontrolny zapamiętał plik do ponowienia, zanim go minie
+        self.on_failed = on_failed
+        # Wspólny budżet zapytań (przerwy FloodWait dotyczą też pobierania)
+        self.scheduler = scheduler
+        # Klient, przez który idą pobrania (np. sesja Takeout); domyślnie klient wiadomości
+        self.client = client
+        # Wspólny magazyn mediów (deduplikacja między czatami); None = zapis prosto do katalogu
+        self.store = store
+        # Archiwum mediów czatu (MediaArchive); jeśli jest, pliki trafiają do niego, a nie do katalogów
+        self.archive = archive
+        # Czasy pobrań, bajty i głębokość kolejki (raport eksportu)
+        self.stats = stats or Instrumentation()
+        # Id wiadomości, których media są w kolejce lub w trakcie pobierania
+        self.pending = set()
+        self.downloaded = 0
+        self.failed = 0
+        self._tasks = []
+
+    def start(self):
+        """Uruchamia workerów w bieżącej pętli zdarzeń."""
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+
+    async def put(self, message, media_dir, name=None, info=None, loose=False):
+        """Dodaje plik do kolejki; czeka, jeśli kolejka jest pełna.
+
+        `name` to nazwa pliku w `media_dir` (domyślnie `media_file_name`),
+        a `info` - wynik `classify` używany do ustalenia kolejności.
+        `loose` zapisuje plik na dysku także w trybie archiwum mediów.
+        """
+        self.pending.add(message.id)
+        self.stats.observe_queue('download_queue', self.queue.qsize())
+        priority = self.policy.priority(message, info) if self.policy and info else ()
+        await self.queue.put((priority, next(self._order), message, media_dir,
+                              name or media_file_name(message), info, loose))
+
+    def pending_min(self):
+        """Najmniejsze id wiadomości z niepobranymi jeszcze mediami (albo None)."""
+        return min(self.pending) if self.pending else None
+
+    async def _worker(self):
+        while True:
+            priority, _, message, media_dir, name, info, loose = await self.queue.get()
+            try:
+                await self.slots.acquire(priority)
+                try:
+                    with self.stats.stage('download'):
+                        path = await self._download(message, media_dir, name, loose)
+                finally:
+                    self.slots.release()
+                self.downloaded += 1
+                if path and self.on_downloaded:
+                    self.on_downloaded(message, path)
+            except asyncio.CancelledError:
+                # Przerwane pobieranie: id zostaje w `pending`, więc punkt kontrolny go nie minie
+                self.queue.task_done()
+                raise
+            except Exception as e:
+                self.failed += 1
+                self.stats.count('downloads_failed')
+                if self.policy and info:
+                    self.policy.release(info)
+                print(f"Błąd pobierania pliku: {e}")
+                if self.on_failed:
+                    self.on_failed(message, os.path.join(media_dir, name))
+            self.pending.discard(message.id)
+            self.queue.task_done()
+
+    async def _download(self, message, media_dir, name, loose=False):
+        client = self.client or message.client
+        if self.archive is not None and not loose:
+            return await self._download_to_archive(client, message, media_dir, name)
+        if self.store is None or media_key(message.media) is None:
+            path = os.path.join(media_dir, name)
+            if not os.path.exists(path):
+                await self._fetch_to(client, message, path)
+            return path
+        stored = await self.store.fetch(message, lambda path: self._fetch_to(client, message, path))
+        return self.store.link(stored, media_dir, name)
+
+    async def _download_to_archive(self, client, message, media_dir, name):
+        """Pobiera plik do archiwum pod nazwą zarezerwowaną przy kolejkowaniu (`media_dir`/`name`).
+
+        Po błędzie nazwa zostaje zarezerwowana - zapis wiadomości już ją
+        wskazuje, a ponowienie trafia pod nią.
+        """
+        path = os.path.join(media_dir, name)
+        arcname = os.path.relpath(path, self.archive.chat_dir).replace(os.sep, '/')
+        document = getattr(message.media, 'document', None)
+        if document is not None and document.size >= LARGE_FILE_THRESHOLD:
+            # Duże pliki: kawałki ze wznawianiem na dysk, potem przeniesienie do archiwum
+            os.makedirs(media_dir, exist_ok=True)
+            await self._fetch_to(client, message, path)
+            return await self.archive.add_file(arcname, path)
+        return await self.archive.add(arcname, lambda file: self._fetch_to_file(client, message, file))
+
+    async def _fetch_to_file(self, client, message, file):
+        """Pobiera media wiadomości do obiektu plikowego (przy ponowieniu zapisuje od początku)."""
+        progress_callback = self.policy.progress_callback() if self.policy else None
+
+        async def fetch():
+            file.seek(0)
+            file.truncate()
+            await client.download_media(message, file=file, progress_callback=progress_callback)
+        if self.scheduler:
+            await self.scheduler.call(fetch, hold_slot=False)
+        else:
+            await fetch()
+        self.stats.count('files_downloaded')
+        self.stats.count('bytes_downloaded', file.tell())
+
+    async def _fetch_to(self, client, message, path):
+        """Pobiera media wiadomości dokładnie pod `path` (przez plik tymczasowy)."""
+        # Duże dokumenty (wideo, pliki) - równoległe kawałki ze wznawianiem
+        document = getattr(message.media, 'document', None)
+        if document is not None and document.size >= LARGE_FILE_THRESHOLD:
+            await download_large(client, document, path, scheduler=self.scheduler,
+                                 throttle=self.policy.throttle if self.policy else None)
+            self.stats.count('files_downloaded')
+            self.stats.count('bytes_downloaded', document.size)
+            return path
+        tmp_path = path + '.tmp'
+        progress_callback = self.policy.progress_callback() if self.policy else None
+        if self.scheduler:
+            await self.scheduler.call(
+                lambda: client.download_media(message, file=tmp_path, progress_callback=progress_callback),
+                hold_slot=False)
+        else:
+            await client.download_media(message, file=tmp_path, progress_callback=progress_callback)
+        os.replace(tmp_path, path)
+        self.stats.count('files_downloaded')
+        self.stats.count('bytes_downloaded', os.path.getsize(path))
+        return path
+
+    async def drain(self):
+        """Czeka, aż wszystkie pliki z kolejki zostaną pobrane (workerzy działają dalej)."""
+        await self.queue.join()
+
+    async def close(self):
+        """Czeka na opróżnienie kolejki i zatrzymuje workerów."""
+        try:
+            await self.queue.join()
+        finally:
+            await self.abort()
+
+    async def abort(self):
+        """Zatrzymuje workerów bez czekania na kolejkę; niepobrane pliki zostają w `pending`."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
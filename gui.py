@@ -2,8 +2,14 @@ import wx
 import os
 import security
 from tg_logic import tg_client
+from progress import format_bytes, format_eta
+from dialog_cache import chat_type
+from jobs import QUEUED, RUNNING, MIRRORING, PAUSED, DONE, CANCELLED, FAILED, RESUMABLE_STATES, ACTIVE_STATES
 from config import API_ID, API_HASH
 
+# Delay after the last keystroke before a participant search is sent to the server
+PARTICIPANT_SEARCH_DELAY_MS = 400
+
 class LoginFrame(wx.Frame):
     def __init__(self, parent):
         super().__init__(parent, title="Telegram Exporter - Logowanie", size=(400, 300))
@@ -31,7 +37,8 @@ class LoginFrame(wx.Frame):
         
         panel.SetSizer(vbox)
         
-        # Callbacks
+        # Callbacks (delivered on the GUI thread)
+        tg_client.call_ui = wx.CallAfter
         tg_client.on_code_requested = self.on_code_requested
         tg_client.on_password_requested = self.on_password_requested
         tg_client.on_login_success = self.on_login_success
@@ -81,9 +88,151 @@ class LoginFrame(wx.Frame):
         wx.MessageBox(f"Błąd: {message}", "Błąd", wx.OK | wx.ICON_ERROR)
 
 
+class ChatListModel:
+    """In-memory model behind the virtual chat list: filter, sort order and check state.
+
+    Check state is kept per chat id as a default plus the ids toggled away
+    from it, so (un)checking every chat is a constant-time operation and
+    checks survive filtering, re-sorting and refreshes of the dialog list.
+    """
+
+    SORT_KEYS = [
+        ("Ostatnia aktywność", 'recent'),
+        ("Liczba uczestników", 'size'),
+        ("Typ czatu", 'type'),
+    ]
+    TYPE_ORDER = {'private': 0, 'group': 1, 'channel': 2}
+
+    def __init__(self):
+        self.dialogs = []
+        self.view = []  # indices into self.dialogs, in display order
+        self.filter_text = ''
+        self.sort_key = 'recent'
+        self._names = []
+        self._orders = {}
+        self._check_default = False
+        self._toggled = set()
+
+    def set_dialogs(self, dialogs):
+        self.dialogs = dialogs
+        self._names = [d['title'].casefold() for d in dialogs]
+        self._orders = {}
+        self._apply(narrow=False)
+
+    def set_filter(self, text):
+        text = text.strip().casefold()
+        # Typing more characters only narrows the current view
+        narrow = text.startswith(self.filter_text)
+        self.filter_text = text
+        self._apply(narrow)
+
+    def set_sort(self, key):
+        self.sort_key = key
+        self._apply(narrow=False)
+
+    def _order(self):
+        order = self._orders.get(self.sort_key)
+        if order is None:
+            recent = sorted(range(len(self.dialogs)), key=lambda i: -self.dialogs[i]['date'])
+            if self.sort_key == 'size':
+                order = sorted(recent, key=lambda i: -self.dialogs[i]['size'])
+            elif self.sort_key == 'type':
+                order = sorted(recent, key=lambda i: self.TYPE_ORDER[chat_type(self.dialogs[i])])
+            else:
+                order = recent
+            self._orders[self.sort_key] = order
+        return order
+
+    def _apply(self, narrow):
+        source = self.view if narrow else self._order()
+        if self.filter_text:
+            self.view = [i for i in source if self.filter_text in self._names[i]]
+        else:
+            self.view = source
+
+    def __len__(self):
+        return len(self.view)
+
+    def label(self, row):
+        d = self.dialogs[self.view[row]]
+        label = d['title']
+        if d['is_group']: label += " [Grupa]"
+        if d['is_channel']: label += " [Kanał]"
+        return label
+
+    def is_checked(self, row):
+        return (self.dialogs[self.view[row]]['id'] in self._toggled) != self._check_default
+
+    def set_checked(self, row, state):
+        chat_id = self.dialogs[self.view[row]]['id']
+        if state == self._check_default:
+            self._toggled.discard(chat_id)
+        else:
+            self._toggled.add(chat_id)
+
+    def check_all(self, state):
+        if self.filter_text:
+            # Only the chats matching the filter
+            for row in range(len(self.view)):
+                self.set_checked(row, state)
+        else:
+            self._check_default = state
+            self._toggled.clear()
+
+    def checked_ids(self):
+        return [d['id'] for d in self.dialogs if (d['id'] in self._toggled) != self._check_default]
+
+
+class ChatListCtrl(wx.ListCtrl):
+    """Virtual list of chats; rows are rendered on demand from a ChatListModel."""
+
+    def __init__(self, parent, model):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_NO_HEADER | wx.BORDER_SUNKEN)
+        self.model = model
+        self.EnableCheckBoxes(True)
+        self.InsertColumn(0, "Nazwa czatu", width=450)
+        self.Bind(wx.EVT_LIST_ITEM_CHECKED, lambda e: self._on_check(e, True))
+        self.Bind(wx.EVT_LIST_ITEM_UNCHECKED, lambda e: self._on_check(e, False))
+        self.refresh()
+
+    def refresh(self):
+        # Only the visible rows are repainted, whatever the number of chats
+        self.SetItemCount(len(self.model))
+        if len(self.model):
+            self.RefreshItems(0, len(self.model) - 1)
+
+    def OnGetItemText(self, item, column):
+        return self.model.label(item)
+
+    def OnGetItemIsChecked(self, item):
+        return self.model.is_checked(item)
+
+    def _on_check(self, event, state):
+        self.model.set_checked(event.GetIndex(), state)
+        self.RefreshItem(event.GetIndex())
+
+
 class MainFrame(wx.Frame):
+    ALL_PARTICIPANTS = "=== WSZYSCY (Domyślne) ==="
+    # (label, download_order option)
+    DOWNLOAD_ORDERS = [
+        ("W kolejności wiadomości", 'fifo'),
+        ("Najpierw małe pliki", 'small_first'),
+        ("Według typu (głosówki, zdjęcia, ... wideo)", 'by_type'),
+        ("Najpierw najnowsze", 'newest_first'),
+    ]
+    JOB_STATES = {
+        QUEUED: "W kolejce",
+        RUNNING: "W trakcie",
+        MIRRORING: "Tryb lustra (nie blokuje kolejki)",
+        PAUSED: "Wstrzymane",
+        DONE: "Zakończone",
+        CANCELLED: "Anulowane",
+        FAILED: "Błąd",
+    }
+
     def __init__(self, parent, user_data):
-        super().__init__(parent, title=f"Zalogowano: {user_data['username']}", size=(600, 600))
+        super().__init__(parent, title=f"Zalogowano: {user_data['username']}", size=(640, 790))
         self.Center()
         self.user_data = user_data
         
@@ -93,15 +242,18 @@ class MainFrame(wx.Frame):
         
         # Initialize variables
         self.chat_objects = []
+        self.chat_model = ChatListModel()
         self.selected_chat_ids = []
         self.export_opts = {}
         self.participant_list = []
+        self.jobs = []
         
         # Callbacks
         tg_client.on_dialogs_loaded = self.load_chats_to_list
         tg_client.on_export_progress = self.update_progress
         tg_client.on_export_finished = self.on_finished
-        tg_client.on_participants_loaded = self.show_filter_ui
+        tg_client.on_participants_loaded = self.on_participants_page
+        tg_client.on_jobs_changed = self.on_jobs_changed
         
         # Start with Main View
         self.setup_main_view()
@@ -118,35 +270,53 @@ class MainFrame(wx.Frame):
         hbox_btns = wx.BoxSizer(wx.HORIZONTAL)
         btn_all = wx.Button(self.panel, label="Zaznacz wszystkie", size=(120, -1))
         btn_none = wx.Button(self.panel, label="Odznacz wszystkie", size=(120, -1))
-        btn_all.Bind(wx.EVT_BUTTON, lambda evt: self.toggle_all_items(self.lst_chats, True))
-        btn_none.Bind(wx.EVT_BUTTON, lambda evt: self.toggle_all_items(self.lst_chats, False))
+        btn_all.Bind(wx.EVT_BUTTON, lambda evt: self.check_all_chats(True))
+        btn_none.Bind(wx.EVT_BUTTON, lambda evt: self.check_all_chats(False))
         hbox_btns.Add(btn_all, flag=wx.RIGHT, border=5)
         hbox_btns.Add(btn_none)
         self.sizer.Add(hbox_btns, flag=wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
 
-        self.lst_chats = wx.ListCtrl(self.panel, style=wx.LC_REPORT | wx.LC_NO_HEADER | wx.BORDER_SUNKEN)
-        self.lst_chats.EnableCheckBoxes(True)
-        self.lst_chats.InsertColumn(0, "Nazwa czatu", width=450)
-        self.sizer.Add(self.lst_chats, proportion=1, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=10)
+        # Filter & sort
+        hbox_filter = wx.BoxSizer(wx.HORIZONTAL)
+        lbl_filter = wx.StaticText(self.panel, label="&Szukaj:")
+        self.txt_filter = wx.TextCtrl(self.panel)
+        self.txt_filter.ChangeValue(self.chat_model.filter_text)
+        self.txt_filter.Bind(wx.EVT_TEXT, self.on_filter_changed)
+        lbl_sort = wx.StaticText(self.panel, label="S&ortuj:")
+        self.cb_sort = wx.Choice(self.panel, choices=[label for label, key in ChatListModel.SORT_KEYS])
+        self.cb_sort.SetSelection([key for label, key in ChatListModel.SORT_KEYS].index(self.chat_model.sort_key))
+        self.cb_sort.Bind(wx.EVT_CHOICE, self.on_sort_changed)
+        hbox_filter.Add(lbl_filter, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        hbox_filter.Add(self.txt_filter, proportion=1, flag=wx.RIGHT, border=10)
+        hbox_filter.Add(lbl_sort, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        hbox_filter.Add(self.cb_sort)
+        self.sizer.Add(hbox_filter, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
 
-        if self.chat_objects:
-            self._fill_chat_list()
+        self.lst_chats = ChatListCtrl(self.panel, self.chat_model)
+        self.sizer.Add(self.lst_chats, proportion=1, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=10)
 
         # Type Selection
         lbl_type = wx.StaticText(self.panel, label="Opcje &eksportu:")
         self.sizer.Add(lbl_type, flag=wx.LEFT|wx.TOP, border=15)
         
-        self.lst_types = wx.ListCtrl(self.panel, size=(-1, 120), style=wx.LC_REPORT | wx.LC_NO_HEADER | wx.BORDER_SUNKEN)
+        self.lst_types = wx.ListCtrl(self.panel, size=(-1, 200), style=wx.LC_REPORT | wx.LC_NO_HEADER | wx.BORDER_SUNKEN)
         self.lst_types.EnableCheckBoxes(True)
         self.lst_types.InsertColumn(0, "Typ danych", width=300)
         self.sizer.Add(self.lst_types, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=10)
         
         self.type_options = [
             ("Tekst (.txt)", 'text'),
+            ("Pełne metadane wiadomości (.jsonl)", 'jsonl'),
             ("Zdjęcia", 'photos'),
             ("Wiadomości Głosowe", 'voice'),
             ("Wideo", 'video'),
-            ("Pliki / Dokumenty", 'files')
+            ("Wideo okrągłe (wiadomości wideo)", 'round'),
+            ("GIF-y", 'gifs'),
+            ("Naklejki", 'stickers'),
+            ("Muzyka / Audio", 'audio'),
+            ("Pliki / Dokumenty", 'files'),
+            ("Archiwum SQLite z wyszukiwaniem (archive.db)", 'sqlite'),
+            ("Strony HTML do przeglądania (html/index.html)", 'html')
         ]
         
         for label, key in self.type_options:
@@ -154,29 +324,75 @@ class MainFrame(wx.Frame):
             if key in ['text', 'voice']:
                 self.lst_types.CheckItem(index, True)
 
+        # Media limits (size for every kind, MIME types for files only)
+        hbox_limits = wx.BoxSizer(wx.HORIZONTAL)
+        lbl_max_size = wx.StaticText(self.panel, label="Maks. &rozmiar pliku (MB, 0 = bez limitu):")
+        self.spin_max_size = self._megabyte_spin('max_media_size', max_value=4000)
+        lbl_mime = wx.StaticText(self.panel, label="Typy &MIME plików:")
+        self.txt_mime = wx.TextCtrl(self.panel)
+        self.txt_mime.SetHint("np. application/pdf, image/*")
+        self.txt_mime.ChangeValue(", ".join(self.export_opts.get('file_mime_types', [])))
+        hbox_limits.Add(lbl_max_size, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        hbox_limits.Add(self.spin_max_size, flag=wx.RIGHT, border=10)
+        hbox_limits.Add(lbl_mime, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        hbox_limits.Add(self.txt_mime, proportion=1)
+        self.sizer.Add(hbox_limits, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.TOP, border=10)
+
+        # Download order, bandwidth cap, byte budget and deferral of large files
+        grid_downloads = wx.FlexGridSizer(cols=4, hgap=5, vgap=5)
+        orders = [key for label, key in self.DOWNLOAD_ORDERS]
+        self.cb_download_order = wx.Choice(self.panel, choices=[label for label, key in self.DOWNLOAD_ORDERS])
+        self.cb_download_order.SetSelection(orders.index(self.export_opts.get('download_order') or 'fifo'))
+        self.spin_bandwidth = self._megabyte_spin('bandwidth_limit')
+        self.spin_budget = self._megabyte_spin('download_budget', max_value=1000000)
+        self.spin_defer = self._megabyte_spin('defer_size')
+        for label, control in (("&Kolejność pobierania:", self.cb_download_order),
+                               ("Limit &przepustowości (MB/s, 0 = bez limitu):", self.spin_bandwidth),
+                               ("&Budżet na eksport (MB, 0 = bez limitu):", self.spin_budget),
+                               ("Pliki większe niż (MB) pobieraj &na końcu:", self.spin_defer)):
+            grid_downloads.Add(wx.StaticText(self.panel, label=label), flag=wx.ALIGN_CENTER_VERTICAL)
+            grid_downloads.Add(control)
+        self.sizer.Add(grid_downloads, flag=wx.LEFT|wx.RIGHT|wx.TOP, border=10)
+
+        self.chk_takeout = wx.CheckBox(self.panel, label="Tryb &Takeout (wyższe limity, wymaga zatwierdzenia w Telegramie)")
+        self.chk_takeout.SetValue(self.export_opts.get('takeout', False))
+        self.sizer.Add(self.chk_takeout, flag=wx.LEFT|wx.TOP, border=10)
+
+        self.chk_mirror = wx.CheckBox(self.panel, label="Tryb &lustra (po eksporcie dopisuj nowe wiadomości na bieżąco)")
+        self.chk_mirror.SetValue(self.export_opts.get('mirror', False))
+        self.sizer.Add(self.chk_mirror, flag=wx.LEFT|wx.TOP, border=5)
+
+        self.chk_media_archive = wx.CheckBox(self.panel, label="Media w &archiwach ZIP czatu (media-0001.zip, ...)")
+        self.chk_media_archive.SetValue(self.export_opts.get('media_archive', False))
+        self.sizer.Add(self.chk_media_archive, flag=wx.LEFT|wx.TOP, border=5)
+
         # Action
+        hbox_action = wx.BoxSizer(wx.HORIZONTAL)
         self.btn_export = wx.Button(self.panel, label="&Dalej / Eksportuj")
         self.btn_export.Bind(wx.EVT_BUTTON, self.on_export_click)
-        self.sizer.Add(self.btn_export, flag=wx.ALIGN_CENTER|wx.ALL, border=15)
+        hbox_action.Add(self.btn_export, flag=wx.RIGHT, border=10)
+        self.btn_jobs = wx.Button(self.panel, label=self._jobs_button_label())
+        self.btn_jobs.Bind(wx.EVT_BUTTON, lambda evt: self.setup_jobs_view())
+        hbox_action.Add(self.btn_jobs)
+        self.sizer.Add(hbox_action, flag=wx.ALIGN_CENTER|wx.ALL, border=15)
         
         self.panel.Layout()
         self.lst_chats.SetFocus()
 
-    # --- VIEW 2: PARTICIPANT FILTER (Only for Single Chat) ---
-    def show_filter_loading(self):
-        """Shows a temporary loading state while fetching participants."""
-        self.panel.DestroyChildren()
-        self.sizer.Clear(True)
-        
-        lbl = wx.StaticText(self.panel, label="Pobieranie listy uczestników czatu...\nMoże to chwilę potrwać.")
-        self.sizer.Add(lbl, flag=wx.ALIGN_CENTER|wx.ALL, border=50)
-        self.panel.Layout()
+    def _megabyte_spin(self, option, max_value=100000):
+        """Spin control in MB for a byte-valued export option (0 = no limit)."""
+        return wx.SpinCtrl(self.panel, min=0, max=max_value,
+                           initial=(self.export_opts.get(option) or 0) // (1024 * 1024))
 
-    def show_filter_ui(self, participants):
-        """Called by logic callback when participants are loaded."""
+    # --- VIEW 2: PARTICIPANT FILTER (Only for Single Chat) ---
+    def setup_filter_view(self, chat_id):
+        """Sender filter; participants arrive in pages and the search runs on the server."""
         self.panel.DestroyChildren()
         self.sizer.Clear(True)
-        self.participant_list = participants
+        self.filter_chat_id = chat_id
+        self.participant_list = []
+        self.participant_query = ''
+        self._search_timer = None
         
         lbl_title = wx.StaticText(self.panel, label="Filtrowanie wiadomości")
         font = lbl_title.GetFont()
@@ -187,78 +403,158 @@ class MainFrame(wx.Frame):
         lbl_desc = wx.StaticText(self.panel, label="Wybrano jeden czat. Możesz wyeksportować wiadomości tylko od konkretnej osoby (np. tylko Twoje głosówki).")
         self.sizer.Add(lbl_desc, flag=wx.ALL, border=20)
         
-        lbl_sel = wx.StaticText(self.panel, label="Czyje wiadomości eksportować:")
+        lbl_search = wx.StaticText(self.panel, label="&Szukaj osoby:")
+        self.sizer.Add(lbl_search, flag=wx.LEFT, border=20)
+        self.txt_participant = wx.TextCtrl(self.panel)
+        self.txt_participant.Bind(wx.EVT_TEXT, self.on_participant_search)
+        self.sizer.Add(self.txt_participant, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.BOTTOM, border=20)
+        
+        lbl_sel = wx.StaticText(self.panel, label="&Czyje wiadomości eksportować:")
         self.sizer.Add(lbl_sel, flag=wx.LEFT, border=20)
         
-        # Dropdown
-        choices = ["=== WSZYSCY (Domyślne) ==="]
-        for p in participants:
-            choices.append(p['name'])
-            
-        self.cb_participants = wx.Choice(self.panel, choices=choices)
-        self.cb_participants.SetSelection(0)
-        self.sizer.Add(self.cb_participants, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=20)
+        self.lst_participants = wx.ListBox(self.panel, choices=[self.ALL_PARTICIPANTS], style=wx.LB_SINGLE)
+        self.lst_participants.SetSelection(0)
+        self.sizer.Add(self.lst_participants, proportion=1, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=20)
+        
+        self.participants_status = wx.StaticText(self.panel, label="Pobieranie listy uczestników czatu...")
+        self.sizer.Add(self.participants_status, flag=wx.LEFT|wx.TOP, border=20)
         
         # Buttons
         hbox = wx.BoxSizer(wx.HORIZONTAL)
         btn_cancel = wx.Button(self.panel, label="Anuluj")
         btn_start = wx.Button(self.panel, label="Rozpocznij Eksport")
         
-        btn_cancel.Bind(wx.EVT_BUTTON, lambda e: self.setup_main_view())
+        btn_cancel.Bind(wx.EVT_BUTTON, self.on_filter_cancel)
         btn_start.Bind(wx.EVT_BUTTON, self.on_start_filtered_export)
         
         hbox.Add(btn_cancel, flag=wx.RIGHT, border=10)
         hbox.Add(btn_start)
-        self.sizer.Add(hbox, flag=wx.ALIGN_CENTER|wx.TOP, border=30)
+        self.sizer.Add(hbox, flag=wx.ALIGN_CENTER|wx.TOP|wx.BOTTOM, border=20)
         
         self.panel.Layout()
-        self.cb_participants.SetFocus()
+        self.txt_participant.SetFocus()
+        tg_client.fetch_chat_members(chat_id)
 
-    # --- VIEW 3: PROGRESS BAR ---
-    def setup_progress_view(self):
+    def on_participant_search(self, event):
+        # Wait for a pause in typing before asking the server
+        if self._search_timer:
+            self._search_timer.Stop()
+        self._search_timer = wx.CallLater(PARTICIPANT_SEARCH_DELAY_MS, self._start_participant_search)
+
+    def _start_participant_search(self):
+        if not getattr(self, 'txt_participant', None):
+            return
+        self.participant_query = self.txt_participant.GetValue().strip()
+        self.participant_list = []
+        self.lst_participants.Set([self.ALL_PARTICIPANTS])
+        self.lst_participants.SetSelection(0)
+        self.participants_status.SetLabel("Wyszukiwanie...")
+        # Starting a new search cancels the previous one
+        tg_client.fetch_chat_members(self.filter_chat_id, self.participant_query)
+
+    def on_participants_page(self, search, page, done):
+        """Called by logic callback for every page of participants."""
+        if not getattr(self, 'lst_participants', None) or search != self.participant_query:
+            return # Stale page from a previous search or view
+        if page:
+            self.participant_list.extend(page)
+            self.lst_participants.Append([p['name'] for p in page])
+        if done:
+            if self.participant_list:
+                self.participants_status.SetLabel(f"Znaleziono osób: {len(self.participant_list)}")
+            else:
+                self.participants_status.SetLabel("Nie znaleziono nikogo.")
+        else:
+            self.participants_status.SetLabel(f"Wczytano osób: {len(self.participant_list)}...")
+
+    def on_filter_cancel(self, event):
+        tg_client.cancel_member_fetch()
+        self.setup_main_view()
+
+    # --- VIEW 3: JOB QUEUE AND PROGRESS ---
+    def setup_jobs_view(self):
+        """Progress of the running export and the persistent job queue with pause/resume/cancel."""
         self.panel.DestroyChildren()
         self.sizer.Clear(True)
         
-        self.status_lbl = wx.StaticText(self.panel, label="Inicjalizacja...")
+        self.status_lbl = wx.StaticText(self.panel, label="Oczekiwanie na zadanie...")
         font = self.status_lbl.GetFont()
         font.SetPointSize(10)
         self.status_lbl.SetFont(font)
-        self.sizer.Add(self.status_lbl, flag=wx.ALIGN_CENTER|wx.TOP, border=40)
+        self.sizer.Add(self.status_lbl, flag=wx.ALIGN_CENTER|wx.TOP, border=20)
         
         self.gauge = wx.Gauge(self.panel, range=100, size=(400, 25))
-        self.gauge.Pulse() # Indeterminate mode initially
-        self.sizer.Add(self.gauge, flag=wx.ALIGN_CENTER|wx.ALL, border=20)
-        
-        self.panel.Layout()
-        self.SetTitle("Eksportowanie...")
+        self.sizer.Add(self.gauge, flag=wx.ALIGN_CENTER|wx.ALL, border=15)
+        
+        # Throughput and ETA
+        self.rate_lbl = wx.StaticText(self.panel, label="")
+        self.sizer.Add(self.rate_lbl, flag=wx.ALIGN_CENTER|wx.BOTTOM, border=10)
+        
+        # Several chats are exported at once - one status line per active chat
+        self.chat_status_lbl = wx.StaticText(self.panel, label="")
+        self.sizer.Add(self.chat_status_lbl, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=20)
+        
+        self.btn_stop_mirror = wx.Button(self.panel, label="&Zatrzymaj tryb lustra")
+        self.btn_stop_mirror.Bind(wx.EVT_BUTTON, self.on_stop_mirror)
+        self.sizer.Add(self.btn_stop_mirror, flag=wx.ALIGN_CENTER|wx.ALL, border=10)
+        
+        # Job queue
+        lbl_jobs = wx.StaticText(self.panel, label="&Kolejka zadań:")
+        self.sizer.Add(lbl_jobs, flag=wx.LEFT|wx.TOP, border=10)
+        self.lst_jobs = wx.ListCtrl(self.panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.BORDER_SUNKEN)
+        self.lst_jobs.InsertColumn(0, "Nr", width=40)
+        self.lst_jobs.InsertColumn(1, "Czaty", width=300)
+        self.lst_jobs.InsertColumn(2, "Stan", width=100)
+        self.lst_jobs.InsertColumn(3, "Postęp", width=160)
+        self.lst_jobs.Bind(wx.EVT_LIST_ITEM_SELECTED, lambda evt: self._update_job_buttons())
+        self.lst_jobs.Bind(wx.EVT_LIST_ITEM_DESELECTED, lambda evt: self._update_job_buttons())
+        self.sizer.Add(self.lst_jobs, proportion=1, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=10)
+        
+        hbox_jobs = wx.BoxSizer(wx.HORIZONTAL)
+        self.btn_pause_job = wx.Button(self.panel, label="&Wstrzymaj")
+        self.btn_resume_job = wx.Button(self.panel, label="W&znów")
+        self.btn_cancel_job = wx.Button(self.panel, label="&Anuluj")
+        self.btn_remove_job = wx.Button(self.panel, label="&Usuń z listy")
+        for button, action in ((self.btn_pause_job, tg_client.pause_job), (self.btn_resume_job, tg_client.resume_job),
+                               (self.btn_cancel_job, tg_client.cancel_job), (self.btn_remove_job, tg_client.remove_job)):
+            button.Bind(wx.EVT_BUTTON, lambda evt, action=action: self.on_job_action(action))
+            hbox_jobs.Add(button, flag=wx.RIGHT, border=5)
+        self.sizer.Add(hbox_jobs, flag=wx.ALL, border=10)
+        
+        btn_new = wx.Button(self.panel, label="&Nowy eksport")
+        btn_new.Bind(wx.EVT_BUTTON, lambda evt: self.setup_main_view())
+        self.sizer.Add(btn_new, flag=wx.ALIGN_CENTER|wx.BOTTOM, border=15)
+        
+        self.refresh_jobs()
+        self.lst_jobs.SetFocus()
+        self.SetTitle("Kolejka zadań")
 
     # --- LOGIC & EVENTS ---
 
-    def toggle_all_items(self, list_ctrl, state):
-        for i in range(list_ctrl.GetItemCount()):
-            list_ctrl.CheckItem(i, state)
+    def check_all_chats(self, state):
+        self.chat_model.check_all(state)
+        self.lst_chats.refresh()
 
     def load_chats_to_list(self, dialogs):
+        # Called several times (cache, then server pages); checks are kept by chat id
         self.chat_objects = dialogs
-        if hasattr(self, 'lst_chats'): # Update if on main view
-            self._fill_chat_list()
-        
-    def _fill_chat_list(self):
-        self.lst_chats.DeleteAllItems()
-        for d in self.chat_objects:
-            label = d['title']
-            if d['is_group']: label += " [Grupa]"
-            if d['is_channel']: label += " [Kanał]"
-            self.lst_chats.InsertItem(self.lst_chats.GetItemCount(), label)
-        self.SetTitle(f"Gotowe - {len(self.chat_objects)} czatów")
+        self.chat_model.set_dialogs(dialogs)
+        if getattr(self, 'lst_chats', None): # Update if on main view
+            self.lst_chats.refresh()
+            self.SetTitle(f"Gotowe - {len(self.chat_objects)} czatów")
+
+    def on_filter_changed(self, event):
+        self.chat_model.set_filter(self.txt_filter.GetValue())
+        self.lst_chats.refresh()
+
+    def on_sort_changed(self, event):
+        self.chat_model.set_sort(ChatListModel.SORT_KEYS[self.cb_sort.GetSelection()][1])
+        self.lst_chats.refresh()
 
     def on_export_click(self, event):
         # 1. Collect Chats
-        self.selected_chat_ids = []
-        for i in range(self.lst_chats.GetItemCount()):
-            if self.lst_chats.IsItemChecked(i):
-                self.selected_chat_ids.append(self.chat_objects[i]['id'])
-                
+        self.selected_chat_ids = self.chat_model.checked_ids()
+
         if not self.selected_chat_ids:
             wx.MessageBox("Wybierz przynajmniej jeden czat!", "Uwaga", wx.OK | wx.ICON_WARNING)
             return
@@ -275,19 +571,32 @@ class MainFrame(wx.Frame):
         if not has_type:
             wx.MessageBox("Wybierz co chcesz wyeksportować!", "Uwaga", wx.OK | wx.ICON_WARNING)
             return
+        if self.spin_max_size.GetValue():
+            self.export_opts['max_media_size'] = self.spin_max_size.GetValue() * 1024 * 1024
+        self.export_opts['download_order'] = self.DOWNLOAD_ORDERS[self.cb_download_order.GetSelection()][1]
+        for key, spin in (('bandwidth_limit', self.spin_bandwidth), ('download_budget', self.spin_budget),
+                          ('defer_size', self.spin_defer)):
+            if spin.GetValue():
+                self.export_opts[key] = spin.GetValue() * 1024 * 1024
+        mime_types = [t.strip() for t in self.txt_mime.GetValue().split(',') if t.strip()]
+        if mime_types:
+            self.export_opts['file_mime_types'] = mime_types
+        self.export_opts['takeout'] = self.chk_takeout.GetValue()
+        self.export_opts['mirror'] = self.chk_mirror.GetValue()
+        self.export_opts['media_archive'] = self.chk_media_archive.GetValue()
 
         # 3. Decision: Filter or Start?
         if len(self.selected_chat_ids) == 1:
             # Single chat -> Ask for participants
-            self.show_filter_loading()
-            tg_client.fetch_chat_members(self.selected_chat_ids[0])
+            self.setup_filter_view(self.selected_chat_ids[0])
         else:
-            # Multiple chats -> Go straight to export
-            self.setup_progress_view()
+            # Multiple chats -> Queue the export
             tg_client.start_export(self.selected_chat_ids, self.export_opts, filter_user_id=None)
+            self.setup_jobs_view()
 
     def on_start_filtered_export(self, event):
-        selection = self.cb_participants.GetSelection()
+        tg_client.cancel_member_fetch()
+        selection = self.lst_participants.GetSelection()
         user_filter = None
         
         # Index 0 is "ALL", so anything > 0 is a specific user
@@ -295,20 +604,119 @@ class MainFrame(wx.Frame):
             user_data = self.participant_list[selection - 1]
             user_filter = user_data['id']
             
-        self.setup_progress_view()
         tg_client.start_export(self.selected_chat_ids, self.export_opts, filter_user_id=user_filter)
+        self.setup_jobs_view()
+
+    def update_progress(self, progress):
+        """Called by logic at a fixed refresh rate with a ProgressSnapshot."""
+        if not getattr(self, 'status_lbl', None):
+            return
+        summary = f"Ukończono {progress.completed_chats} z {progress.total_chats} czatów"
+        if progress.percent is not None:
+            summary += f" ({progress.percent:.0f}%)"
+        self.status_lbl.SetLabel(summary)
+        self.SetTitle(summary)
+        
+        rate = f"{progress.messages_per_sec:.0f} wiad./s, {format_bytes(progress.bytes_per_sec)}/s"
+        if progress.total_messages is not None:
+            rate += f" - pozostało ok. {format_eta(progress.eta)}"
+        self.rate_lbl.SetLabel(rate)
+        
+        lines = []
+        for title, messages, total, percent in progress.active_chats:
+            if percent is None:
+                lines.append(f"{title}: {messages} wiadomości")
+            else:
+                lines.append(f"{title}: {percent:.0f}% ({messages} z {total})")
+        if progress.notice:
+            lines.append(progress.notice)
+        self.chat_status_lbl.SetLabel("\n".join(lines))
+        
+        if progress.percent is not None:
+            self.gauge.SetValue(int(progress.percent))
+        else:
+            self.gauge.Pulse() # Totals not known yet, keep it pulsing
+        self.panel.Layout()
 
-    def update_progress(self, current_chat_index, total_chats, message):
-        if hasattr(self, 'status_lbl'):
-             self.status_lbl.SetLabel(message)
-             self.SetTitle(message)
-             self.gauge.Pulse() # Keep it pulsing as we don't know total messages
+    def on_stop_mirror(self, event):
+        self.btn_stop_mirror.Disable()
+        self.status_lbl.SetLabel("Zatrzymywanie trybu lustra...")
+        tg_client.stop_mirror()
 
     def on_finished(self):
-        self.SetTitle("Eksport zakończony")
-        wx.MessageBox("Zadanie wykonane. Sprawdź folder export.", "Sukces", wx.OK)
-        # Return to main view
-        self.setup_main_view()
+        # Called once per finished job; the queue view is refreshed through on_jobs_changed
+        if getattr(self, 'status_lbl', None):
+            self.status_lbl.SetLabel("Zadanie zakończone")
+
+    def _jobs_button_label(self):
+        active = sum(1 for job in self.jobs if job['state'] in ACTIVE_STATES)
+        return f"&Kolejka zadań ({active} aktywnych)" if active else "&Kolejka zadań"
+
+    def on_jobs_changed(self, jobs):
+        finished = {job['id'] for job in jobs if job['state'] == DONE} - \
+                   {job['id'] for job in self.jobs if job['state'] == DONE}
+        self.jobs = jobs
+        if getattr(self, 'btn_jobs', None):
+            self.btn_jobs.SetLabel(self._jobs_button_label())
+        if getattr(self, 'lst_jobs', None):
+            self.refresh_jobs()
+            if finished and not any(job['state'] in ACTIVE_STATES for job in jobs):
+                self.SetTitle("Eksport zakończony")
+                wx.MessageBox("Wszystkie zadania wykonane. Sprawdź folder export.", "Sukces", wx.OK)
+
+    def refresh_jobs(self):
+        selected = self._selected_job()
+        self.lst_jobs.DeleteAllItems()
+        for job in self.jobs:
+            index = self.lst_jobs.InsertItem(self.lst_jobs.GetItemCount(), str(job['id']))
+            titles = job['titles'] or [str(chat_id) for chat_id in job['chat_ids']]
+            chats = ", ".join(titles[:3]) + (f" (+{len(titles) - 3})" if len(titles) > 3 else "")
+            self.lst_jobs.SetItem(index, 1, chats)
+            state = self.JOB_STATES.get(job['state'], job['state'])
+            if job['error']:
+                state += f": {job['error']}"
+            self.lst_jobs.SetItem(index, 2, state)
+            self.lst_jobs.SetItem(index, 3, self._job_progress(job))
+            if selected and job['id'] == selected['id']:
+                self.lst_jobs.Select(index)
+                self.lst_jobs.Focus(index)
+        running = [job for job in self.jobs if job['state'] in (RUNNING, MIRRORING)]
+        self.btn_stop_mirror.Show(any(job['options'].get('mirror') for job in running))
+        if not running:
+            self.gauge.SetValue(0)
+            self.rate_lbl.SetLabel("")
+            self.chat_status_lbl.SetLabel("")
+        self._update_job_buttons()
+        self.panel.Layout()
+
+    @staticmethod
+    def _job_progress(job):
+        progress = job['progress']
+        if not progress:
+            return ""
+        text = f"{progress['completed_chats']}/{progress['total_chats']} czatów, {progress['messages']} wiad."
+        if progress['percent'] is not None:
+            text = f"{progress['percent']:.0f}% - " + text
+        return text
+
+    def _selected_job(self):
+        if not getattr(self, 'lst_jobs', None):
+            return None
+        index = self.lst_jobs.GetFirstSelected()
+        return self.jobs[index] if 0 <= index < len(self.jobs) else None
+
+    def _update_job_buttons(self):
+        job = self._selected_job()
+        state = job['state'] if job else None
+        self.btn_pause_job.Enable(state in ACTIVE_STATES)
+        self.btn_resume_job.Enable(state in RESUMABLE_STATES)
+        self.btn_cancel_job.Enable(state in ACTIVE_STATES + (PAUSED,))
+        self.btn_remove_job.Enable(state is not None and state not in ACTIVE_STATES)
+
+    def on_job_action(self, action):
+        job = self._selected_job()
+        if job:
+            action(job['id'])
 
 if __name__ == '__main__':
     app = wx.App()
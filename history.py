@@ -0,0 +1,192 @@
+import asyncio
+from collections import deque
+
+from telethon.tl.types import (
+    InputMessagesFilterPhotos, InputMessagesFilterVoice, InputMessagesFilterVideo,
+    InputMessagesFilterRoundVideo, InputMessagesFilterDocument, InputMessagesFilterMusic,
+    InputMessagesFilterGif
+)
+
+# Liczba wiadomości zwracanych przez Telegram w jednym zapytaniu o historię
+HISTORY_PAGE_SIZE = 100
+
+# Tryb równoległy (opcja 'history_shards'): liczba id w jednym zakresie pobieranym osobno
+SHARD_SIZE = 2000
+# Czaty z mniejszą liczbą id do pobrania czytane są jednym strumieniem
+SHARD_MIN_IDS = 20000
+
+# Formaty eksportu, które potrzebują wszystkich wiadomości (nie tylko mediów)
+FULL_HISTORY_OPTIONS = ('text', 'jsonl', 'sqlite', 'html')
+
+# Opcje eksportu -> filtry serwerowe, które zwracają pasujące wiadomości
+# (pusta krotka: brak filtra, potrzebna pełna historia)
+MEDIA_FILTERS = {
+    'photos': (InputMessagesFilterPhotos,),
+    'voice': (InputMessagesFilterVoice,),
+    'video': (InputMessagesFilterVideo,),
+    'round': (InputMessagesFilterRoundVideo,),
+    'gifs': (InputMessagesFilterGif,),
+    'audio': (InputMessagesFilterMusic,),
+    'files': (InputMessagesFilterDocument,),
+    'stickers': (),
+}
+
+
+def history_filters(options):
+    """Zwraca filtry serwerowe dla opcji eksportu; [None] oznacza pełną historię.
+
+    Tekst, JSONL i archiwum wymagają przejrzenia wszystkich wiadomości, więc
+    filtrowanie po typie mediów jest możliwe tylko przy eksporcie samych mediów.
+    """
+    if any(options.get(key) for key in FULL_HISTORY_OPTIONS):
+        return [None]
+    filters = []
+    for key, filter_types in MEDIA_FILTERS.items():
+        if options.get(key):
+            if not filter_types:
+                return [None]
+            filters.extend(filter_type() for filter_type in filter_types)
+    return filters or [None]
+
+
+async def merge_streams(streams, reverse=False):
+    """Scala strumienie posortowane po id w jeden, pomijając duplikaty.
+
+    `reverse=False` oznacza kolejność jak w `iter_messages` (od najnowszych).
+    """
+    heads = {}
+
+    async def advance(i):
+        try:
+            heads[i] = await streams[i].__anext__()
+        except StopAsyncIteration:
+            heads.pop(i, None)
+
+    for i in range(len(streams)):
+        await advance(i)
+
+    pick_head = min if reverse else max
+    last_id = None
+    while heads:
+        i = pick_head(heads, key=lambda k: heads[k].id)
+        message = heads[i]
+        await advance(i)
+        if message.id != last_id:
+            last_id = message.id
+            yield message
+
+
+def iter_history(client, entity, options, from_user=None, **kwargs):
+    """Iteruje historię czatu z filtrami nadawcy i typu mediów po stronie serwera."""
+    streams = [
+        client.iter_messages(entity, from_user=from_user, filter=message_filter, **kwargs)
+        for message_filter in history_filters(options)
+    ]
+    if len(streams) == 1:
+        return streams[0]
+    return merge_streams(streams, reverse=kwargs.get('reverse', False))
+
+
+async def count_history(scheduler, client, entity, options, from_user=None):
+    """Liczba wiadomości pasujących do eksportu (zapytanie z limit=0 zwraca sam licznik).
+
+    Przy jednym filtrze (albo pełnej historii) wynik jest dokładny. Filtry
+    mediów mogą się pokrywać (np. dokumenty i wideo), a scalona historia
+    pomija duplikaty, więc suma jest górnym oszacowaniem - ograniczonym do
+    liczby wszystkich wiadomości czatu.
+    """
+    async def count(message_filter):
+        result = await scheduler.call(
+            lambda: client.get_messages(entity, limit=0, from_user=from_user, filter=message_filter)
+        )
+        return result.total
+
+    filters = history_filters(options)
+    total = 0
+    for message_filter in filters:
+        total += await count(message_filter)
+    if len(filters) > 1:
+        total = min(total, await count(None))
+    return total
+
+
+async def scheduled_history(scheduler, client, entity, options, from_user=None, min_id=0, max_id=0):
+    """Historia od najstarszych w ramach wspólnego budżetu zapytań.
+
+    Każde pobranie strony przechodzi przez `scheduler`. Po `FloodWaitError`
+    lub błędzie przejściowym strumień jest odtwarzany od ostatniej
+    otrzymanej wiadomości, więc nic nie jest pobierane dwa razy.
+    `max_id` (wyłącznie, 0 = bez ograniczenia) zamyka zakres od góry.
+    """
+    last_id = min_id
+    attempt = 0
+    while True:
+        stream = iter_history(client, entity, options, from_user=from_user, reverse=True,
+                              min_id=last_id, max_id=max_id)
+        received = 0
+        try:
+            while True:
+                if received % HISTORY_PAGE_SIZE == 0:
+                    async with scheduler:
+                        message = await stream.__anext__()
+                    scheduler.record_success()
+                    attempt = 0
+                else:
+                    message = await stream.__anext__()
+                received += 1
+                last_id = message.id
+                yield message
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            attempt += 1
+            await scheduler.handle_error(e, attempt)
+
+
+async def latest_message_id(scheduler, client, entity):
+    """Id najnowszej wiadomości czatu (0, jeśli czat jest pusty)."""
+    messages = await scheduler.call(lambda: client.get_messages(entity, limit=1))
+    return messages[0].id if messages else 0
+
+
+async def sharded_history(scheduler, client, entity, options, from_user=None, min_id=0, shards=1,
+                          shard_size=SHARD_SIZE):
+    """Historia od najstarszych pobierana kilkoma zakresami id jednocześnie.
+
+    Przedział od `min_id` do najnowszej wiadomości dzielony jest na zakresy
+    po `shard_size` id. Do `shards` kolejnych zakresów pobieranych jest
+    naraz (każdy przez `scheduled_history`, więc w ramach wspólnego budżetu
+    zapytań), a wiadomości oddawane są w kolejności zakresów - dla formatów
+    zapisu wygląda to jak jeden strumień. Okno zakresów ogranicza bufory do
+    około shards * shard_size wiadomości, więc nic nie trzeba zrzucać na
+    dysk. Ostatni zakres nie ma górnej granicy i obejmuje też
+    wiadomości wysłane w trakcie eksportu.
+    """
+    latest = await latest_message_id(scheduler, client, entity) if shards > 1 else 0
+    if latest - min_id < SHARD_MIN_IDS:
+        async for message in scheduled_history(scheduler, client, entity, options, from_user=from_user, min_id=min_id):
+            yield message
+        return
+
+    # Zakres (lo, hi) z wyłącznymi granicami obejmuje id lo+1 .. hi-1
+    starts = list(range(min_id, latest, shard_size))
+    ranges = [(start, start + shard_size + 1) for start in starts[:-1]] + [(starts[-1], 0)]
+
+    async def fetch(lo, hi):
+        return [message async for message in scheduled_history(scheduler, client, entity, options,
+                                                               from_user=from_user, min_id=lo, max_id=hi)]
+
+    window = deque()
+    next_range = 0
+    try:
+        while window or next_range < len(ranges):
+            while next_range < len(ranges) and len(window) < shards:
+                window.append(asyncio.ensure_future(fetch(*ranges[next_range])))
+                next_range += 1
+            for message in await window[0]:
+                yield message
+            window.popleft()
+    finally:
+        for task in window:
+            task.cancel()
+        await asyncio.gather(*window, return_exceptions=True)
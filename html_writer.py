@@ -0,0 +1,256 @@
+import glob
+import html
+import json
+import os
+
+from media_archive import archive_volume
+
+# Liczba wiadomości na jednej stronie HTML
+HTML_PAGE_SIZE = 1000
+# Katalog stron w katalogu czatu
+HTML_DIR = 'html'
+# Podsumowania zamkniętych stron (do budowy spisu przy wznowieniu)
+PAGES_FILE = 'pages.json'
+
+STYLE = """body{font-family:sans-serif;max-width:50em;margin:0 auto;padding:1em;background:#f4f4f4}
+nav{margin:1em 0}nav a{margin-right:1em}
+.msg{background:#fff;border-radius:6px;padding:.5em .8em;margin:.4em 0}
+.meta{color:#666;font-size:.85em}.sender{font-weight:bold;color:#246}
+.edited,.deleted,.reply,.archive{color:#888;font-size:.85em}.text{white-space:pre-wrap;margin-top:.2em}
+img,video{max-width:100%;max-height:30em;display:block;margin-top:.3em}
+table{border-collapse:collapse}td{padding:.2em .8em}
+"""
+
+
+def _page_name(page):
+    return f"page_{page:06d}.html"
+
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def _media_html(media, media_path):
+    """Odnośnik do pobranego pliku: obraz, odtwarzacz audio/wideo albo zwykły link.
+
+    Pliki z archiwum mediów (`media-0001.zip/photos/...`) dostają zwykły
+    link z nazwą tomu - działa po rozpakowaniu tomu w katalogu czatu.
+    """
+    if not media_path:
+        return ''
+    media_path = media_path.replace(os.sep, '/')
+    volume = archive_volume(media_path)
+    if volume:
+        inner = media_path[len(volume) + 1:]
+        name = (media or {}).get('name') or os.path.basename(inner)
+        return (f'<a href="{html.escape("../" + inner, quote=True)}">{html.escape(name)}</a> '
+                f'<span class="archive">(w archiwum {html.escape(volume)})</span>')
+    src = html.escape('../' + media_path, quote=True)
+    mime_type = (media or {}).get('mime_type') or ''
+    if (media or {}).get('type') == 'photo' or mime_type.startswith('image/'):
+        return f'<a href="{src}"><img src="{src}" loading="lazy" alt=""></a>'
+    if mime_type.startswith('audio/'):
+        return f'<audio controls preload="none" src="{src}"></audio>'
+    if mime_type.startswith('video/'):
+        return f'<video controls preload="none" src="{src}"></video>'
+    name = (media or {}).get('name') or os.path.basename(media_path)
+    return f'<a href="{src}">{html.escape(name)}</a>'
+
+
+class HtmlWriter:
+    """Strony HTML do przeglądania w przeglądarce (`html/index.html`).
+
+    Wiadomości dopisywane są strumieniowo do bieżącej strony; po
+    HTML_PAGE_SIZE wiadomościach strona jest zamykana (stopka z odnośnikiem
+    do następnej), a spis stron odświeżany. W pamięci jest tylko bieżąca
+    strona i krótkie podsumowania stron, więc zużycie pamięci nie rośnie
+    z rozmiarem czatu. Pozycja do wznowienia to numer strony, przesunięcie
+    w jej pliku i liczba wiadomości na niej - przy wznowieniu strona jest
+    przycinana do zatwierdzonej pozycji (bez stopki) i dopisywana dalej.
+    Media osadzane są przez ścieżki względne do katalogu czatu.
+
+    Wiadomości zapisywane są rosnąco po id, więc id pierwszej wiadomości
+    każdej strony wystarcza, żeby odpowiedź prowadziła na właściwą stronę.
+    Edycje i usunięcia (tryb lustra) dopisywane są na bieżącej stronie
+    z oznaczeniem "(edytowano)" albo "(usunięto)".
+    """
+
+    name = 'html'
+
+    def __init__(self, chat_dir, title, page_size=HTML_PAGE_SIZE):
+        self.dir = os.path.join(chat_dir, HTML_DIR)
+        self.title = title
+        self.page_size = page_size
+        self.page = 1
+        self.count = 0
+        self.first_id = None
+        self.first_date = None
+        self.last_date = None
+        # Podsumowania zamkniętych stron: {'page', 'count', 'first', 'last', 'first_id'}
+        self.pages = []
+        self._file = None
+
+    def _path(self, page):
+        return os.path.join(self.dir, _page_name(page))
+
+    def can_resume(self, position):
+        if not position:
+            return False
+        path = self._path(position['page'])
+        return os.path.exists(path) and os.path.getsize(path) >= position['offset']
+
+    def open(self, position=None):
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, 'style.css'), 'w', encoding='utf-8') as f:
+            f.write(STYLE)
+        if position is None:
+            for path in glob.glob(os.path.join(self.dir, 'page_*.html')):
+                os.remove(path)
+            self.pages = []
+            self._start_page(1)
+            return
+        self.page = position['page']
+        self.count = position['count']
+        self.first_id = position.get('first_id')
+        self.first_date = position.get('first')
+        self.last_date = position.get('last')
+        self.pages = self._load_pages()[:self.page - 1]
+        path = self._path(self.page)
+        os.truncate(path, position['offset'])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load_pages(self):
+        try:
+            with open(os.path.join(self.dir, PAGES_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _start_page(self, page):
+        self.page = page
+        self.count = 0
+        self.first_id = None
+        self.first_date = None
+        self.last_date = None
+        self._file = open(self._path(page), 'w', encoding='utf-8')
+        title = html.escape(self.title)
+        nav = '<a href="index.html">Spis stron</a>'
+        if page > 1:
+            nav += f' <a href="{_page_name(page - 1)}">&larr; Poprzednia</a>'
+        self._file.write(
+            f'<!DOCTYPE html>\n<html lang="pl"><head><meta charset="utf-8">'
+            f'<title>{title} - strona {page}</title><link rel="stylesheet" href="style.css"></head>\n'
+            f'<body><h1>{title}</h1><p>Strona {page}</p><nav>{nav}</nav>\n'
+        )
+
+    def _finish_page(self, has_next):
+        nav = '<a href="index.html">Spis stron</a>'
+        if self.page > 1:
+            nav += f' <a href="{_page_name(self.page - 1)}">&larr; Poprzednia</a>'
+        if has_next:
+            nav += f' <a href="{_page_name(self.page + 1)}">Następna &rarr;</a>'
+        self._file.write(f'<nav>{nav}</nav>\n</body></html>\n')
+        self._file.close()
+        self._file = None
+
+    def _summary(self):
+        return {'page': self.page, 'count': self.count, 'first': self.first_date, 'last': self.last_date,
+                'first_id': self.first_id}
+
+    def _write_index(self):
+        pages = self.pages + ([self._summary()] if self.count else [])
+        rows = ''.join(
+            f'<tr><td><a href="{_page_name(p["page"])}">Strona {p["page"]}</a></td>'
+            f'<td>{p["first"] or ""} &ndash; {p["last"] or ""}</td><td>{p["count"]} wiad.</td></tr>\n'
+            for p in pages
+        )
+        title = html.escape(self.title)
+        tmp_path = os.path.join(self.dir, 'index.html.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(
+                f'<!DOCTYPE html>\n<html lang="pl"><head><meta charset="utf-8"><title>{title}</title>'
+                f'<link rel="stylesheet" href="style.css"></head>\n<body><h1>{title}</h1>\n'
+                f'<table>\n{rows}</table>\n</body></html>\n'
+            )
+        os.replace(tmp_path, os.path.join(self.dir, 'index.html'))
+
+    def _save_pages(self):
+        tmp_path = os.path.join(self.dir, PAGES_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pages, f)
+        os.replace(tmp_path, os.path.join(self.dir, PAGES_FILE))
+
+    def _message_link(self, message_id):
+        """Odnośnik do wiadomości na stronie, na której została zapisana (None, jeśli jej nie ma w eksporcie)."""
+        if self.first_id is not None and message_id >= self.first_id:
+            return f'#m{message_id}'
+        for summary in reversed(self.pages):
+            # Strony ze starszych eksportów i strony z samymi edycjami nie mają first_id
+            first_id = summary.get('first_id')
+            if first_id is not None and message_id >= first_id:
+                return f'{_page_name(summary["page"])}#m{message_id}'
+        return None
+
+    def _next_entry(self):
+        if self.count >= self.page_size:
+            # Strona pełna: stopka z odnośnikiem dalej, podsumowanie i spis, nowa strona
+            self._finish_page(has_next=True)
+            self.pages.append(self._summary())
+            self._save_pages()
+            self._write_index()
+            self._start_page(self.page + 1)
+        self.count += 1
+
+    def _write_message(self, record, edited=False):
+        self._next_entry()
+        if not edited and self.first_id is None:
+            self.first_id = record['id']
+
+        date_str = _format_date(record['edit_date'] if edited and record['edit_date'] else record['date'])
+        self.first_date = self.first_date or date_str
+        self.last_date = date_str
+
+        parts = [f'<div class="msg" id="m{record["id"]}"><div class="meta">'
+                 f'<span class="sender">{html.escape(record["sender"] or "")}</span> {date_str}']
+        if edited:
+            parts.append(' <span class="edited">(edytowano)</span>')
+        parts.append('</div>')
+        if record['reply_to']:
+            link = self._message_link(record['reply_to'])
+            target = f'#{record["reply_to"]}'
+            if link:
+                target = f'<a href="{html.escape(link, quote=True)}">{target}</a>'
+            parts.append(f'<div class="reply">w odpowiedzi na {target}</div>')
+        if record['text']:
+            parts.append(f'<div class="text">{html.escape(record["text"])}</div>')
+        parts.append(_media_html(record['media'], record['media_path']))
+        parts.append('</div>\n')
+        self._file.write(''.join(parts))
+
+    def write(self, record):
+        self._write_message(record)
+
+    def edit(self, record):
+        self._write_message(record, edited=True)
+
+    def delete(self, chat_id, message_ids):
+        for message_id in message_ids:
+            self._next_entry()
+            link = self._message_link(message_id)
+            target = f'#{message_id}'
+            if link:
+                target = f'<a href="{html.escape(link, quote=True)}">{target}</a>'
+            self._file.write(f'<div class="msg"><div class="meta">wiadomość {target} '
+                             f'<span class="deleted">(usunięto)</span></div></div>\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def position(self):
+        return {'page': self.page, 'offset': self._file.tell(), 'count': self.count,
+                'first': self.first_date, 'last': self.last_date, 'first_id': self.first_id}
+
+    def close(self):
+        if self._file:
+            self._finish_page(has_next=False)
+            self._write_index()
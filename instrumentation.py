@@ -0,0 +1,142 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Katalog raportów (wewnątrz katalogu eksportu)
+REPORT_DIR = '.reports'
+# Przy profilowaniu: wywołania pętli asyncio dłuższe niż tyle sekund są zgłaszane jako blokujące
+SLOW_CALLBACK_SECONDS = 0.1
+
+
+class StageStats:
+    """Czas etapu: liczba wywołań, suma i maksimum (w sekundach)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 3),
+            'avg_ms': round(1000 * self.total / self.count, 3) if self.count else 0,
+            'max_ms': round(1000 * self.max, 3),
+        }
+
+
+class Instrumentation:
+    """Czasy etapów, liczniki i głębokości kolejek jednego eksportu.
+
+    Etapy mierzone są czasem ściennym (`with stats.stage('write'):`), więc
+    obejmują też oczekiwanie na sieć; to pozwala wskazać, na co eksport
+    czeka. Wszystko działa w wątku pętli asyncio, bez blokad.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.queues = {}
+        self.started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        stats.add(seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_queue(self, name, depth):
+        """Zapamiętuje głębokość kolejki (maksimum i średnią z obserwacji)."""
+        observed = self.queues.get(name)
+        if observed is None:
+            observed = self.queues[name] = {'samples': 0, 'sum': 0, 'max': 0}
+        observed['samples'] += 1
+        observed['sum'] += depth
+        observed['max'] = max(observed['max'], depth)
+
+    async def timed_iter(self, name, iterator):
+        """Przekazuje elementy iteratora asynchronicznego, mierząc czas oczekiwania na każdy."""
+        iterator = iterator.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def report(self, **extra):
+        queues = {
+            name: {'max': q['max'], 'avg': round(q['sum'] / q['samples'], 2) if q['samples'] else 0}
+            for name, q in self.queues.items()
+        }
+        report = {
+            'elapsed_s': round(time.monotonic() - self.started, 3),
+            'stages': {name: stats.to_dict() for name, stats in sorted(self.stages.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'queues': queues,
+        }
+        report.update(extra)
+        return report
+
+
+def report_path(export_dir, suffix):
+    """Ścieżka nowego pliku raportu (`.reports/export_RRRRMMDD-GGMMSS.<suffix>`)."""
+    report_dir = os.path.join(export_dir, REPORT_DIR)
+    os.makedirs(report_dir, exist_ok=True)
+    return os.path.join(report_dir, f"export_{datetime.now().strftime('%Y%m%d-%H%M%S')}.{suffix}")
+
+
+def save_report(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+class Profiler:
+    """Opcjonalne profilowanie eksportu (opcja 'profile').
+
+    cProfile obejmuje wątek pętli asyncio, w którym działają wszystkie
+    zadania eksportu; tryb debug pętli zgłasza wywołania blokujące ją
+    dłużej niż SLOW_CALLBACK_SECONDS. Wynik (`.prof`) można obejrzeć
+    przez `python -m pstats` albo snakeviz.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.profile = cProfile.Profile()
+        self._debug = loop.get_debug()
+        self._slow_callback = loop.slow_callback_duration
+
+    def start(self):
+        self.loop.set_debug(True)
+        self.loop.slow_callback_duration = SLOW_CALLBACK_SECONDS
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.loop.set_debug(self._debug)
+        self.loop.slow_callback_duration = self._slow_callback
+
+    def save(self, path):
+        self.profile.dump_stats(path)
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+
+from progress import ExportProgress
+
+# Plik z zadaniami eksportu (w katalogu eksportu)
+JOBS_FILE = '.jobs.json'
+# Domyślna liczba zadań wykonywanych jednocześnie (wspólny budżet zapytań i tak je spowalnia)
+JOB_CONCURRENCY = 1
+# Co ile sekund zapisywać postęp trwających zadań
+JOB_SAVE_INTERVAL = 30
+
+# Stany zadania
+QUEUED = 'queued'
+RUNNING = 'running'
+# Historia wyeksportowana, trwa tryb lustra - zadanie nie zajmuje miejsca w kolejce
+MIRRORING = 'mirroring'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+# Stany, z których zadanie można wznowić (`resume`) i usunąć z listy (`remove`)
+RESUMABLE_STATES = (PAUSED, CANCELLED, FAILED)
+# Zadania czekające albo trwające (także w trybie lustra)
+ACTIVE_STATES = (QUEUED, RUNNING, MIRRORING)
+
+
+def progress_summary(snapshot):
+    """Krótki, zapisywalny w JSON opis postępu zadania."""
+    return {
+        'messages': snapshot.messages,
+        'total_messages': snapshot.total_messages,
+        'completed_chats': snapshot.completed_chats,
+        'total_chats': snapshot.total_chats,
+        'percent': round(snapshot.percent, 1) if snapshot.percent is not None else None,
+    }
+
+
+class ExportJob:
+    """Zadanie eksportu: wybrane czaty z opcjami, stan i ostatni znany postęp."""
+
+    def __init__(self, job_id, chat_ids, options, filter_user_id=None, titles=None, state=QUEUED,
+                 created=None, progress=None, error=None):
+        self.id = job_id
+        self.chat_ids = list(chat_ids)
+        self.options = dict(options)
+        self.filter_user_id = filter_user_id
+        # Nazwy czatów z chwili dodania (do wyświetlania, zanim lista czatów się wczyta)
+        self.titles = list(titles or [])
+        self.state = state
+        self.created = created or time.time()
+        self.progress = progress or {}
+        self.error = error
+        # Stan ustawiany po przerwaniu zadania (PAUSED albo CANCELLED); None - przerwanie z zewnątrz
+        self.stop_state = None
+        self.task = None
+        self.export_progress = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'chat_ids': self.chat_ids,
+            'options': self.options,
+            'filter_user_id': self.filter_user_id,
+            'titles': self.titles,
+            'state': self.state,
+            'created': self.created,
+            'progress': self.progress,
+            'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['chat_ids'], data['options'], data.get('filter_user_id'), data.get('titles'),
+                   data.get('state', QUEUED), data.get('created'), data.get('progress'), data.get('error'))
+
+
+class JobManager:
+    """Trwała kolejka zadań eksportu wykonywana w pętli asyncio klienta.
+
+    Zadania uruchamiane są w kolejności dodania, najwyżej `concurrency`
+    naraz, przez korutynę `run_job(job)`. Zadanie z trybem lustra działa
+    aż do jego zatrzymania, więc po eksporcie historii zwalnia miejsce
+    (`mirroring`) i nie wstrzymuje kolejnych zadań. Lista zadań ze stanem i postępem
+    zapisywana jest w `path` (None - bez zapisu, np. w CLI). Wstrzymanie
+    i anulowanie przerywają zadanie (CancelledError): czaty zapisują bufory
+    i zatwierdzają punkty kontrolne, więc wznowione zadanie - także po
+    ponownym uruchomieniu aplikacji - kontynuuje od miejsca przerwania.
+    Zadania przerwane zamknięciem aplikacji (także w trybie lustra) wracają
+    do kolejki przy `load()`.
+
+    Metody wywołuje się w wątku pętli asyncio; `on_change(jobs)` dostaje
+    listę słowników po każdej zmianie.
+    """
+
+    def __init__(self, run_job, path=None, concurrency=JOB_CONCURRENCY, on_change=None):
+        self.run_job = run_job
+        self.path = path
+        self.concurrency = max(1, concurrency)
+        self.on_change = on_change
+        self.jobs = []
+        self.user_id = None
+        self.started = False
+
+    def load(self, user_id):
+        """Wczytuje zadania użytkownika; przerwane w trakcie wracają do kolejki."""
+        self.user_id = user_id
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Nie udało się wczytać zadań eksportu: {e}")
+            return
+        if data.get('user_id') != user_id:
+            return
+        for item in data.get('jobs', []):
+            job = ExportJob.from_dict(item)
+            if job.state in (RUNNING, MIRRORING):
+                job.state = QUEUED
+            self.jobs.append(job)
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'user_id': self.user_id, 'jobs': [job.to_dict() for job in self.jobs]}, f,
+                          ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Nie udało się zapisać zadań eksportu: {e}")
+
+    def _changed(self):
+        self.save()
+        if self.on_change:
+            self.on_change([job.to_dict() for job in self.jobs])
+
+    def start(self):
+        """Zaczyna uruchamiać zadania z kolejki (po wczytaniu listy czatów)."""
+        self.started = True
+        self._changed()
+        self._schedule()
+
+    def get(self, job_id):
+        for job in self.jobs:
+            if job.id == job_id:
+                return job
+        return None
+
+    def submit(self, chat_ids, options, filter_user_id=None, titles=None):
+        """Dodaje zadanie na koniec kolejki i zwraca je."""
+        job_id = max((job.id for job in self.jobs), default=0) + 1
+        job = ExportJob(job_id, chat_ids, options, filter_user_id, titles)
+        self.jobs.append(job)
+        self._changed()
+        self._schedule()
+        return job
+
+    def pause(self, job_id):
+        self._stop(job_id, PAUSED)
+
+    def cancel(self, job_id):
+        self._stop(job_id, CANCELLED)
+
+    def _stop(self, job_id, state):
+        job = self.get(job_id)
+        if job is None:
+            return
+        if job.state in (RUNNING, MIRRORING):
+            # Stan ustawi `_run` po zapisaniu buforów i punktów kontrolnych
+            job.stop_state = state
+            job.task.cancel()
+        elif job.state == QUEUED or (job.state == PAUSED and state == CANCELLED):
+            job.state = state
+            self._changed()
+
+    def resume(self, job_id):
+        """Ponownie kolejkuje wstrzymane, anulowane lub nieudane zadanie."""
+        job = self.get(job_id)
+        if job is None or job.state not in RESUMABLE_STATES:
+            return
+        job.state = QUEUED
+        job.error = None
+        self._changed()
+        self._schedule()
+
+    def remove(self, job_id):
+        """Usuwa z listy zadanie, które nie jest w kolejce ani w trakcie."""
+        job = self.get(job_id)
+        if job is not None and job.state not in ACTIVE_STATES:
+            self.jobs.remove(job)
+            self._changed()
+
+    def active(self):
+        """Czy jakieś zadanie czeka w kolejce albo trwa."""
+        return any(job.state in ACTIVE_STATES for job in self.jobs)
+
+    def mirroring(self, job):
+        """Zadanie przeszło do trybu lustra: zwalnia miejsce dla kolejnych zadań z kolejki."""
+        if job.state == RUNNING:
+            job.state = MIRRORING
+            self._changed()
+            self._schedule()
+
+    def _schedule(self):
+        if not self.started:
+            return
+        running = sum(1 for job in self.jobs if job.state == RUNNING)
+        for job in self.jobs:
+            if running >= self.concurrency:
+                break
+            if job.state == QUEUED:
+                job.state = RUNNING
+                job.stop_state = None
+                job.export_progress = ExportProgress(len(job.chat_ids))
+                job.task = asyncio.ensure_future(self._run(job))
+                running += 1
+                self._changed()
+
+    async def _run(self, job):
+        saver = asyncio.ensure_future(self._save_progress(job))
+        try:
+            await self.run_job(job)
+            job.state = DONE
+        except asyncio.CancelledError:
+            # Przerwanie z zewnątrz (np. zamykanie pętli) - zadanie zostanie wznowione przy następnym starcie
+            job.state = job.stop_state or QUEUED
+            if job.stop_state is None:
+                raise
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            saver.cancel()
+            job.progress = progress_summary(job.export_progress.snapshot())
+            job.task = None
+            job.export_progress = None
+            self._changed()
+        self._schedule()
+
+    async def _save_progress(self, job):
+        """Okresowo zapisuje postęp trwającego zadania."""
+        while True:
+            await asyncio.sleep(JOB_SAVE_INTERVAL)
+            job.progress = progress_summary(job.export_progress.snapshot())
+            self._changed()
@@ -0,0 +1,161 @@
+import asyncio
+import glob
+import io
+import os
+import re
+import time
+import zipfile
+
+from media_store import reserve_name
+
+# Tomy archiwum mediów w katalogu czatu: media-0001.zip, media-0002.zip, ...
+ARCHIVE_PREFIX = 'media-'
+ARCHIVE_SUFFIX = '.zip'
+# Tom jest zamykany (i punkt kontrolny zatwierdzany) po przekroczeniu rozmiaru albo czasu
+ARCHIVE_VOLUME_SIZE = 2 * 1024 * 1024 * 1024
+ARCHIVE_VOLUME_SECONDS = 15 * 60
+# Rozmiar kawałka przy przepisywaniu pliku do archiwum
+COPY_CHUNK = 1024 * 1024
+
+_VOLUME_RE = re.compile(re.escape(ARCHIVE_PREFIX) + r'(\d+)' + re.escape(ARCHIVE_SUFFIX) + '$')
+
+
+def archive_volume(rel_path):
+    """Nazwa tomu, jeśli ścieżka z manifestu wskazuje plik w archiwum (np. "media-0001.zip/photos/a.jpg")."""
+    first = rel_path.replace('\\', '/').split('/', 1)[0]
+    return first if _VOLUME_RE.match(first) else None
+
+
+class MediaArchive:
+    """Media czatu zapisywane strumieniowo do archiwów ZIP zamiast luźnych plików.
+
+    Pliki trafiają do bieżącego tomu (`media-NNNN.zip.part`) pod tymi samymi
+    ścieżkami co w zwykłym eksporcie (`photos/...`, `voice/...`), więc
+    rozpakowanie tomów w katalogu czatu odtwarza zwykły układ. Tom jest
+    przemianowywany na `.zip` dopiero po zamknięciu - centralny katalog ZIP
+    pozwala wtedy wypakować dowolny plik bez rozpakowywania reszty.
+    Niedokończone tomy (przerwany eksport) są usuwane przy otwarciu; punkt
+    kontrolny czatu zatwierdzany jest tylko po zamknięciu tomu, więc ich
+    zawartość zostanie pobrana ponownie.
+
+    Zapis do ZIP odbywa się w wątku roboczym pod blokadą (jeden wpis naraz),
+    a pobieranie - równolegle, do pamięci; tylko duże pliki przechodzą przez
+    plik tymczasowy (pobieranie kawałkami ze wznawianiem).
+    """
+
+    def __init__(self, chat_dir):
+        self.chat_dir = chat_dir
+        self.names = set()
+        self.volume = 0
+        self.size = 0
+        self.opened_at = None
+        self._zip = None
+        self._lock = asyncio.Lock()
+
+    def _volume_name(self, volume):
+        return f"{ARCHIVE_PREFIX}{volume:04d}{ARCHIVE_SUFFIX}"
+
+    def open(self):
+        """Usuwa niedokończone tomy i wczytuje nazwy plików z zamkniętych (tom otwierany przy pierwszym pliku)."""
+        for path in glob.glob(os.path.join(self.chat_dir, ARCHIVE_PREFIX + '*' + ARCHIVE_SUFFIX + '.part')):
+            os.remove(path)
+        for path in glob.glob(os.path.join(self.chat_dir, ARCHIVE_PREFIX + '*' + ARCHIVE_SUFFIX)):
+            match = _VOLUME_RE.match(os.path.basename(path))
+            if not match:
+                continue
+            self.volume = max(self.volume, int(match.group(1)))
+            try:
+                with zipfile.ZipFile(path) as zf:
+                    self.names.update(zf.namelist())
+            except zipfile.BadZipFile as e:
+                print(f"Uszkodzone archiwum {path}: {e}")
+
+    def _part_path(self):
+        return os.path.join(self.chat_dir, self._volume_name(self.volume) + '.part')
+
+    def _ensure_volume(self):
+        if self._zip is None:
+            self.volume += 1
+            self._zip = zipfile.ZipFile(self._part_path(), 'w', zipfile.ZIP_STORED, allowZip64=True)
+            self.size = 0
+            self.opened_at = time.monotonic()
+
+    def reserve_name(self, arcname, message_id):
+        """Wolna nazwa w archiwum, zajmowana od razu (przy kolejkowaniu pliku).
+
+        Równoległe pobrania plików o tej samej nazwie jej nie dzielą, a
+        ostateczna ścieżka (`archive_path`) jest znana, zanim trafi do zapisu
+        wiadomości.
+        """
+        return reserve_name(self.names, arcname, message_id)
+
+    def archive_path(self, arcname):
+        """Ścieżka w manifeście (względem katalogu czatu) dla pliku dopisywanego teraz do archiwum.
+
+        Tom jest zamykany dopiero po pobraniu wszystkich zakolejkowanych
+        plików, więc to tom otwarty albo - jeśli żaden nie jest - następny.
+        """
+        volume = self.volume if self._zip is not None else self.volume + 1
+        return f"{self._volume_name(volume)}/{arcname}"
+
+    def _write_bytes(self, arcname, data):
+        self._ensure_volume()
+        # Media są już skompresowane (jpg, ogg, mp4) - zapis bez kompresji
+        self._zip.writestr(zipfile.ZipInfo(arcname, time.localtime()[:6]), data)
+        self.size += len(data)
+
+    def _write_file(self, arcname, path):
+        self._ensure_volume()
+        with open(path, 'rb') as src, self._zip.open(zipfile.ZipInfo(arcname, time.localtime()[:6]), 'w',
+                                                    force_zip64=True) as dst:
+            while True:
+                chunk = src.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                self.size += len(chunk)
+
+    async def _write(self, func, arcname, source):
+        async with self._lock:
+            await asyncio.get_event_loop().run_in_executor(None, func, arcname, source)
+            return os.path.join(self.chat_dir, self._volume_name(self.volume), arcname)
+
+    async def add(self, arcname, download):
+        """Pobiera plik do pamięci przez `download(file)` i dopisuje go do tomu pod zarezerwowaną nazwą."""
+        buffer = io.BytesIO()
+        await download(buffer)
+        return await self._write(self._write_bytes, arcname, buffer.getvalue())
+
+    async def add_file(self, arcname, path):
+        """Przenosi gotowy plik (np. duży, pobrany kawałkami) do tomu i usuwa go z dysku."""
+        result = await self._write(self._write_file, arcname, path)
+        os.remove(path)
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # W katalogu są jeszcze inne pobierane pliki
+        return result
+
+    def should_roll(self):
+        """Czy bieżący tom jest już na tyle duży lub stary, że warto go zamknąć."""
+        return self._zip is not None and (self.size >= ARCHIVE_VOLUME_SIZE
+                                          or time.monotonic() - self.opened_at >= ARCHIVE_VOLUME_SECONDS)
+
+    async def close_volume(self):
+        """Zamyka bieżący tom (centralny katalog) i nadaje mu docelową nazwę."""
+        async with self._lock:
+            if self._zip is None:
+                return
+            await asyncio.get_event_loop().run_in_executor(None, self._zip.close)
+            self._zip = None
+            part_path = self._part_path()
+            os.replace(part_path, part_path[:-len('.part')])
+
+    def abort(self):
+        """Porzuca niedokończony tom (np. po błędzie); jego pliki zostaną pobrane ponownie."""
+        if self._zip is not None:
+            try:
+                self._zip.close()
+            except Exception:
+                pass
+            self._zip = None
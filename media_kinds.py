@@ -0,0 +1,119 @@
+import fnmatch
+from enum import Enum
+
+from telethon.tl.types import (
+    MessageMediaPhoto, MessageMediaDocument, DocumentAttributeFilename, DocumentAttributeSticker,
+    DocumentAttributeAnimated, DocumentAttributeVideo, DocumentAttributeAudio
+)
+
+
+class MediaKind(Enum):
+    PHOTO = 'photo'
+    VOICE = 'voice'
+    VIDEO = 'video'
+    ROUND = 'round'
+    GIF = 'gif'
+    STICKER = 'sticker'
+    AUDIO = 'audio'
+    FILE = 'file'
+
+
+# Rodzaj mediów -> (opcja eksportu, podkatalog w katalogu czatu)
+KIND_OPTIONS = {
+    MediaKind.PHOTO: ('photos', 'photos'),
+    MediaKind.VOICE: ('voice', 'voice'),
+    MediaKind.VIDEO: ('video', 'videos'),
+    MediaKind.ROUND: ('round', 'round'),
+    MediaKind.GIF: ('gifs', 'gifs'),
+    MediaKind.STICKER: ('stickers', 'stickers'),
+    MediaKind.AUDIO: ('audio', 'audio'),
+    MediaKind.FILE: ('files', 'files'),
+}
+
+
+class MediaInfo:
+    """Wynik klasyfikacji mediów wiadomości.
+
+    `name` to oryginalna nazwa pliku (jeśli jest), a `prefix` - początek
+    nazwy nadawanej plikom bez niej (taki sam jak we wcześniejszych
+    eksportach: photo, video, audio albo document).
+    """
+
+    def __init__(self, kind, size, mime_type, name=None, prefix='document'):
+        self.kind = kind
+        self.size = size
+        self.mime_type = mime_type
+        self.name = name
+        self.prefix = prefix
+
+
+def classify(media):
+    """Rodzaj, rozmiar i nazwa mediów w jednym przejściu po atrybutach (None - brak pliku)."""
+    if isinstance(media, MessageMediaPhoto):
+        if media.photo is None:
+            return None
+        # PhotoSizeProgressive ma listę rozmiarów kolejnych przebiegów, PhotoSize - jeden rozmiar
+        size = max((max(getattr(s, 'sizes', None) or [getattr(s, 'size', 0) or 0])
+                    for s in media.photo.sizes), default=0)
+        return MediaInfo(MediaKind.PHOTO, size, 'image/jpeg', prefix='photo')
+    if not isinstance(media, MessageMediaDocument) or media.document is None:
+        return None
+
+    document = media.document
+    name = None
+    prefix = 'document'
+    sticker = animated = round_video = video = voice = audio = False
+    for attr in document.attributes:
+        if isinstance(attr, DocumentAttributeFilename):
+            name = attr.file_name or None
+        elif isinstance(attr, DocumentAttributeSticker):
+            sticker = True
+        elif isinstance(attr, DocumentAttributeAnimated):
+            animated = True
+        elif isinstance(attr, DocumentAttributeVideo):
+            video = True
+            round_video = bool(attr.round_message)
+            prefix = 'video'
+        elif isinstance(attr, DocumentAttributeAudio):
+            voice = bool(attr.voice)
+            audio = not voice
+            prefix = 'audio'
+
+    # Naklejki wideo i GIF-y mają też atrybut wideo, więc sprawdzane są najpierw
+    if sticker:
+        kind = MediaKind.STICKER
+    elif animated:
+        kind = MediaKind.GIF
+    elif round_video:
+        kind = MediaKind.ROUND
+    elif voice:
+        kind = MediaKind.VOICE
+    elif video:
+        kind = MediaKind.VIDEO
+    elif audio:
+        kind = MediaKind.AUDIO
+    else:
+        kind = MediaKind.FILE
+    return MediaInfo(kind, document.size or 0, document.mime_type, name, prefix)
+
+
+def export_subdir(options, info):
+    """Podkatalog dla mediów albo None, jeśli ich rodzaj nie jest eksportowany lub przekraczają limity.
+
+    Limity: `max_media_size` (bajty, dla wszystkich rodzajów) i `file_mime_types`
+    (wzorce typów MIME, np. "image/*", tylko dla zwykłych plików).
+    """
+    if info is None:
+        return None
+    option, subdir = KIND_OPTIONS[info.kind]
+    if not options.get(option):
+        return None
+    max_size = options.get('max_media_size')
+    if max_size and info.size > max_size:
+        return None
+    mime_types = options.get('file_mime_types')
+    if info.kind is MediaKind.FILE and mime_types:
+        mime_type = (info.mime_type or '').lower()
+        if not any(fnmatch.fnmatch(mime_type, pattern.lower()) for pattern in mime_types):
+            return None
+    return subdir
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+
+from telethon import utils
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+from media_kinds import classify
+
+# Katalog magazynu mediów (wewnątrz katalogu eksportu)
+MEDIA_STORE_DIR = '.media'
+
+
+def media_key(media):
+    """Klucz mediów w magazynie: id zdjęcia lub dokumentu Telegrama (albo None)."""
+    if isinstance(media, MessageMediaPhoto) and media.photo is not None:
+        return f"photo-{media.photo.id}"
+    if isinstance(media, MessageMediaDocument) and media.document is not None:
+        return f"doc-{media.document.id}"
+    return None
+
+
+def media_size(media):
+    """Rozmiar pliku mediów w bajtach (zdjęcie - największy wariant); 0, jeśli nieznany."""
+    info = classify(media)
+    return info.size if info else 0
+
+
+def media_file_name(message, info=None):
+    """Czytelna nazwa pliku w katalogu czatu: oryginalna albo z typu, daty i id wiadomości."""
+    info = info or classify(message.media)
+    if info.name:
+        return os.path.basename(info.name)
+    date_str = message.date.strftime('%Y-%m-%d_%H-%M-%S')
+    if isinstance(message.media, MessageMediaPhoto):
+        return f"photo_{date_str}_{message.id}.jpg"
+    return f"{info.prefix}_{date_str}_{message.id}{utils.get_extension(message.media)}"
+
+
+def reserve_name(names, path, message_id):
+    """Wolna ścieżka pliku spośród zajętych `names` (dopisywana do nich od razu).
+
+    Przy kolizji do nazwy dodawane jest id wiadomości: "plik (123).pdf",
+    a w razie potrzeby kolejny numer: "plik (123-2).pdf".
+    """
+    base, ext = os.path.splitext(path)
+    candidate = path
+    attempt = 1
+    while candidate in names:
+        suffix = message_id if attempt == 1 else f"{message_id}-{attempt}"
+        candidate = f"{base} ({suffix}){ext}"
+        attempt += 1
+    names.add(candidate)
+    return candidate
+
+
+def _same_file(path, stored_path):
+    try:
+        return os.path.samefile(path, stored_path)
+    except OSError:
+        return False
+
+
+class MediaStore:
+    """Magazyn mediów adresowany identyfikatorem Telegrama, wspólny dla wszystkich czatów.
+
+    Każdy plik pobierany jest raz do `.media/`, a w katalogach czatów
+    pojawia się jako twarde dowiązanie (albo symlink lub kopia, jeśli
+    system plików nie obsługuje dowiązań). Indeks SQLite pozwala pominąć
+    pobieranie mediów, które już są w magazynie.
+    """
+
+    def __init__(self, export_dir):
+        self.root = os.path.join(export_dir, MEDIA_STORE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.root, 'index.db'), isolation_level=None)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS media ("
+            " key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, access_hash INTEGER)"
+        )
+        self._inflight = {}
+        self.hits = 0
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, key):
+        """Ścieżka pliku w magazynie albo None, jeśli go brak."""
+        row = self.db.execute("SELECT path FROM media WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        return path if os.path.exists(path) else None
+
+    def _store_path(self, key, name):
+        # Podkatalogi po końcówce id, żeby nie trzymać setek tysięcy plików w jednym
+        shard_dir = os.path.join(self.root, key[-2:])
+        os.makedirs(shard_dir, exist_ok=True)
+        return os.path.join(shard_dir, key + os.path.splitext(name)[1].lower())
+
+    async def fetch(self, message, fetch_to):
+        """Zwraca ścieżkę mediów w magazynie, pobierając je przez `fetch_to(path)` tylko raz."""
+        key = media_key(message.media)
+        stored = self.lookup(key)
+        if stored is not None:
+            self.hits += 1
+            return stored
+        # To samo medium pobierane właśnie dla innego czatu - czekamy na wynik
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            path = self._store_path(key, media_file_name(message))
+            await fetch_to(path)
+            media = message.media
+            item = media.photo if isinstance(media, MessageMediaPhoto) else media.document
+            self.db.execute(
+                "INSERT OR REPLACE INTO media (key, path, size, access_hash) VALUES (?, ?, ?, ?)",
+                (key, os.path.relpath(path, self.root), os.path.getsize(path), item.access_hash)
+            )
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            # Zapobiega ostrzeżeniu o nieodebranym wyjątku, gdy nikt nie czekał
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def link(self, stored_path, target_dir, name):
+        """Umieszcza plik z magazynu w katalogu czatu pod podaną nazwą.
+
+        Nazwa jest ustalana (i rezerwowana) przy kolejkowaniu, więc plik pod
+        nią należy do tej wiadomości: jeśli to nie ten sam plik co w magazynie
+        (np. kopia sprzed przerwanego eksportu), jest zastępowany.
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, name)
+        if os.path.lexists(target):
+            if _same_file(target, stored_path):
+                return target
+            os.remove(target)
+        try:
+            os.link(stored_path, target)
+        except OSError:
+            try:
+                os.symlink(stored_path, target)
+            except OSError:
+                shutil.copy2(stored_path, target)
+        return target
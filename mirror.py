@@ -0,0 +1,140 @@
+import asyncio
+
+from telethon import events
+from chat_export import ChatExport
+
+# Co ile sekund sprawdzać stan połączenia (po ponownym połączeniu uzupełniamy lukę)
+MIRROR_WATCHDOG_INTERVAL = 10
+# Po ilu sekundach od zdarzenia zatwierdzać zmiany (zdarzenia z tego okresu idą razem)
+MIRROR_COMMIT_DELAY = 2
+
+
+class Mirror:
+    """Tryb lustra: eksport wybranych czatów aktualizowany zdarzeniami Telegrama.
+
+    Dla każdego czatu trzyma otwarty ChatExport. Nowe wiadomości są
+    dopisywane (id nie większe niż punkt kontrolny są pomijane), a edycje
+    i usunięcia przekazywane do formatów zapisu. Po starcie i po każdym
+    ponownym połączeniu historia od punktu kontrolnego jest uzupełniana,
+    więc wiadomości z czasu przerwy w połączeniu nie giną.
+    """
+
+    def __init__(self, client, ctx, dialogs, on_status=None):
+        self.client = client
+        self.chats = {dialog['id']: ChatExport(ctx, dialog) for dialog in dialogs}
+        self.on_status = on_status
+        self.received = 0
+        self._opened = []
+        self._handlers = []
+        self._commits = {}
+        self._watchdog = None
+
+    async def start(self):
+        for chat in self.chats.values():
+            chat.open()
+            self._opened.append(chat)
+        # Najpierw rejestrujemy zdarzenia, potem uzupełniamy lukę - nic nie wpadnie pomiędzy
+        chat_ids = list(self.chats)
+        self._handlers = [
+            (self._on_new_message, events.NewMessage(chats=chat_ids)),
+            (self._on_edited, events.MessageEdited(chats=chat_ids)),
+            # Usunięcia w czatach prywatnych i zwykłych grupach nie niosą id czatu
+            (self._on_deleted, events.MessageDeleted()),
+        ]
+        for callback, event in self._handlers:
+            self.client.add_event_handler(callback, event)
+        await self.fill_gaps()
+        self._watchdog = asyncio.ensure_future(self._watch_connection())
+        self._status("Tryb lustra: nasłuchiwanie nowych wiadomości")
+
+    async def stop(self):
+        for callback, event in self._handlers:
+            self.client.remove_event_handler(callback, event)
+        self._handlers = []
+        if self._watchdog:
+            self._watchdog.cancel()
+        for task in self._commits.values():
+            task.cancel()
+        self._commits = {}
+        for chat in self._opened:
+            async with chat.lock:
+                await chat.close()
+        self._opened = []
+
+    async def fill_gaps(self):
+        """Dopisuje wiadomości, które pojawiły się od ostatniego punktu kontrolnego."""
+        for chat in self.chats.values():
+            try:
+                async with chat.lock:
+                    async for message in chat.history():
+                        await chat.add(message)
+                        self.received += 1
+                    await chat.commit()
+            except Exception as e:
+                print(f"Błąd uzupełniania historii czatu {chat.title}: {e}")
+
+    async def _watch_connection(self):
+        connected = True
+        while True:
+            await asyncio.sleep(MIRROR_WATCHDOG_INTERVAL)
+            now_connected = self.client.is_connected()
+            if now_connected and not connected:
+                self._status("Tryb lustra: połączono ponownie, uzupełnianie historii...")
+                await self.fill_gaps()
+                self._status(f"Tryb lustra: {self.received} nowych wiadomości")
+            connected = now_connected
+
+    async def _on_new_message(self, event):
+        chat = self.chats.get(event.chat_id)
+        if chat is None:
+            return
+        async with chat.lock:
+            if event.message.id <= chat.last_id:
+                return
+            await chat.add(event.message)
+        self.received += 1
+        self._schedule_commit(chat)
+        self._status(f"Tryb lustra: {self.received} nowych wiadomości")
+
+    async def _on_edited(self, event):
+        chat = self.chats.get(event.chat_id)
+        if chat is None:
+            return
+        async with chat.lock:
+            await chat.edit(event.message)
+        self._schedule_commit(chat)
+
+    async def _on_deleted(self, event):
+        if event.chat_id is not None:
+            chats = [self.chats[event.chat_id]] if event.chat_id in self.chats else []
+        else:
+            # Bez id czatu: id wiadomości są unikalne w obrębie konta poza kanałami,
+            # a czat rozpoznaje je po indeksie wyeksportowanych wiadomości
+            chats = [c for c in self.chats.values() if not c.dialog['is_channel']]
+        for chat in chats:
+            async with chat.lock:
+                deleted = await chat.delete(event.deleted_ids)
+            if deleted:
+                self._schedule_commit(chat)
+
+    def _schedule_commit(self, chat):
+        if chat.dialog['id'] not in self._commits:
+            self._commits[chat.dialog['id']] = asyncio.ensure_future(self._delayed_commit(chat))
+
+    async def _delayed_commit(self, chat):
+        try:
+            # Zatwierdzamy, dopóki są niepobrane media (punkt kontrolny czeka na pobrania)
+            while True:
+                await asyncio.sleep(MIRROR_COMMIT_DELAY)
+                async with chat.lock:
+                    await chat.commit()
+                if not chat.downloader.pending:
+                    break
+        except Exception as e:
+            print(f"Błąd zapisu czatu {chat.title}: {e}")
+        finally:
+            self._commits.pop(chat.dialog['id'], None)
+
+    def _status(self, message):
+        if self.on_status:
+            self.on_status(message)
@@ -0,0 +1,92 @@
+from telethon.errors import ChatAdminRequiredError
+
+# Maksymalna liczba uczestników zwracana dla jednego zapytania (z wyszukiwaniem lub bez)
+PARTICIPANT_LIMIT = 1000
+# Rozmiar strony uczestników przekazywanej do GUI (i jednego zapytania do serwera)
+PARTICIPANT_PAGE = 200
+# Ile ostatnich wiadomości przejrzeć przy budowaniu indeksu nadawców z historii
+SENDER_SCAN_LIMIT = 5000
+
+
+def participant_info(entity, peer_id=None):
+    """Opis uczestnika dla GUI: id do filtrowania i czytelna nazwa."""
+    name = f"{getattr(entity, 'first_name', None) or ''} {getattr(entity, 'last_name', None) or ''}".strip()
+    if not name:
+        name = getattr(entity, 'title', None) or "Bez nazwy"
+    username = getattr(entity, 'username', None)
+    if username:
+        name += f" (@{username})"
+    return {'id': peer_id if peer_id is not None else entity.id, 'name': name}
+
+
+def _matches(participant, search):
+    return not search or search.casefold() in participant['name'].casefold()
+
+
+class ParticipantLoader:
+    """Uczestnicy czatu dla filtra nadawcy, zwracani stronami.
+
+    Najpierw pyta serwer (`iter_participants`, przy wyszukiwaniu z `search=`,
+    więc znalezienie osoby w wielkiej grupie nie wymaga pobrania całej listy).
+    Gdy lista członków jest ukryta albo serwer nic nie znalazł, przeszukuje
+    indeks nadawców zbudowany z ostatnich wiadomości czatu. Indeks powstaje
+    raz na czat, a kolejne wyszukiwania filtrują go lokalnie.
+    """
+
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+        self._hidden = set()
+        self._history_index = {}
+
+    async def pages(self, chat_id, peer, search=''):
+        found = False
+        if chat_id not in self._hidden:
+            page = []
+            participants = lambda: self.client.iter_participants(peer, limit=PARTICIPANT_LIMIT, search=search)
+            try:
+                async for user in self.scheduler.iterate(participants, page_size=PARTICIPANT_PAGE):
+                    if user.deleted: continue
+                    page.append(participant_info(user))
+                    if len(page) >= PARTICIPANT_PAGE:
+                        found = True
+                        yield page
+                        page = []
+            except ChatAdminRequiredError:
+                # Lista członków dostępna tylko dla administratorów
+                self._hidden.add(chat_id)
+            if page:
+                found = True
+                yield page
+            if not found and not search:
+                self._hidden.add(chat_id)
+        if not found:
+            async for page in self._history_pages(chat_id, peer, search):
+                yield page
+
+    async def _history_pages(self, chat_id, peer, search):
+        index = self._history_index.get(chat_id)
+        if index is not None:
+            matches = [p for p in index.values() if _matches(p, search)]
+            for start in range(0, len(matches), PARTICIPANT_PAGE):
+                yield matches[start:start + PARTICIPANT_PAGE]
+            return
+
+        # Strony trafiają do GUI w trakcie skanowania historii
+        index = {}
+        page = []
+        messages = lambda: self.client.iter_messages(peer, limit=SENDER_SCAN_LIMIT)
+        async for message in self.scheduler.iterate(messages):
+            sender = message.sender
+            if sender is None or message.sender_id in index or getattr(sender, 'deleted', False):
+                continue
+            info = participant_info(sender, message.sender_id)
+            index[message.sender_id] = info
+            if _matches(info, search):
+                page.append(info)
+                if len(page) >= PARTICIPANT_PAGE:
+                    yield page
+                    page = []
+        self._history_index[chat_id] = index
+        if page:
+            yield page
@@ -0,0 +1,155 @@
+import time
+from collections import deque
+
+# Co ile sekund przekazywać migawkę postępu do GUI i innych odbiorców
+PROGRESS_REFRESH = 0.5
+# Okno (w sekundach), z którego liczona jest bieżąca prędkość eksportu
+RATE_WINDOW = 30
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_eta(seconds):
+    """Czas do końca w czytelnej postaci ("1 h 05 min", "3 min", "< 1 min")."""
+    if seconds is None:
+        return "nieznany"
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "< 1 min"
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60:02d} min"
+
+
+class ChatProgress:
+    """Postęp eksportu jednego czatu.
+
+    `total` to liczba wiadomości pasujących do eksportu (z serwera, None
+    dopóki nieznana), `baseline` - ile z nich wyeksportowały poprzednie
+    eksporty przyrostowe, a `processed` - ile dodał bieżący eksport.
+    """
+
+    def __init__(self, index, title):
+        self.index = index
+        self.title = title
+        self.total = None
+        self.baseline = 0
+        self.processed = 0
+        self.expected_bytes = 0
+        self.bytes = 0
+        self.started = False
+        self.done = False
+
+    @property
+    def messages(self):
+        return self.baseline + self.processed
+
+    @property
+    def exported(self):
+        """Wyeksportowane wiadomości ograniczone do `total` (zakończony czat - całość)."""
+        if self.total is None:
+            return self.messages
+        return self.total if self.done else min(self.messages, self.total)
+
+    @property
+    def percent(self):
+        if self.done:
+            return 100.0
+        if not self.total:
+            return None
+        return 100.0 * self.exported / self.total
+
+
+class ProgressSnapshot:
+    """Stan całego eksportu w jednej chwili - to dostają GUI i odbiorcy postępu."""
+
+    def __init__(self, total_chats, completed_chats, active_chats, messages, total_messages,
+                 bytes_done, expected_bytes, messages_per_sec, bytes_per_sec, percent, eta, elapsed, notice):
+        self.total_chats = total_chats
+        self.completed_chats = completed_chats
+        # Czaty w trakcie eksportu: lista (tytuł, wiadomości, total, procent)
+        self.active_chats = active_chats
+        self.messages = messages
+        self.total_messages = total_messages
+        self.bytes = bytes_done
+        self.expected_bytes = expected_bytes
+        self.messages_per_sec = messages_per_sec
+        self.bytes_per_sec = bytes_per_sec
+        # Procent całości (None, dopóki nie są znane liczby wiadomości) i szacowany czas do końca w sekundach
+        self.percent = percent
+        self.eta = eta
+        self.elapsed = elapsed
+        self.notice = notice
+
+
+class ExportProgress:
+    """Zbiera postęp wszystkich czatów eksportu i liczy prędkość oraz ETA.
+
+    Liczniki są zwykłymi polami aktualizowanymi w pętli asyncio; migawki
+    (`snapshot()`) wysyła się w stałym rytmie PROGRESS_REFRESH, a nie po
+    każdej wiadomości, więc GUI nie jest zalewane zdarzeniami.
+    """
+
+    def __init__(self, total_chats):
+        self.total_chats = total_chats
+        self.chats = {}
+        self.notice = None
+        self.started_at = time.monotonic()
+        self._samples = deque()
+
+    def chat(self, index, title):
+        chat = self.chats.get(index)
+        if chat is None:
+            chat = self.chats[index] = ChatProgress(index, title)
+        return chat
+
+    def finish_chat(self, index, title=''):
+        chat = self.chat(index, title)
+        chat.done = True
+        if chat.total is None:
+            chat.total = chat.messages
+
+    def _rates(self, now, messages, bytes_done):
+        self._samples.append((now, messages, bytes_done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+            self._samples.popleft()
+        start_time, start_messages, start_bytes = self._samples[0]
+        elapsed = now - start_time
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (messages - start_messages) / elapsed, (bytes_done - start_bytes) / elapsed
+
+    def snapshot(self):
+        now = time.monotonic()
+        chats = list(self.chats.values())
+        messages = sum(c.exported for c in chats)
+        bytes_done = sum(c.bytes for c in chats)
+        expected_bytes = sum(c.expected_bytes for c in chats)
+        # Prędkość tylko z pracy bieżącego eksportu (bez wcześniej wyeksportowanych wiadomości)
+        messages_per_sec, bytes_per_sec = self._rates(now, sum(c.processed for c in chats), bytes_done)
+        completed = sum(1 for c in chats if c.done)
+
+        # Łączna liczba wiadomości znana dopiero, gdy policzone są wszystkie czaty
+        known = len(chats) == self.total_chats and all(c.total is not None for c in chats)
+        total_messages = sum(c.total for c in chats) if known else None
+        eta = None
+        if total_messages:
+            percent = 100.0 * messages / total_messages
+            if messages_per_sec > 0:
+                eta = (total_messages - messages) / messages_per_sec
+            # Pobieranie mediów może trwać dłużej niż przeglądanie wiadomości
+            if bytes_per_sec > 0 and expected_bytes > bytes_done:
+                eta = max(eta or 0, (expected_bytes - bytes_done) / bytes_per_sec)
+        else:
+            percent = 100.0 * completed / self.total_chats if self.total_chats and completed else None
+
+        active = [(c.title, c.messages, c.total, c.percent)
+                  for c in sorted(chats, key=lambda c: c.index) if c.started and not c.done]
+        return ProgressSnapshot(self.total_chats, completed, active, messages, total_messages,
+                                bytes_done, expected_bytes, messages_per_sec, bytes_per_sec,
+                                percent, eta, now - self.started_at, self.notice)
@@ -0,0 +1,182 @@
+import asyncio
+import random
+
+from telethon.errors import FloodWaitError, ServerError, TimedOutError
+
+# Maksymalna liczba jednoczesnych zapytań do Telegrama
+REQUEST_CONCURRENCY = 4
+# Tempo zapytań (na sekundę): początkowe, minimalne i maksymalne
+INITIAL_RATE = 10.0
+MIN_RATE = 0.5
+MAX_RATE = 30.0
+# Ile zapytań można wysłać naraz po okresie bezczynności
+BURST = 5
+# Ponawianie błędów przejściowych (sieć, błędy serwera)
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+TRANSIENT_ERRORS = (ServerError, TimedOutError, ConnectionError, asyncio.TimeoutError)
+
+
+class TokenBucket:
+    """Kubełek żetonów z regulowanym tempem uzupełniania."""
+
+    def __init__(self, rate, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = None
+
+    def _refill(self, now):
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            self._refill(loop.time())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RequestScheduler:
+    """Warstwa ograniczająca wszystkie zapytania klienta do Telegrama.
+
+    Łączy kubełek żetonów, którego tempo dostosowuje się do FloodWait
+    (połowa po każdej przerwie, powolny wzrost po udanych zapytaniach),
+    limit zapytań w locie, globalną przerwę po `FloodWaitError` oraz
+    wykładnicze ponawianie błędów przejściowych.
+    """
+
+    def __init__(self, max_concurrent=REQUEST_CONCURRENCY, rate=INITIAL_RATE):
+        self.bucket = TokenBucket(rate)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._resume_at = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.flood_seconds = 0
+        # Łączny czas oczekiwania na żeton, koniec przerwy FloodWait i wolny slot
+        self.wait_seconds = 0.0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def flood_wait(self, seconds):
+        """Rejestruje wymuszoną przez serwer przerwę i zwalnia tempo zapytań."""
+        loop = asyncio.get_event_loop()
+        self._resume_at = max(self._resume_at, loop.time() + seconds)
+        self.bucket.rate = max(MIN_RATE, self.bucket.rate / 2)
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        print(f"FloodWait: wstrzymanie zapytań na {seconds} s, tempo {self.bucket.rate:.1f}/s")
+
+    def record_success(self):
+        """Udane zapytanie: powoli zwiększa tempo (wzrost addytywny)."""
+        self.requests += 1
+        self.bucket.rate = min(MAX_RATE, self.bucket.rate + 1 / self.bucket.rate)
+
+    async def wait_for_flood(self):
+        """Czeka, aż minie ostatnia zgłoszona przerwa FloodWait."""
+        loop = asyncio.get_event_loop()
+        while True:
+            delay = self._resume_at - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def throttle(self):
+        """Czeka na koniec przerwy FloodWait i na żeton z kubełka."""
+        await self.wait_for_flood()
+        await self.bucket.acquire()
+
+    async def handle_error(self, error, attempt):
+        """Decyduje o ponowieniu: odczekuje i wraca, albo rzuca błąd dalej."""
+        if isinstance(error, FloodWaitError):
+            self.flood_wait(error.seconds)
+        elif isinstance(error, TRANSIENT_ERRORS) and attempt <= MAX_RETRIES:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"Błąd przejściowy ({error!r}), ponowienie za {delay:.1f} s")
+            await asyncio.sleep(delay)
+        else:
+            raise error
+        self.retries += 1
+
+    def stats(self):
+        """Liczniki do raportu eksportu."""
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'flood_seconds': self.flood_seconds,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'rate': round(self.rate, 2),
+        }
+
+    async def __aenter__(self):
+        start = asyncio.get_event_loop().time()
+        await self.throttle()
+        await self._slots.acquire()
+        self.wait_seconds += asyncio.get_event_loop().time() - start
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._slots.release()
+        return False
+
+    async def call(self, request_factory, hold_slot=True):
+        """Wykonuje zapytanie w ramach budżetu, ponawiając FloodWait i błędy przejściowe.
+
+        Długie operacje (pobieranie plików) przekazują `hold_slot=False`:
+        respektują tempo i przerwy, ale nie blokują slotów na zapytania.
+        """
+        attempt = 0
+        while True:
+            try:
+                if hold_slot:
+                    async with self:
+                        result = await request_factory()
+                else:
+                    await self.throttle()
+                    result = await request_factory()
+                self.record_success()
+                return result
+            except Exception as e:
+                attempt += 1
+                await self.handle_error(e, attempt)
+
+    async def iterate(self, iter_factory, page_size=100, key=lambda item: item.id):
+        """Iteruje wynik Telethona (strona = jedno zapytanie), odtwarzając iterator po błędzie.
+
+        Po ponowieniu pomija elementy, które zostały już zwrócone.
+        """
+        seen = set()
+        attempt = 0
+        while True:
+            stream = iter_factory()
+            received = 0
+            try:
+                while True:
+                    if received % page_size == 0:
+                        async with self:
+                            item = await stream.__anext__()
+                        self.record_success()
+                        attempt = 0
+                    else:
+                        item = await stream.__anext__()
+                    received += 1
+                    item_key = key(item)
+                    if item_key in seen:
+                        continue
+                    seen.add(item_key)
+                    yield item
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                attempt += 1
+                await self.handle_error(e, attempt)
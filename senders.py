@@ -0,0 +1,94 @@
+import json
+import os
+
+# Ile wiadomości tekstowych buforować przed zbiorczym rozwiązaniem nadawców
+SENDER_BATCH = 100
+
+
+class SenderCache:
+    """Cache nazw nadawców (sender_id -> nazwa) na czas eksportu.
+
+    Nazwy są wypełniane z encji, które `iter_messages` zwraca razem
+    z wiadomościami; nieznane identyfikatory rozwiązywane są zbiorczo.
+    Opcjonalnie cache może być zapisywany na dysk między eksportami.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = {}
+        self._dirty = False
+        if path:
+            self.load()
+
+    @staticmethod
+    def display_name(entity):
+        if entity is None:
+            return 'Unknown'
+        return getattr(entity, 'first_name', None) or 'Unknown'
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.names = {int(k): v for k, v in json.load(f).items()}
+        except Exception as e:
+            print(f"Nie udało się wczytać cache nadawców: {e}")
+            self.names = {}
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(k): v for k, v in self.names.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def remember(self, entity, entity_id=None):
+        """Zapamiętuje nazwę encji (bez zapytań do serwera); zmieniona nazwa zastępuje zapisaną."""
+        if entity_id is None:
+            entity_id = getattr(entity, 'id', None)
+        if entity_id is None:
+            return
+        name = self.display_name(entity)
+        if self.names.get(entity_id) != name:
+            self.names[entity_id] = name
+            self._dirty = True
+
+    def seed(self, message):
+        """Wypełnia cache encją nadawcy dołączoną do wiadomości (także nazwy wczytane z dysku)."""
+        if message.sender_id is not None and message.sender is not None:
+            # Klucz to sender_id - dla kanałów różni się od surowego id encji
+            self.remember(message.sender, message.sender_id)
+
+    def name(self, sender_id):
+        if sender_id is None:
+            return 'Unknown'
+        return self.names.get(sender_id, 'Unknown')
+
+    async def resolve(self, client, sender_ids, scheduler=None):
+        """Rozwiązuje nieznane identyfikatory jednym zapytaniem (z fallbackiem)."""
+        missing = [i for i in set(sender_ids) if i is not None and i not in self.names]
+        if not missing:
+            return
+
+        async def get_entity(ids):
+            if scheduler:
+                return await scheduler.call(lambda: client.get_entity(ids))
+            return await client.get_entity(ids)
+
+        try:
+            entities = await get_entity(missing)
+            for sender_id, entity in zip(missing, entities):
+                self.names[sender_id] = self.display_name(entity)
+        except Exception:
+            # Jeden nierozwiązywalny identyfikator psuje całą paczkę - pojedynczo
+            for sender_id in missing:
+                try:
+                    entity = await get_entity(sender_id)
+                except Exception:
+                    entity = None
+                self.names[sender_id] = self.display_name(entity)
+        self._dirty = True
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+
+from dialog_cache import chat_type
+
+# Plik archiwum (wspólny dla wszystkich czatów, w katalogu eksportu)
+ARCHIVE_FILE = 'archive.db'
+# Liczba wiadomości zapisywanych w jednej transakcji
+ARCHIVE_BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS senders (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    pk INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES chats(id),
+    id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    sender_id INTEGER REFERENCES senders(id),
+    text TEXT NOT NULL DEFAULT '',
+    reply_to INTEGER,
+    UNIQUE (chat_id, id)
+);
+CREATE INDEX IF NOT EXISTS messages_chat_date ON messages (chat_id, date);
+CREATE INDEX IF NOT EXISTS messages_sender_date ON messages (sender_id, date);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+CREATE TABLE IF NOT EXISTS media (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, content='messages', content_rowid='pk'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.pk, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.pk, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF text ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.pk, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.pk, new.text);
+END;
+"""
+
+
+class SqliteArchive:
+    """Archiwum wiadomości w SQLite z indeksem pełnotekstowym FTS5.
+
+    Wiadomości buforowane są w pamięci i zapisywane dużymi transakcjami;
+    zapis to upsert po (chat_id, id), więc eksport przyrostowy i ponowne
+    przetworzenie niezatwierdzonych wiadomości niczego nie dublują.
+    """
+
+    def __init__(self, export_dir):
+        os.makedirs(export_dir, exist_ok=True)
+        self.path = os.path.join(export_dir, ARCHIVE_FILE)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite bez FTS5 - archiwum działa, tylko bez wyszukiwania pełnotekstowego
+            print(f"Brak obsługi FTS5 w SQLite: {e}")
+            self.has_fts = False
+        self._messages = []
+        self._senders = {}
+        self._media = []
+
+    def add_chat(self, dialog):
+        with self.db:
+            self.db.execute(
+                "INSERT INTO chats (id, title, type) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title = excluded.title, type = excluded.type",
+                (dialog['id'], dialog['title'], chat_type(dialog))
+            )
+
+    def add(self, record):
+        """Dodaje rekord wiadomości do bufora; zapisuje paczkę po ARCHIVE_BATCH rekordach."""
+        self._messages.append((
+            record['chat_id'], record['id'], int(record['date'].timestamp()),
+            record['sender_id'], record['text'], record['reply_to']
+        ))
+        if record['sender_id'] is not None:
+            self._senders[record['sender_id']] = record['sender']
+        if record['media_path']:
+            self._media.append((record['chat_id'], record['id'], record['media_path']))
+        if len(self._messages) >= ARCHIVE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self._messages:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO senders (id, name) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name",
+                self._senders.items()
+            )
+            self.db.executemany(
+                "INSERT INTO messages (chat_id, id, date, sender_id, text, reply_to) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(chat_id, id) DO UPDATE SET date = excluded.date, sender_id = excluded.sender_id, "
+                "text = excluded.text, reply_to = excluded.reply_to",
+                self._messages
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO media (chat_id, message_id, path) VALUES (?, ?, ?)",
+                self._media
+            )
+        self._messages = []
+        self._senders = {}
+        self._media = []
+
+    def delete(self, chat_id, message_ids):
+        """Usuwa wiadomości (i ich media) z archiwum; indeks FTS aktualizują wyzwalacze."""
+        self.flush()
+        rows = [(chat_id, message_id) for message_id in message_ids]
+        with self.db:
+            self.db.executemany("DELETE FROM messages WHERE chat_id = ? AND id = ?", rows)
+            self.db.executemany("DELETE FROM media WHERE chat_id = ? AND message_id = ?", rows)
+
+    def search(self, query=None, chat_id=None, sender_id=None, since=None, until=None, limit=100):
+        """Wyszukuje wiadomości (FTS5) z filtrami czatu, nadawcy i zakresu dat (datetime)."""
+        sql = ["SELECT m.chat_id, m.id, m.date, s.name, m.text FROM messages m "
+               "LEFT JOIN senders s ON s.id = m.sender_id"]
+        where, params = [], []
+        if query:
+            if self.has_fts:
+                sql.append("JOIN messages_fts f ON f.rowid = m.pk")
+                where.append("messages_fts MATCH ?")
+            else:
+                where.append("m.text LIKE '%' || ? || '%'")
+            params.append(query)
+        for column, value in (('m.chat_id = ?', chat_id), ('m.sender_id = ?', sender_id)):
+            if value is not None:
+                where.append(column)
+                params.append(value)
+        if since is not None:
+            where.append("m.date >= ?")
+            params.append(int(since.timestamp()))
+        if until is not None:
+            where.append("m.date < ?")
+            params.append(int(until.timestamp()))
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY m.date DESC LIMIT ?")
+        params.append(limit)
+        return self.db.execute(" ".join(sql), params).fetchall()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class SqliteArchiveWriter:
+    """Format eksportu zapisujący wiadomości czatu do wspólnego archiwum SQLite."""
+
+    name = 'sqlite'
+
+    def __init__(self, archive, dialog):
+        self.archive = archive
+        self.dialog = dialog
+
+    def can_resume(self, position):
+        # Upsert jest idempotentny - wznowienie nie wymaga pozycji
+        return True
+
+    def open(self, position=None):
+        self.archive.add_chat(self.dialog)
+
+    def write(self, record):
+        self.archive.add(record)
+
+    def edit(self, record):
+        # Upsert po (chat_id, id) nadpisuje treść
+        self.archive.add(record)
+
+    def delete(self, chat_id, message_ids):
+        self.archive.delete(chat_id, message_ids)
+
+    def flush(self):
+        self.archive.flush()
+
+    def position(self):
+        return None
+
+    def close(self):
+        self.archive.flush()
@@ -1,21 +1,103 @@
 import asyncio
 import threading
 import os
-import wx
 from datetime import datetime
 from telethon import TelegramClient as TelethonClient
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError, PhoneNumberInvalidError, FloodWaitError
-from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, DocumentAttributeAudio, DocumentAttributeVideo
+from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError, PhoneNumberInvalidError, FloodWaitError, TakeoutInitDelayError
+from downloads import DOWNLOAD_WORKERS
+from senders import SenderCache
+from history import MEDIA_FILTERS, count_history
+from ratelimit import RequestScheduler
+from media_store import MediaStore
+from sqlite_archive import SqliteArchive
+from dialog_cache import DialogCache, dialog_info
+from participants import ParticipantLoader
+from chat_export import ChatExport, committed_count, deferred_count, safe_title, migrate_chat_dirs
+from download_policy import DownloadPolicy
+from progress import ExportProgress, PROGRESS_REFRESH
+from mirror import Mirror
+from instrumentation import Instrumentation, Profiler, report_path, save_report
+from jobs import JobManager, JOBS_FILE, JOB_CONCURRENCY
 
 # Domyślna ścieżka eksportu
 EXPORT_DIR = os.path.join(os.getcwd(), 'export')
+# Plik z trwałym cache nazw nadawców w katalogu eksportu (opcja 'persist_senders')
+SENDER_CACHE_FILE = '.senders.json'
+# Domyślna liczba czatów eksportowanych jednocześnie (opcja 'parallel_chats')
+CHAT_CONCURRENCY = 3
+# Co ile dialogów odświeżać listę czatów w GUI podczas uzgadniania z serwerem
+DIALOG_UPDATE_EVERY = 100
+# Limit rozmiaru pliku zgłaszany przy otwieraniu sesji Takeout
+TAKEOUT_MAX_FILE_SIZE = 4000 * 1024 * 1024
+
+
+class ExportContext:
+    """Stan współdzielony przez wszystkie czaty jednego eksportu."""
+
+    def __init__(self, client, options, filter_user_id, total_chats, scheduler, export_dir, progress, stats):
+        # Klient używany do eksportu: zwykła sesja albo sesja Takeout
+        self.client = client
+        self.options = options
+        self.filter_user_id = filter_user_id
+        self.total_chats = total_chats
+        self.progress = progress
+        # Czasy etapów i liczniki do raportu eksportu
+        self.stats = stats
+        # Wspólne zasady pobrań dla całego eksportu (kolejność, limity); zapytania idą przez scheduler klienta
+        self.download_workers = options.get('download_workers', DOWNLOAD_WORKERS)
+        self.downloads = DownloadPolicy(options, self.download_workers)
+        self.scheduler = scheduler
+        self.export_dir = export_dir
+        self.senders = SenderCache(os.path.join(export_dir, SENDER_CACHE_FILE) if options.get('persist_senders') else None)
+        # Media pobierane raz do wspólnego magazynu i dowiązywane do katalogów czatów
+        self.media_store = MediaStore(export_dir)
+        # Wspólne archiwum SQLite (opcja 'sqlite')
+        self.sqlite_archive = SqliteArchive(export_dir) if options.get('sqlite') else None
+        # Zdarzenie kończące tryb lustra tego eksportu (opcja 'mirror')
+        self.mirror_stop = None
+
+    def close(self):
+        self.media_store.close()
+        if self.sqlite_archive:
+            self.sqlite_archive.close()
+        try:
+            self.senders.save()
+        except Exception as e:
+            print(f"Nie udało się zapisać cache nadawców: {e}")
+
+
+def call_directly(func, *args):
+    """Domyślne `call_ui`: wywołuje callback od razu, w wątku pętli asyncio."""
+    func(*args)
+
 
 class TelegramExporterClient:
+    """Silnik eksportu niezależny od interfejsu.
+
+    Callbacki `on_*` są wywoływane przez `call_ui` - GUI ustawia tu
+    `wx.CallAfter`, żeby trafiały do wątku okna. Dodatkowi odbiorcy
+    postępu (`add_progress_sink`) dostają zdarzenia eksportu bezpośrednio.
+    """
+
     def __init__(self):
         self.client = None
         self.is_connected = False
         self.user_data = None
         self.dialogs = []
+        # Indeks id -> dialog (zamiast przeszukiwania listy)
+        self.dialogs_by_id = {}
+        self.dialog_cache = DialogCache()
+        # Warstwa ograniczająca tempo wszystkich zapytań (tworzona po połączeniu)
+        self.scheduler = None
+        self.participants = None
+        self.export_dir = EXPORT_DIR
+        # Zdarzenia kończące tryb lustra trwających eksportów (stop_mirror zatrzymuje wszystkie)
+        self._mirror_stops = set()
+        self._members_future = None
+        # Kolejka zadań eksportu (tworzona po zalogowaniu); CLI wyłącza jej zapis na dysku
+        self.jobs = None
+        self.persist_jobs = True
+        self.job_concurrency = JOB_CONCURRENCY
         
         # Callbacks dla GUI
         self.on_connection_error = None
@@ -23,9 +105,14 @@ class TelegramExporterClient:
         self.on_password_requested = None
         self.on_login_success = None
         self.on_dialogs_loaded = None
-        self.on_participants_loaded = None  # Nowy callback
+        self.on_dialogs_synced = None  # lista czatów uzgodniona z serwerem
+        self.on_participants_loaded = None  # (search, strona uczestników, czy koniec)
         self.on_export_progress = None
         self.on_export_finished = None
+        self.on_jobs_changed = None  # lista zadań (słowniki) po każdej zmianie
+        # Sposób wywoływania callbacków (np. wx.CallAfter) i dodatkowi odbiorcy postępu
+        self.call_ui = call_directly
+        self.progress_sinks = []
         
         self.event_loop = None
         self.connection_thread = None
@@ -65,7 +152,7 @@ class TelegramExporterClient:
             )
         except Exception as e:
             if self.on_connection_error:
-                wx.CallAfter(self.on_connection_error, str(e))
+                self.call_ui(self.on_connection_error, str(e))
         finally:
             if self.event_loop:
                 self.event_loop.close()
@@ -74,33 +161,39 @@ class TelegramExporterClient:
         """Główna korutyna logowania."""
         try:
             self.client = TelethonClient(session_file, self._api_id, self._api_hash)
+            # FloodWait obsługuje nasz scheduler (wstrzymuje wszystkie zadania), a nie Telethon
+            self.client.flood_sleep_threshold = 0
+            self.scheduler = RequestScheduler()
+            self.participants = ParticipantLoader(self.client, self.scheduler)
             await self.client.connect()
             
             if not await self.client.is_user_authorized():
                 await self.client.send_code_request(self._phone)
                 
+                # Future musi istnieć, zanim GUI może odpowiedzieć
+                self._code_future = self.event_loop.create_future()
+                
                 # Poproś GUI o kod
                 if self.on_code_requested:
-                    wx.CallAfter(self.on_code_requested)
+                    self.call_ui(self.on_code_requested)
                 
                 # Czekaj na kod z GUI
-                self._code_future = self.event_loop.create_future()
                 code = await self._code_future
                 
                 try:
                     await self.client.sign_in(self._phone, code)
                 except SessionPasswordNeededError:
                     # 2FA
+                    self._password_future = self.event_loop.create_future()
                     if self.on_password_requested:
-                        wx.CallAfter(self.on_password_requested)
+                        self.call_ui(self.on_password_requested)
                     
-                    self._password_future = self.event_loop.create_future()
                     password = await self._password_future
                     
                     await self.client.sign_in(password=password)
             
             # Pobierz dane użytkownika
-            me = await self.client.get_me()
+            me = await self.scheduler.call(self.client.get_me)
             self.user_data = {
                 'id': me.id,
                 'username': me.username or f"{me.first_name} {me.last_name or ''}".strip(),
@@ -109,17 +202,23 @@ class TelegramExporterClient:
             self.is_connected = True
             
             if self.on_login_success:
-                wx.CallAfter(self.on_login_success, self.user_data)
+                self.call_ui(self.on_login_success, self.user_data)
+
+            # Kolejka zadań istnieje od razu (można dodawać zadania), ale rusza po wczytaniu czatów
+            jobs_path = os.path.join(self.export_dir, JOBS_FILE) if self.persist_jobs else None
+            self.jobs = JobManager(self._run_job, jobs_path, self.job_concurrency, on_change=self._emit_jobs)
+            self.jobs.load(self.user_data['id'])
                 
             # Załaduj listę czatów
             await self._load_dialogs()
+            self.jobs.start()
             
             # Utrzymuj połączenie aktywne
             await self.client.run_until_disconnected()
             
         except Exception as e:
             if self.on_connection_error:
-                wx.CallAfter(self.on_connection_error, str(e))
+                self.call_ui(self.on_connection_error, str(e))
             self.is_connected = False
 
     def submit_code(self, code):
@@ -133,156 +232,339 @@ class TelegramExporterClient:
             self.event_loop.call_soon_threadsafe(self._password_future.set_result, password)
 
     async def _load_dialogs(self):
-        """Pobiera listę czatów."""
-        self.dialogs = []
-        async for dialog in self.client.iter_dialogs():
-            self.dialogs.append({
-                'id': dialog.id,
-                'title': dialog.title,
-                'is_group': dialog.is_group,
-                'is_channel': dialog.is_channel,
-                'entity': dialog.entity
-            })
-            
+        """Pokazuje listę czatów z cache, a potem uzgadnia ją z serwerem w tle."""
+        user_id = self.user_data['id']
+        cached = self.dialog_cache.load(user_id)
+        if cached:
+            self._set_dialogs(cached)
+        
+        fresh = []
+        async for dialog in self.scheduler.iterate(self.client.iter_dialogs):
+            fresh.append(dialog_info(dialog))
+            # Co stronę odświeżamy GUI: nowe dane + jeszcze nieuzgodnione pozycje z cache
+            if len(fresh) % DIALOG_UPDATE_EVERY == 0:
+                seen = {d['id'] for d in fresh}
+                self._set_dialogs(fresh + [d for d in cached if d['id'] not in seen])
+        
+        # Pełna lista z serwera (czaty usunięte od ostatniej sesji znikają)
+        self._set_dialogs(fresh)
+        if self.on_dialogs_synced:
+            self.call_ui(self.on_dialogs_synced, fresh)
+        try:
+            self.dialog_cache.save(user_id, fresh)
+        except Exception as e:
+            print(f"Nie udało się zapisać cache czatów: {e}")
+
+    def _set_dialogs(self, dialogs):
+        """Podmienia listę czatów (razem z indeksem id -> dialog) i powiadamia GUI."""
+        self.dialogs = dialogs
+        self.dialogs_by_id = {d['id']: d for d in dialogs}
+        # Callback odczytywany dopiero w wątku GUI - okno główne mogło jeszcze nie istnieć
+        self.call_ui(self._emit_dialogs_loaded, dialogs)
+
+    def _emit_dialogs_loaded(self, dialogs):
         if self.on_dialogs_loaded:
-            wx.CallAfter(self.on_dialogs_loaded, self.dialogs)
+            self.on_dialogs_loaded(dialogs)
 
-    def fetch_chat_members(self, chat_id):
-        """Pobiera uczestników danego czatu."""
-        asyncio.run_coroutine_threadsafe(
-            self._fetch_members_coro(chat_id),
+    def fetch_chat_members(self, chat_id, search=''):
+        """Pobiera uczestników czatu (opcjonalnie wyszukując); przerywa poprzednie wyszukiwanie."""
+        self.cancel_member_fetch()
+        self._members_future = asyncio.run_coroutine_threadsafe(
+            self._fetch_members_coro(chat_id, search),
             self.event_loop
         )
 
-    async def _fetch_members_coro(self, chat_id):
+    def cancel_member_fetch(self):
+        if self._members_future is not None:
+            self._members_future.cancel()
+            self._members_future = None
+
+    async def _fetch_members_coro(self, chat_id, search):
         try:
-            # Znajdź dialog
-            dialog = next((d for d in self.dialogs if d['id'] == chat_id), None)
+            dialog = self.dialogs_by_id.get(chat_id)
             if not dialog:
                 return
 
-            participants = []
-            # Limit do 200, żeby nie muliło przy wielkich grupach
-            async for user in self.client.iter_participants(dialog['entity'], limit=200):
-                if user.deleted: continue
-                name = f"{user.first_name} {user.last_name or ''}".strip()
-                if not name: name = "Bez nazwy"
-                if user.username: name += f" (@{user.username})"
-                participants.append({'id': user.id, 'name': name})
-            
+            # Strony trafiają do GUI od razu, nie po wczytaniu całej listy
+            async for page in self.participants.pages(chat_id, dialog['peer'], search):
+                if self.on_participants_loaded:
+                    self.call_ui(self.on_participants_loaded, search, page, False)
             if self.on_participants_loaded:
-                wx.CallAfter(self.on_participants_loaded, participants)
+                self.call_ui(self.on_participants_loaded, search, [], True)
         except Exception as e:
             print(f"Błąd pobierania uczestników: {e}")
             if self.on_connection_error:
-                wx.CallAfter(self.on_connection_error, f"Nie udało się pobrać uczestników: {str(e)}")
+                self.call_ui(self.on_connection_error, f"Nie udało się pobrać uczestników: {str(e)}")
 
     def start_export(self, selected_chat_ids, export_options, filter_user_id=None):
-        """Uruchamia proces eksportu w tle."""
-        threading.Thread(
-            target=self._run_export_task,
-            args=(selected_chat_ids, export_options, filter_user_id),
-            daemon=True
-        ).start()
+        """Dodaje eksport do kolejki zadań (można wywołać z dowolnego wątku)."""
+        titles = [self.dialogs_by_id[i]['title'] for i in selected_chat_ids if i in self.dialogs_by_id]
+        self.event_loop.call_soon_threadsafe(
+            self.jobs.submit, list(selected_chat_ids), dict(export_options), filter_user_id, titles)
 
-    def _run_export_task(self, selected_chat_ids, options, filter_user_id):
-        """Wrapper wątku dla zadania eksportu."""
-        future = asyncio.run_coroutine_threadsafe(
-            self._export_process(selected_chat_ids, options, filter_user_id),
-            self.event_loop
-        )
+    def pause_job(self, job_id):
+        """Wstrzymuje zadanie: bufory są zapisywane, a punkty kontrolne zatwierdzane."""
+        self.event_loop.call_soon_threadsafe(self.jobs.pause, job_id)
+
+    def resume_job(self, job_id):
+        self.event_loop.call_soon_threadsafe(self.jobs.resume, job_id)
+
+    def cancel_job(self, job_id):
+        """Anuluje zadanie; zapisane dotąd pliki zostają spójne z punktami kontrolnymi."""
+        self.event_loop.call_soon_threadsafe(self.jobs.cancel, job_id)
+
+    def remove_job(self, job_id):
+        self.event_loop.call_soon_threadsafe(self.jobs.remove, job_id)
+
+    def _emit_jobs(self, jobs):
+        # Callback odczytywany dopiero w wątku GUI - okno główne mogło jeszcze nie istnieć
+        self.call_ui(self._deliver_jobs, jobs)
+
+    def _deliver_jobs(self, jobs):
+        if self.on_jobs_changed:
+            self.on_jobs_changed(jobs)
+
+    async def _run_job(self, job):
+        """Wykonuje zadanie z kolejki (JobManager)."""
         try:
-            future.result()
+            await self._export_process(job.chat_ids, job.options, job.filter_user_id, job.export_progress,
+                                       on_mirror=lambda: self.jobs.mirroring(job))
         except Exception as e:
             if self.on_connection_error:
-                wx.CallAfter(self.on_connection_error, f"Błąd eksportu: {e}")
+                self.call_ui(self.on_connection_error, f"Błąd eksportu: {e}")
+            raise
+
+    async def _export_process(self, selected_chat_ids, options, filter_user_id, progress=None, on_mirror=None):
+        """Główna pętla eksportu: kilka czatów naraz pod wspólnym budżetem zapytań.
 
-    async def _export_process(self, selected_chat_ids, options, filter_user_id):
-        """Główna pętla eksportu."""
-        total_chats = len(selected_chat_ids)
+        `on_mirror()` jest wywoływane po eksporcie historii, przed trybem
+        lustra. Zwraca pomiary eksportu (Instrumentation).
+        """
+        # Czaty działają równolegle, więc każdy katalog czatu może mieć tylko jednego piszącego:
+        # katalogi zawierają id czatu (chat_dir_name), a powtórzone id są tu usuwane
+        selected_chat_ids = list(dict.fromkeys(selected_chat_ids))
+        takeout = None
+        progress = progress or ExportProgress(len(selected_chat_ids))
+        stats = Instrumentation()
+        scheduler_start = self.scheduler.stats()
+        profiler = None
+        if options.get('profile'):
+            profiler = Profiler(asyncio.get_event_loop())
+            profiler.start()
+        publisher = asyncio.ensure_future(self._publish_progress(progress))
+        if options.get('takeout'):
+            takeout = await self._start_takeout(selected_chat_ids, options, progress)
+        
+        ctx = ExportContext(takeout or self.client, options, filter_user_id, len(selected_chat_ids), self.scheduler,
+                            self.export_dir, progress, stats)
+        # Katalogi czatów zawierają id; foldery ze starszych eksportów przenoszone są przed startem czatów
+        migrate_chat_dirs(self.export_dir, self.dialogs)
+        chat_slots = asyncio.Semaphore(max(1, options.get('parallel_chats', CHAT_CONCURRENCY)))
+        
+        async def run_chat(index, chat_id):
+            async with chat_slots:
+                try:
+                    with stats.stage('chat'):
+                        await self._export_chat(ctx, index, chat_id)
+                finally:
+                    progress.finish_chat(index)
         
+        success = False
+        if options.get('mirror'):
+            ctx.mirror_stop = asyncio.Event()
+            self._mirror_stops.add(ctx.mirror_stop)
+        counter = asyncio.ensure_future(self._count_totals(ctx, selected_chat_ids))
+        try:
+            try:
+                await asyncio.gather(*(run_chat(index, chat_id) for index, chat_id in enumerate(selected_chat_ids)))
+                await self._download_deferred(ctx, selected_chat_ids)
+                success = True
+            finally:
+                if takeout:
+                    await self._finish_takeout(takeout, success)
+            if options.get('mirror'):
+                # Po eksporcie historii: aktualizacja na bieżąco, już bez sesji Takeout
+                ctx.client = self.client
+                if on_mirror:
+                    on_mirror()
+                await self._run_mirror(ctx, selected_chat_ids)
+        finally:
+            counter.cancel()
+            publisher.cancel()
+            self._mirror_stops.discard(ctx.mirror_stop)
+            ctx.close()
+            try:
+                self._save_report(ctx, scheduler_start, profiler)
+            finally:
+                # Profilowanie i tryb debug pętli wyłączane także wtedy, gdy raportu nie udało się zapisać
+                if profiler:
+                    profiler.stop()
+        
+        self._emit_progress(progress.snapshot())
+        for sink in self.progress_sinks:
+            sink.finished()
+        if self.on_export_finished:
+            self.call_ui(self.on_export_finished)
+        return stats
+
+    def _save_report(self, ctx, scheduler_start, profiler):
+        """Zapisuje raport z pomiarami eksportu (i profil, jeśli włączony) w katalogu eksportu."""
+        scheduler = self.scheduler.stats()
+        for key, value in scheduler_start.items():
+            if key != 'rate':
+                scheduler[key] = round(scheduler[key] - value, 3)
+        snapshot = ctx.progress.snapshot()
+        report = ctx.stats.report(
+            options=ctx.options,
+            chats={'total': snapshot.total_chats, 'completed': snapshot.completed_chats},
+            messages={'exported': snapshot.messages, 'total': snapshot.total_messages},
+            scheduler=scheduler,
+            media_store={'hits': ctx.media_store.hits},
+            downloads={'order': ctx.downloads.order, 'reserved_bytes': ctx.downloads.reserved,
+                       'deferred': ctx.downloads.deferred},
+        )
+        try:
+            path = report_path(ctx.export_dir, 'json')
+            if profiler:
+                profiler.stop()
+                profile_path = os.path.splitext(path)[0] + '.prof'
+                try:
+                    profiler.save(profile_path)
+                    report['profile'] = profile_path
+                except Exception as e:
+                    print(f"Nie udało się zapisać profilu eksportu: {e}")
+            save_report(path, report)
+            print(f"Raport eksportu: {path}")
+        except Exception as e:
+            print(f"Nie udało się zapisać raportu eksportu: {e}")
+
+    async def _download_deferred(self, ctx, selected_chat_ids):
+        """Drugie przejście po eksporcie wszystkich czatów: media odłożone ze względu na rozmiar lub budżet."""
+        dialogs = [self.dialogs_by_id[i] for i in selected_chat_ids if i in self.dialogs_by_id]
+        dialogs = [d for d in dialogs if deferred_count(ctx, d)]
+        for dialog in dialogs:
+            chat = ChatExport(ctx, dialog)
+            ctx.progress.notice = f"Pobieranie odłożonych plików: {chat.title}"
+            chat.open()
+            interrupted = False
+            try:
+                await chat.download_deferred()
+            except asyncio.CancelledError:
+                interrupted = True
+                raise
+            except Exception as e:
+                print(f"Błąd pobierania odłożonych plików czatu {chat.title}: {e}")
+            finally:
+                await chat.close(wait_downloads=not interrupted)
+        if dialogs:
+            ctx.progress.notice = None
+
+    async def _run_mirror(self, ctx, selected_chat_ids):
+        """Tryb lustra dla wybranych czatów, aż do wywołania `stop_mirror()`."""
+        dialogs = [self.dialogs_by_id[i] for i in selected_chat_ids if i in self.dialogs_by_id]
+        mirror = Mirror(self.client, ctx, dialogs,
+                        on_status=lambda message: setattr(ctx.progress, 'notice', message))
+        try:
+            await mirror.start()
+            await ctx.mirror_stop.wait()
+        finally:
+            await mirror.stop()
+
+    def stop_mirror(self):
+        """Kończy tryb lustra wszystkich trwających eksportów (można wywołać z dowolnego wątku)."""
+        if self.event_loop:
+            self.event_loop.call_soon_threadsafe(self._stop_mirrors)
+
+    def _stop_mirrors(self):
+        for mirror_stop in self._mirror_stops:
+            mirror_stop.set()
+
+    async def _count_totals(self, ctx, selected_chat_ids):
+        """Liczy w tle wiadomości do wyeksportowania w każdym czacie (procenty i ETA)."""
         for index, chat_id in enumerate(selected_chat_ids):
-            # Znajdź dialog
-            dialog = next((d for d in self.dialogs if d['id'] == chat_id), None)
+            dialog = self.dialogs_by_id.get(chat_id)
             if not dialog:
                 continue
-                
-            safe_title = "".join([c for c in dialog['title'] if c.isalpha() or c.isdigit() or c==' ']).strip()
-            chat_dir = os.path.join(EXPORT_DIR, safe_title)
-            os.makedirs(chat_dir, exist_ok=True)
-            
-            # Plik tekstowy
-            txt_file_path = os.path.join(chat_dir, 'chat_history.txt')
-            txt_file = open(txt_file_path, 'w', encoding='utf-8') if options.get('text') else None
-            
-            count = 0
-            status_msg = f"Eksportowanie: {safe_title}"
-            if self.on_export_progress:
-                wx.CallAfter(self.on_export_progress, index, total_chats, f"{status_msg}...")
-            
             try:
-                async for message in self.client.iter_messages(dialog['entity']):
-                    # FILTR UCZESTNIKA (Jeśli ustawiony)
-                    if filter_user_id is not None:
-                        if message.sender_id != filter_user_id:
-                            continue
-
-                    # 1. Eksport Tekstu
-                    if options.get('text') and message.text:
-                        sender = await message.get_sender()
-                        sender_name = getattr(sender, 'first_name', 'Unknown') if sender else 'Unknown'
-                        date_str = message.date.strftime('%Y-%m-%d %H:%M:%S')
-                        txt_file.write(f"[{date_str}] {sender_name}: {message.text}\n")
-                    
-                    # 2. Multimedia
-                    file_path = None
-                    download = False
-                    
-                    if message.media:
-                        # Zdjęcia
-                        if options.get('photos') and isinstance(message.media, MessageMediaPhoto):
-                            download = True
-                            media_dir = os.path.join(chat_dir, 'photos')
-                        # Głosówki
-                        elif options.get('voice') and isinstance(message.media, MessageMediaDocument):
-                            if any(isinstance(a, DocumentAttributeAudio) and a.voice for a in message.media.document.attributes):
-                                download = True
-                                media_dir = os.path.join(chat_dir, 'voice')
-                        # Wideo
-                        elif options.get('video') and isinstance(message.media, MessageMediaDocument):
-                             if any(isinstance(a, DocumentAttributeVideo) for a in message.media.document.attributes):
-                                download = True
-                                media_dir = os.path.join(chat_dir, 'videos')
-                        # Inne pliki
-                        elif options.get('files') and isinstance(message.media, MessageMediaDocument):
-                            # Wykluczamy głosówki i wideo jeśli nie są zaznaczone, ale 'files' jest
-                            is_voice = any(isinstance(a, DocumentAttributeAudio) and a.voice for a in message.media.document.attributes)
-                            is_video = any(isinstance(a, DocumentAttributeVideo) for a in message.media.document.attributes)
-                            
-                            if not is_voice and not is_video:
-                                download = True
-                                media_dir = os.path.join(chat_dir, 'files')
-
-                    if download:
-                        os.makedirs(media_dir, exist_ok=True)
-                        try:
-                            await message.download_media(file=media_dir)
-                        except Exception as e:
-                            print(f"Błąd pobierania pliku: {e}")
-                    
-                    count += 1
-                    if count % 20 == 0:
-                         if self.on_export_progress:
-                            wx.CallAfter(self.on_export_progress, index, total_chats, f"{status_msg} ({count} wiadomości)")
-            
+                total = await count_history(ctx.scheduler, ctx.client, dialog['peer'], ctx.options,
+                                            from_user=ctx.filter_user_id)
             except Exception as e:
-                print(f"Błąd podczas przetwarzania czatu {safe_title}: {e}")
-            finally:
-                if txt_file:
-                    txt_file.close()
+                print(f"Nie udało się policzyć wiadomości czatu {dialog['title']}: {e}")
+                continue
+            chat = ctx.progress.chat(index, safe_title(dialog))
+            if not chat.started:
+                chat.baseline = committed_count(ctx, dialog)
+            chat.total = total
+
+    async def _publish_progress(self, progress):
+        """Wysyła migawkę postępu co PROGRESS_REFRESH s (GUI nie jest zalewane zdarzeniami)."""
+        while True:
+            self._emit_progress(progress.snapshot())
+            await asyncio.sleep(PROGRESS_REFRESH)
+
+    async def _start_takeout(self, selected_chat_ids, options, progress):
+        """Otwiera sesję Takeout z zakresem pasującym do eksportu; None, jeśli się nie da."""
+        dialogs = [self.dialogs_by_id[i] for i in selected_chat_ids if i in self.dialogs_by_id]
+        download_media = any(options.get(key) for key in MEDIA_FILTERS)
+        takeout = self.client.takeout(
+            finalize=True,
+            contacts=False,
+            users=any(not d['is_group'] and not d['is_channel'] for d in dialogs),
+            chats=any(d['is_group'] and not d['is_channel'] for d in dialogs),
+            megagroups=any(d['is_group'] and d['is_channel'] for d in dialogs),
+            channels=any(d['is_channel'] and not d['is_group'] for d in dialogs),
+            files=download_media,
+            max_file_size=TAKEOUT_MAX_FILE_SIZE if download_media else None
+        )
+        try:
+            return await takeout.__aenter__()
+        except TakeoutInitDelayError as e:
+            notice = f"Takeout wymaga zatwierdzenia w aplikacji Telegram (dostępny za {e.seconds} s) - eksport w trybie zwykłym"
+        except Exception as e:
+            notice = f"Nie udało się otworzyć sesji Takeout ({e}) - eksport w trybie zwykłym"
+        print(notice)
+        progress.notice = notice
+        return None
+
+    async def _finish_takeout(self, takeout, success):
+        """Zamyka sesję Takeout, zgłaszając serwerowi wynik eksportu."""
+        try:
+            takeout.success = success
+            await takeout.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"Błąd zamykania sesji Takeout: {e}")
+
+    def add_progress_sink(self, sink):
+        """Dodaje odbiorcę postępu: obiekt z metodami `progress(snapshot)` (ProgressSnapshot)
+        i `finished()`, wywoływanymi w wątku pętli asyncio (np. wypisywanie na konsolę)."""
+        self.progress_sinks.append(sink)
+
+    def _emit_progress(self, snapshot):
+        for sink in self.progress_sinks:
+            sink.progress(snapshot)
+        if self.on_export_progress:
+            self.call_ui(self.on_export_progress, snapshot)
+
+    async def _export_chat(self, ctx, index, chat_id):
+        """Eksportuje pojedynczy czat (wznawiając od punktu kontrolnego)."""
+        dialog = self.dialogs_by_id.get(chat_id)
+        if not dialog:
+            return
         
-        if self.on_export_finished:
-            wx.CallAfter(self.on_export_finished)
+        chat = ChatExport(ctx, dialog, ctx.progress.chat(index, safe_title(dialog)))
+        chat.open()
+        interrupted = False
+        try:
+            async for message in chat.history():
+                await chat.add(message)
+        except asyncio.CancelledError:
+            # Zadanie wstrzymane lub anulowane: zapis buforów bez czekania na kolejkę pobrań
+            interrupted = True
+            raise
+        except Exception as e:
+            print(f"Błąd podczas przetwarzania czatu {chat.title}: {e}")
+        finally:
+            await chat.close(wait_downloads=not interrupted)
 
 # Globalna instancja (jak w przykładzie)
 tg_client = TelegramExporterClient()
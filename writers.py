@@ -0,0 +1,300 @@
+import gzip
+import json
+import os
+import struct
+
+from telethon import utils
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, DocumentAttributeFilename
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bufor JSONL: zapis na dysk po przekroczeniu tylu bajtów (lub przy zatwierdzeniu)
+JSONL_FLUSH_BYTES = 256 * 1024
+# Kompresje obsługiwane przez zapis JSONL -> rozszerzenie pliku
+JSONL_COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+# Indeks id wyeksportowanych wiadomości (w katalogu czatu)
+MESSAGE_IDS_FILE = '.message_ids'
+_ID_RECORD = struct.Struct('<q')
+
+
+def _peer_id(peer):
+    return utils.get_peer_id(peer) if peer is not None else None
+
+
+def _forward_info(message):
+    fwd = message.fwd_from
+    if fwd is None:
+        return None
+    return {
+        'from_id': _peer_id(fwd.from_id),
+        'from_name': fwd.from_name,
+        'date': fwd.date,
+        'channel_post': fwd.channel_post,
+    }
+
+
+def _reactions(message):
+    reactions = message.reactions
+    if reactions is None:
+        return []
+    result = []
+    for item in reactions.results:
+        reaction = item.reaction
+        result.append({
+            'reaction': getattr(reaction, 'emoticon', None) or getattr(reaction, 'document_id', None),
+            'count': item.count,
+        })
+    return result
+
+
+def _media_info(message, media_path):
+    media = message.media
+    if media is None:
+        return None
+    info = {
+        'type': type(media).__name__.replace('MessageMedia', '').lower(),
+        'path': media_path,
+    }
+    if isinstance(media, MessageMediaPhoto) and media.photo is not None:
+        info['id'] = media.photo.id
+    elif isinstance(media, MessageMediaDocument) and media.document is not None:
+        document = media.document
+        info['id'] = document.id
+        info['size'] = document.size
+        info['mime_type'] = document.mime_type
+        info['name'] = next((a.file_name for a in document.attributes
+                             if isinstance(a, DocumentAttributeFilename)), None)
+    return info
+
+
+def message_record(chat_id, message, sender_name, media_path=None):
+    """Rekord wiadomości przekazywany do wszystkich formatów eksportu."""
+    return {
+        'chat_id': chat_id,
+        'id': message.id,
+        'date': message.date,
+        'edit_date': message.edit_date,
+        'sender_id': message.sender_id,
+        'sender': sender_name,
+        'text': message.text or '',
+        'reply_to': message.reply_to_msg_id,
+        'fwd_from': _forward_info(message),
+        'via_bot_id': message.via_bot_id,
+        'post_author': message.post_author,
+        'grouped_id': message.grouped_id,
+        'pinned': bool(message.pinned),
+        'views': message.views,
+        'forwards': message.forwards,
+        'reactions': _reactions(message),
+        'media': _media_info(message, media_path),
+        'media_path': media_path,
+    }
+
+
+class TextHistoryWriter:
+    """Zapis historii do `chat_history.txt` (linia na wiadomość z tekstem).
+
+    Edycje (tryb lustra) dopisywane są jako nowe linie z dopiskiem
+    "(edytowano)"; usunięcia nie zmieniają pliku.
+    """
+
+    name = 'text'
+
+    def __init__(self, chat_dir):
+        self.path = os.path.join(chat_dir, 'chat_history.txt')
+        self._file = None
+
+    def can_resume(self, position):
+        """Czy plik pozwala dopisywać od zapisanej pozycji."""
+        return position is not None and os.path.exists(self.path) and os.path.getsize(self.path) >= position
+
+    def open(self, position=None):
+        """Otwiera plik; przy wznowieniu obcina niezatwierdzoną końcówkę i dopisuje."""
+        if position is None:
+            self._file = open(self.path, 'w', encoding='utf-8')
+        else:
+            os.truncate(self.path, position)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        if not record['text']:
+            return
+        date_str = record['date'].strftime('%Y-%m-%d %H:%M:%S')
+        self._file.write(f"[{date_str}] {record['sender']}: {record['text']}\n")
+
+    def edit(self, record):
+        if not record['text']:
+            return
+        date_str = (record['edit_date'] or record['date']).strftime('%Y-%m-%d %H:%M:%S')
+        self._file.write(f"[{date_str}] {record['sender']} (edytowano): {record['text']}\n")
+
+    def delete(self, chat_id, message_ids):
+        pass
+
+    def flush(self):
+        self._file.flush()
+
+    def position(self):
+        return self._file.tell()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def _json_default(value):
+    # Daty jako ISO 8601 (UTC, tak jak zwraca Telegram)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Nieobsługiwany typ w rekordzie: {type(value).__name__}")
+
+
+class JsonLinesWriter:
+    """Strumieniowy zapis `messages.jsonl` - jeden zwarty rekord JSON na wiadomość.
+
+    Schemat rekordu jest stały (te same klucze w każdej linii, `null` gdy
+    brak wartości): chat_id, id, date, edit_date, sender_id, sender, text,
+    reply_to, fwd_from, via_bot_id, post_author, grouped_id, pinned, views,
+    forwards, reactions, media. W trybie lustra edycja dopisuje pełny rekord
+    ponownie (ten sam id, ustawione edit_date; obowiązuje ostatnia linia),
+    a usunięcie dopisuje linię `{"chat_id", "id", "deleted": true}`.
+    Linie trafiają do bufora i są zapisywane
+    paczkami; przy kompresji każda paczka to osobny człon gzip lub ramka
+    zstd, więc plik można przyciąć do zatwierdzonej pozycji i dopisywać.
+    """
+
+    name = 'jsonl'
+
+    def __init__(self, chat_dir, compression=None):
+        if compression not in JSONL_COMPRESSIONS:
+            raise ValueError(f"Nieznana kompresja JSONL: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("Kompresja zstd wymaga pakietu 'zstandard'")
+        self.compression = compression
+        self.path = os.path.join(chat_dir, 'messages.jsonl' + JSONL_COMPRESSIONS[compression])
+        self._file = None
+        self._buffer = []
+        self._buffered = 0
+        self._compressor = zstandard.ZstdCompressor() if compression == 'zstd' else None
+
+    def can_resume(self, position):
+        return position is not None and os.path.exists(self.path) and os.path.getsize(self.path) >= position
+
+    def open(self, position=None):
+        if position is None:
+            self._file = open(self.path, 'wb')
+        else:
+            os.truncate(self.path, position)
+            self._file = open(self.path, 'ab')
+
+    def write(self, record):
+        self._append({key: value for key, value in record.items() if key != 'media_path'})
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        data = (line + '\n').encode('utf-8')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= JSONL_FLUSH_BYTES:
+            self._write_buffer()
+
+    def edit(self, record):
+        self.write(record)
+
+    def delete(self, chat_id, message_ids):
+        for message_id in message_ids:
+            self._append({'chat_id': chat_id, 'id': message_id, 'deleted': True})
+
+    def _write_buffer(self):
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        if self.compression == 'gzip':
+            data = gzip.compress(data)
+        elif self.compression == 'zstd':
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self._buffer = []
+        self._buffered = 0
+
+    def flush(self):
+        self._write_buffer()
+        self._file.flush()
+
+    def position(self):
+        return self._file.tell()
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class MessageIdIndex:
+    """Id wyeksportowanych wiadomości czatu (`.message_ids`, 8 bajtów na wiadomość).
+
+    Wiadomości eksportowane są rosnąco po id, więc plik jest posortowany
+    i `contains` szuka binarnie bez wczytywania go do pamięci. Tryb lustra
+    sprawdza w nim, do którego czatu należy usunięcie bez id czatu (czaty
+    prywatne i zwykłe grupy dzielą numerację wiadomości w obrębie konta).
+    Punkty kontrolne sprzed indeksu nie mają jego pozycji - indeks jest
+    wtedy zakładany od nowa i zawiera tylko wiadomości eksportowane dalej.
+    """
+
+    name = 'ids'
+
+    def __init__(self, chat_dir):
+        self.path = os.path.join(chat_dir, MESSAGE_IDS_FILE)
+        self._file = None
+
+    def can_resume(self, position):
+        return position is None or (os.path.exists(self.path) and os.path.getsize(self.path) >= position)
+
+    def open(self, position=None):
+        if position is None:
+            open(self.path, 'wb').close()
+        else:
+            os.truncate(self.path, position)
+        # Tryb dopisywania: zapis zawsze na końcu, niezależnie od odczytów w `contains`
+        self._file = open(self.path, 'a+b')
+
+    def write(self, record):
+        self._file.write(_ID_RECORD.pack(record['id']))
+
+    def edit(self, record):
+        pass
+
+    def delete(self, chat_id, message_ids):
+        pass
+
+    def contains(self, message_id):
+        self._file.flush()
+        low, high = 0, os.fstat(self._file.fileno()).st_size // _ID_RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            self._file.seek(middle * _ID_RECORD.size)
+            value = _ID_RECORD.unpack(self._file.read(_ID_RECORD.size))[0]
+            if value == message_id:
+                return True
+            if value < message_id:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def flush(self):
+        self._file.flush()
+
+    def position(self):
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None